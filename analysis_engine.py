@@ -1,133 +1,186 @@
 # your_project_folder/analysis_engine.py
+from array import array
 from collections import defaultdict
-from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
+from multiprocessing import shared_memory
+import multiprocessing
 import numpy as np # 用于统计分析 (例如计算均值、标准差)
 import time # 用于计时
+from contestant_table import ContestantTable # 选手解题记录的紧凑 (CSR) 存储
 
 
 def preprocess_data(scoreboard_data, min_user_score=0):
     """
     对从服务器获取的原始计分板数据进行预处理和筛选。
     提取选手解题信息、计算题目罕见度等。
+    数据文件可用 scoreboard_stream.preprocess_file 流式预处理，结果与此函数相同。
 
     参数:
     - scoreboard_data (dict): 原始计分板数据。
     - min_user_score (int): 选手的最低有效总分，低于此分数的选手将被忽略。
 
     返回:
-    - contestant_solves (dict): 处理后的选手数据字典，键为选手ID。
+    - contestant_solves (ContestantTable): 处理后的选手数据，按选手ID可取出与旧版相同形状的字典
+      ('name', 'total_score', 'solved_set', 'solved_sequence', 'solved_timed', 'solved_codes', 'solved_full_info')。
     - challenge_rarity_weights (dict): 题目罕见度权重字典，键为题目ID。
     - all_challenges_info (dict): 所有题目的基本信息字典，键为题目ID。
+      每个题目带有整数编号 'index' (即 ContestantTable 中的题目编号)，'solved_codes' 为整数编号的解题顺序。
+      题目的解题时间索引由 get_challenge_solve_index 按需生成。
     - challenge_solve_counts (dict): 每个题目被解决的次数，键为题目ID。
     """
-    contestant_solves = {} # 存储处理后的选手数据
     if not scoreboard_data or 'items' not in scoreboard_data:
         print("警告: 预处理数据为空或结构不正确。")
         return {}, {}, {}, {}
-
-    # 1. 收集所有题目的解决次数和基本信息
-    challenge_solve_counts = defaultdict(int) # 题目ID -> 解决次数
-    all_challenges_info = {} # 题目ID -> {'title': ..., 'base_score': ..., 'category': ...}
-
-    if 'challenges' in scoreboard_data and isinstance(scoreboard_data['challenges'], dict):
-        for category_name, challenges_in_cat in scoreboard_data['challenges'].items():
-            if isinstance(challenges_in_cat, list):
-                for chall_info_raw in challenges_in_cat:
-                    if isinstance(chall_info_raw, dict) and 'id' in chall_info_raw:
-                        chall_id = chall_info_raw['id']
-                        all_challenges_info[chall_id] = {
-                            'title': chall_info_raw.get('title', f"题目_{chall_id}"),
-                            'base_score': chall_info_raw.get('score', 0), # 题目的基础分值
-                            'category': chall_info_raw.get('category', '未知分类')
-                        }
-                        # 'solved' 字段通常表示有多少队伍/人解出了这道题
-                        challenge_solve_counts[chall_id] = chall_info_raw.get('solved', 0)
-                    else:
-                        print(f"警告: 在分类 '{category_name}' 中发现格式不正确的题目信息: {chall_info_raw}")
+    return preprocess_members(_scoreboard_members(scoreboard_data), min_user_score)
+
+def _scoreboard_members(scoreboard_data):
+    """把计分板字典转换为 preprocess_members 的事件序列 (题目在前，与流式解析的事件格式相同)。"""
+    challenges = scoreboard_data.get('challenges')
+    if isinstance(challenges, dict):
+        for category in challenges.items():
+            yield 'challenge_category', category
+    elif 'challenges' in scoreboard_data:
+        yield 'challenges', challenges
+    for user_data_raw in scoreboard_data.get('items', []):
+        yield 'item', user_data_raw
+
+def _collect_challenge_category(category_name, challenges_in_cat, all_challenges_info, challenge_solve_counts):
+    if isinstance(challenges_in_cat, list):
+        for chall_info_raw in challenges_in_cat:
+            if isinstance(chall_info_raw, dict) and 'id' in chall_info_raw:
+                chall_id = chall_info_raw['id']
+                all_challenges_info[chall_id] = {
+                    'title': chall_info_raw.get('title', f"题目_{chall_id}"),
+                    'base_score': chall_info_raw.get('score', 0), # 题目的基础分值
+                    'category': chall_info_raw.get('category', '未知分类')
+                }
+                # 'solved' 字段通常表示有多少队伍/人解出了这道题
+                challenge_solve_counts[chall_id] = chall_info_raw.get('solved', 0)
             else:
-                 print(f"警告: 分类 '{category_name}' 的题目列表格式不正确: {challenges_in_cat}")
-
+                print(f"警告: 在分类 '{category_name}' 中发现格式不正确的题目信息: {chall_info_raw}")
     else:
-        print("警告: 原始数据中缺少 'challenges' 键或其格式不正确，将尝试从选手提交中推断题目信息。")
+         print(f"警告: 分类 '{category_name}' 的题目列表格式不正确: {challenges_in_cat}")
 
+def _preprocess_user(user_data_raw, min_user_score, seen_challenges):
+    """
+    处理一个选手条目，返回 (选手ID, 名称, 总分, 按时间排序的 [(解题时间, 题目ID, 得分或None), ...])；应跳过时返回 None。
+    题目信息可能出现在选手条目之后 (流式解析时)，因此解出的题目ID按首次出现的顺序记入 seen_challenges
+    (题目ID -> 首次解题记录中的得分)，没有得分的解题记录由 preprocess_members 最后以题目的基础分补全。
+    """
+    if not isinstance(user_data_raw, dict):
+        print(f"警告: 发现格式不正确的用户条目: {user_data_raw}")
+        return None
+
+    user_id = user_data_raw.get('id')
+    user_name = user_data_raw.get('name', f"用户_{user_id}")
+    total_score = user_data_raw.get('score', 0)
+
+    if user_id is None: # 跳过没有ID的用户
+        print(f"警告: 用户 {user_name} 缺少ID，已跳过。")
+        return None
+    if total_score < min_user_score: # 跳过分数过低的选手
+        return None
+
+    solved_challenges_list_for_user = []
+    if isinstance(user_data_raw.get('solvedChallenges'), list):
+        for chall_solve_info in user_data_raw['solvedChallenges']:
+            if not isinstance(chall_solve_info, dict):
+                print(f"警告: 用户 {user_name} (ID: {user_id}) 的解题记录格式不正确: {chall_solve_info}")
+                continue
+
+            challenge_id = chall_solve_info.get('id')
+            solve_time = chall_solve_info.get('time') # 这是毫秒级时间戳
+
+            # 确保题目ID有效且时间有效 (大于0，因为数据中有-62135596800000这样的无效时间)
+            if challenge_id is not None and solve_time is not None and solve_time > 0:
+                # 如果题目信息中没有这个题，最后会以首次解题的得分动态添加（尽管这表示数据可能不一致）
+                seen_challenges.setdefault(challenge_id, chall_solve_info.get('score', 0))
+
+                # 如果 challenge_solve_counts 没有被 'challenges' 部分填充，则可以从这里统计
+                # (但优先使用 'challenges' 部分的 'solved' 字段，因为它更权威)
+                # challenge_solve_counts[challenge_id] += 1
+
+                # 本次解题获得的实际分数 (缺失时使用题目的基础分)
+                solved_challenges_list_for_user.append((solve_time, challenge_id, chall_solve_info.get('score')))
+            else:
+                print(f"警告: 用户 {user_name} 的题目 {challenge_id} 解题时间无效或ID缺失: {solve_time}")
 
-    # 2. 处理每个选手的数据
-    active_user_count = 0
-    for user_data_raw in scoreboard_data.get('items', []):
-        if not isinstance(user_data_raw, dict):
-            print(f"警告: 发现格式不正确的用户条目: {user_data_raw}")
-            continue
+    if not solved_challenges_list_for_user: # 跳过没有有效解题记录的选手
+        return None
 
-        user_id = user_data_raw.get('id')
-        user_name = user_data_raw.get('name', f"用户_{user_id}")
-        total_score = user_data_raw.get('score', 0)
+    # 按解题时间升序排序
+    solved_challenges_list_for_user.sort(key=lambda x: x[0])
+    return user_id, user_name, total_score, solved_challenges_list_for_user
 
-        if user_id is None: # 跳过没有ID的用户
-            print(f"警告: 用户 {user_name} 缺少ID，已跳过。")
-            continue
-        if total_score < min_user_score: # 跳过分数过低的选手
-            continue
+def preprocess_members(members, min_user_score=0):
+    """
+    一遍完成预处理，返回值与 preprocess_data 相同。
+    members 为事件序列 (见 scoreboard_stream.iter_scoreboard_members): ('item', 选手条目)、
+    ('challenge_category', (分类名, 题目列表)) 以及其他顶层键 (忽略)。
+    选手条目处理后即追加到紧凑的数组中，可以立即释放。
+    """
+    # 1. 收集所有题目的解决次数和基本信息
+    challenge_solve_counts = defaultdict(int) # 题目ID -> 解决次数
+    all_challenges_info = {} # 题目ID -> {'title': ..., 'base_score': ..., 'category': ...}
+    seen_challenges = {} # 选手解出的题目ID (按首次出现顺序) -> 首次解题记录中的得分
+    seen_codes = {} # 题目ID -> 临时编号 (题目列表完整后再换成正式编号)
 
-        solved_challenges_list_for_user = []
-        if isinstance(user_data_raw.get('solvedChallenges'), list):
-            for chall_solve_info in user_data_raw['solvedChallenges']:
-                if not isinstance(chall_solve_info, dict):
-                    print(f"警告: 用户 {user_name} (ID: {user_id}) 的解题记录格式不正确: {chall_solve_info}")
+    # 2. 处理每个选手的数据: 解题记录依次追加到数组中，users 记录每位选手的区间
+    users = {} # 选手ID -> (名称, 总分, 起始下标, 结束下标)；重复的选手ID以最后一条为准，位置不变 (与字典赋值相同)
+    solve_codes, solve_times, solve_scores = array('q'), array('d'), array('d')
+    active_user_count = 0
+    has_items = has_challenges = False
+    for key, value in members:
+        if key == 'challenge_category':
+            has_challenges = True
+            _collect_challenge_category(value[0], value[1], all_challenges_info, challenge_solve_counts)
+        elif key in ('item', 'items'):
+            has_items = True
+            for user_data_raw in ([value] if key == 'item' else value):
+                processed = _preprocess_user(user_data_raw, min_user_score, seen_challenges)
+                if processed is None:
                     continue
+                user_id, user_name, total_score, solves = processed
+                start = len(solve_codes)
+                for solve_time, challenge_id, score in solves:
+                    solve_codes.append(seen_codes.setdefault(challenge_id, len(seen_codes)))
+                    solve_times.append(solve_time)
+                    solve_scores.append(np.nan if score is None else score)
+                users[user_id] = (user_name, total_score, start, len(solve_codes))
+                active_user_count += 1
+
+    if not has_items:
+        print("警告: 预处理数据为空或结构不正确。")
+        return {}, {}, {}, {}
+    if not has_challenges:
+        print("警告: 原始数据中缺少 'challenges' 键或其格式不正确，将尝试从选手提交中推断题目信息。")
 
-                challenge_id = chall_solve_info.get('id')
-                solve_time = chall_solve_info.get('time') # 这是毫秒级时间戳
-
-                # 确保题目ID有效且时间有效 (大于0，因为数据中有-62135596800000这样的无效时间)
-                if challenge_id is not None and solve_time is not None and solve_time > 0:
-                    # 如果题目信息中没有这个题，动态添加（尽管这表示数据可能不一致）
-                    if challenge_id not in all_challenges_info:
-                        all_challenges_info[challenge_id] = {
-                            'title': f"题目_{challenge_id} (动态添加)",
-                            'base_score': chall_solve_info.get('score', 0), # 使用解题得分作为基础分
-                            'category': '动态添加'
-                        }
-                        print(f"警告: 题目ID {challenge_id} 未在全局题目列表中找到，已动态添加。")
-
-                    # 如果 challenge_solve_counts 没有被 'challenges' 部分填充，则可以从这里统计
-                    # (但优先使用 'challenges' 部分的 'solved' 字段，因为它更权威)
-                    # challenge_solve_counts[challenge_id] += 1
-
-                    solved_challenges_list_for_user.append({
-                        'id': challenge_id, # 题目ID
-                        'time': solve_time, # 解决时间 (毫秒)
-                        'score_obtained': chall_solve_info.get('score', all_challenges_info[challenge_id]['base_score']) # 本次解题获得的实际分数
-                    })
-                else:
-                    print(f"警告: 用户 {user_name} 的题目 {challenge_id} 解题时间无效或ID缺失: {solve_time}")
-
-        if not solved_challenges_list_for_user: # 跳过没有有效解题记录的选手
-            continue
-
-        # 按解题时间升序排序
-        solved_challenges_list_for_user.sort(key=lambda x: x['time'])
-
-        contestant_solves[user_id] = {
-            'name': user_name,
-            'total_score': total_score,
-            'solved_set': {s['id'] for s in solved_challenges_list_for_user}, # 解出的题目ID集合
-            'solved_sequence': [s['id'] for s in solved_challenges_list_for_user], # 按时间顺序的解题ID列表
-            'solved_timed': {s['id']: s['time'] for s in solved_challenges_list_for_user}, # 题目ID -> 解题时间(毫秒)映射
-            'solved_full_info': solved_challenges_list_for_user # 保留完整的解题信息列表
-        }
-        active_user_count += 1
+    for challenge_id, first_score in seen_challenges.items():
+        if challenge_id not in all_challenges_info:
+            all_challenges_info[challenge_id] = {
+                'title': f"题目_{challenge_id} (动态添加)",
+                'base_score': first_score, # 使用解题得分作为基础分
+                'category': '动态添加'
+            }
+            print(f"警告: 题目ID {challenge_id} 未在全局题目列表中找到，已动态添加。")
 
     print(f"预处理完成，筛选后得到 {active_user_count} 名活跃选手。")
 
+    # 将题目ID映射为从 0 开始的小整数 (即 ContestantTable 中的题目编号)，供整数化的计算使用
+    for chall_code, chall_info in enumerate(all_challenges_info.values()):
+        chall_info['index'] = chall_code
+    contestant_solves = _build_contestant_table(users, all_challenges_info, seen_codes, solve_codes, solve_times, solve_scores)
+
     # 3. 计算题目罕见度权重
     challenge_rarity_weights = {} # 题目ID -> 罕见度权重
     # 如果 challenge_solve_counts 为空 (例如 'challenges' 部分缺失或无效), 重新统计
     if not challenge_solve_counts and active_user_count > 0:
         print("全局题目解决数统计为空，尝试从选手提交中重新统计...")
-        for uid, data in contestant_solves.items():
-            for chall_id in data['solved_set']:
-                challenge_solve_counts[chall_id] += 1
+        distinct, _ = contestant_solves.distinct_solves()
+        counts = np.bincount(contestant_solves.challenges[distinct], minlength=len(contestant_solves.challenge_ids))
+        for chall_code in np.flatnonzero(counts).tolist():
+            challenge_solve_counts[contestant_solves.challenge_ids[chall_code]] += int(counts[chall_code])
 
     if challenge_solve_counts:
         # max_solves = max(challenge_solve_counts.values()) if challenge_solve_counts else 1
@@ -148,6 +201,60 @@ def preprocess_data(scoreboard_data, min_user_score=0):
 
     return contestant_solves, challenge_rarity_weights, all_challenges_info, challenge_solve_counts
 
+def _build_contestant_table(users, all_challenges_info, seen_codes, solve_codes, solve_times, solve_scores):
+    """由 preprocess_members 累积的数组构建 ContestantTable，题目编号换成 all_challenges_info 的 'index'。"""
+    spans = [(start, end) for _, _, start, end in users.values()]
+    lengths = [end - start for start, end in spans]
+    gather = slice(None)
+    if sum(lengths) != len(solve_codes): # 有重复的选手ID: 按选手顺序取出各自 (最后一条) 的区间
+        gather = np.concatenate([np.arange(start, end) for start, end in spans])
+
+    code_map = np.array([all_challenges_info[chall_id]['index'] for chall_id in seen_codes], dtype=np.int32)
+    codes = code_map[np.asarray(solve_codes, dtype=np.int64)[gather]]
+    scores = np.asarray(solve_scores, dtype=np.float64)[gather]
+    missing = np.isnan(scores)
+    if missing.any(): # 没有得分字段的解题记录使用题目的基础分
+        base_scores = np.array([info['base_score'] if isinstance(info['base_score'], (int, float)) else np.nan
+                                for info in all_challenges_info.values()], dtype=np.float64)
+        scores[missing] = base_scores[codes[missing]]
+
+    return ContestantTable(
+        list(users.keys()),
+        [name for name, _, _, _ in users.values()],
+        [total_score for _, total_score, _, _ in users.values()],
+        list(all_challenges_info.keys()),
+        np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+        codes,
+        np.asarray(solve_times, dtype=np.float64)[gather],
+        scores
+    )
+
+
+def build_challenge_solve_index(contestant_data):
+    """
+    建立 题目ID -> 按解题时间升序排列的 [(解题时间毫秒, 选手ID), ...] 索引。
+    """
+    if isinstance(contestant_data, ContestantTable):
+        return contestant_data.solve_index()
+    solve_index = defaultdict(list)
+    for uid, data in contestant_data.items():
+        for chall_id, solve_time_ms in data.get('solved_timed', {}).items():
+            solve_index[chall_id].append((solve_time_ms, uid))
+    for solves in solve_index.values():
+        solves.sort(key=lambda x: x[0])
+    return dict(solve_index)
+
+def get_challenge_solve_index(contestant_data, all_challenges_info):
+    """
+    取出题目信息中的解题时间索引 ('solves_by_time')；没有时根据 contestant_data 现场建立
+    (ContestantTable 按题目编号顺序建立，与 all_challenges_info 的顺序一致)。
+    """
+    indexed = {chall_id: info['solves_by_time'] for chall_id, info in all_challenges_info.items()
+               if isinstance(info, dict) and 'solves_by_time' in info}
+    if indexed:
+        return indexed
+    return build_challenge_solve_index(contestant_data)
+
 
 # --- 相似度计算函数 ---
 def calculate_jaccard_index(set1, set2):
@@ -182,6 +289,96 @@ def calculate_weighted_jaccard_index(set1, set2, weights):
 
     return intersect_weight / union_weight if union_weight != 0 else 0.0
 
+# --- 批量 Jaccard 计算 (选手×题目 关联矩阵) ---
+PAIR_BLOCK_ROWS = 512 # 每次矩阵乘法处理的行数，限制 n×n 中间结果的内存占用
+
+def build_solve_matrix(contestant_data, user_ids, rarity_weights=None):
+    """
+    根据各选手的 solved_set 一次性构建 选手×题目 的 0/1 关联矩阵，
+    供批量计算所有选手对的交集大小和加权交集使用。
+
+    参数:
+    - contestant_data (dict): 预处理后的选手数据。
+    - user_ids (list): 选手ID列表，决定矩阵的行顺序。
+    - rarity_weights (dict): 题目罕见度权重；为空时加权 Jaccard 退化为普通 Jaccard。
+
+    返回:
+    - dict: 包含关联矩阵、行/列索引、每位选手的解题数和加权解题总量。
+    """
+    if isinstance(contestant_data, ContestantTable):
+        # 直接由 CSR 数组填充，不生成每位选手的集合
+        table = contestant_data
+        target_rows = np.full(len(table), -1, dtype=np.int64) # 表中的行 -> 矩阵中的行
+        target_rows[[table.row_of[uid] for uid in user_ids]] = np.arange(len(user_ids))
+        solve_rows = target_rows[table.solve_rows()]
+        selected = solve_rows >= 0
+        solved_codes = np.unique(table.challenges[selected])
+        challenge_ids = sorted((table.challenge_ids[code] for code in solved_codes.tolist()), key=str)
+        challenge_index = {c: k for k, c in enumerate(challenge_ids)}
+        column_of_code = np.zeros(len(table.challenge_ids), dtype=np.int64) # 题目编号 -> 矩阵中的列
+        for code in solved_codes.tolist():
+            column_of_code[code] = challenge_index[table.challenge_ids[code]]
+        matrix = np.zeros((len(user_ids), len(challenge_ids)), dtype=np.float64)
+        matrix[solve_rows[selected], column_of_code[table.challenges[selected]]] = 1.0
+    else:
+        challenge_ids = sorted({c for uid in user_ids for c in contestant_data[uid].get('solved_set', set())}, key=str)
+        challenge_index = {c: k for k, c in enumerate(challenge_ids)}
+
+        matrix = np.zeros((len(user_ids), len(challenge_ids)), dtype=np.float64)
+        for row, uid in enumerate(user_ids):
+            cols = [challenge_index[c] for c in contestant_data[uid].get('solved_set', set())]
+            matrix[row, cols] = 1.0
+
+    weights = None
+    if rarity_weights: # 与 calculate_weighted_jaccard_index 相同，缺失的题目使用默认权重 0.1
+        weights = np.array([rarity_weights.get(c, 0.1) for c in challenge_ids], dtype=np.float64)
+
+    return {
+        'matrix': matrix,
+        'user_index': {uid: row for row, uid in enumerate(user_ids)},
+        'challenge_index': challenge_index,
+        'solved_counts': matrix.sum(axis=1),
+        'weights': weights,
+        'weighted_totals': matrix @ weights if weights is not None else None
+    }
+
+def compute_jaccard_block(solve_matrix, rows, weighted=True):
+    """
+    计算若干行选手与全部选手之间的 Jaccard 和加权 Jaccard 相似度。
+    交集由矩阵乘法得到，并集由 |A| + |B| - |A∩B| 推出，结果与
+    calculate_jaccard_index / calculate_weighted_jaccard_index 一致。
+
+    参数:
+    - solve_matrix (dict): build_solve_matrix 的返回值。
+    - rows (list or slice): 需要计算的行位置。
+    - weighted (bool): 是否同时计算加权 Jaccard。
+
+    返回:
+    - dict: 'intersection' / 'jaccard' / 'weighted_jaccard' 三个 (len(rows) × n) 数组。
+    """
+    matrix = solve_matrix['matrix']
+    block = matrix[rows]
+    counts = solve_matrix['solved_counts']
+
+    intersection = block @ matrix.T
+    union = counts[rows][:, None] + counts[None, :] - intersection
+    both_empty = union == 0 # 两个集合都为空时定义为完全相似
+    jaccard = np.divide(intersection, union, out=np.zeros_like(intersection), where=~both_empty)
+    jaccard[both_empty] = 1.0
+
+    block_result = {'intersection': intersection, 'jaccard': jaccard, 'weighted_jaccard': None}
+    if weighted:
+        if solve_matrix['weights'] is None:
+            block_result['weighted_jaccard'] = jaccard
+        else:
+            totals = solve_matrix['weighted_totals']
+            w_intersection = (block * solve_matrix['weights']) @ matrix.T
+            w_union = totals[rows][:, None] + totals[None, :] - w_intersection
+            weighted_jaccard = np.divide(w_intersection, w_union, out=np.zeros_like(w_intersection), where=w_union != 0)
+            weighted_jaccard[both_empty] = 1.0
+            block_result['weighted_jaccard'] = weighted_jaccard
+    return block_result
+
 def calculate_sequence_similarity(seq1, seq2):
     """使用 difflib.SequenceMatcher 计算两个序列的相似度比率。"""
     if not seq1 and not seq2: return 1.0
@@ -190,6 +387,152 @@ def calculate_sequence_similarity(seq1, seq2):
     matcher = SequenceMatcher(None, seq1, seq2)
     return matcher.ratio() # 返回一个[0,1]的浮点数，表示相似度
 
+# --- 整数化的解题顺序相似度计算 ---
+# "difflib": 与 SequenceMatcher(None, seq1, seq2).ratio() 完全一致 (误差为 0)。
+#            选手的解题序列中每道题只出现一次，此时匹配块只需一次线性扫描即可找到；
+#            序列含重复题目时自动退回 SequenceMatcher。
+# "lcs":     2 * LCS / (len1 + len2)，即精确的最长公共子序列比率。它总是 >= difflib 的结果
+#            (SequenceMatcher 找的是贪心的最长连续匹配块，不是 LCS)，两者并不等价，需要显式选择。
+SEQUENCE_METRICS = ("difflib", "lcs")
+
+def build_sequence_kernel_data(contestant_data, user_ids):
+    """
+    为批量序列相似度计算准备每位选手的整数解题序列、题目位置映射和位置矩阵。
+    优先使用 preprocess_data 生成的 'solved_codes'，缺失时现场编号。
+    """
+    local_codes = {}
+    codes_list = []
+    is_table = isinstance(contestant_data, ContestantTable)
+    for uid in user_ids:
+        if is_table: # 表中的题目编号即 'solved_codes'
+            codes_list.append(contestant_data.solved_codes(contestant_data.row_of[uid]))
+            continue
+        data = contestant_data[uid]
+        codes = data.get('solved_codes')
+        if codes is None:
+            codes = [local_codes.setdefault(chall_id, len(local_codes)) for chall_id in data.get('solved_sequence', [])]
+        codes_list.append(list(codes))
+
+    alphabet_size = max((max(codes) for codes in codes_list if codes), default=-1) + 1
+    position_matrix = np.full((len(user_ids), alphabet_size), -1, dtype=np.int32) # 题目在该选手序列中的位置，-1 表示未解出
+    positions_list = []
+    for row, codes in enumerate(codes_list):
+        positions = {code: pos for pos, code in enumerate(codes)}
+        positions_list.append(positions)
+        position_matrix[row, list(positions.keys())] = list(positions.values())
+
+    return {
+        'codes': codes_list,
+        'positions': positions_list,
+        'distinct': [len(positions) == len(codes) for positions, codes in zip(positions_list, codes_list)],
+        'position_matrix': position_matrix
+    }
+
+def _distinct_sequence_match_size(codes_a, positions_b, len_b):
+    """
+    两个无重复元素的序列上，SequenceMatcher.get_matching_blocks() 匹配块的总长度。
+    与 difflib 相同: 在当前区间内找最长的连续匹配块 (并列时取在 a 中最靠前的)，再对左右两侧递归。
+    """
+    matched = 0
+    pending = [(0, len(codes_a), 0, len_b)]
+    while pending:
+        alo, ahi, blo, bhi = pending.pop()
+        best_i = best_j = best_size = 0
+        run = prev_j = 0
+        for i in range(alo, ahi):
+            j = positions_b.get(codes_a[i], -1)
+            if blo <= j < bhi:
+                run = run + 1 if run and j == prev_j + 1 else 1
+                prev_j = j
+                if run > best_size:
+                    best_i, best_j, best_size = i - run + 1, j - run + 1, run
+            else:
+                run = 0
+        if best_size:
+            matched += best_size
+            if alo < best_i and blo < best_j:
+                pending.append((alo, best_i, blo, best_j))
+            if best_i + best_size < ahi and best_j + best_size < bhi:
+                pending.append((best_i + best_size, ahi, best_j + best_size, bhi))
+    return matched
+
+def _lcs_length(codes_a, codes_b):
+    """最长公共子序列长度 (通用动态规划，用于含重复元素的序列)。"""
+    previous = [0] * (len(codes_b) + 1)
+    for code_a in codes_a:
+        current = [0]
+        for j, code_b in enumerate(codes_b):
+            current.append(previous[j] + 1 if code_a == code_b else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+def _batch_lis_lengths(position_rows):
+    """
+    对每一行 (题目在另一序列中的位置，-1 表示不存在) 计算最长严格递增子序列长度。
+    两个无重复元素序列的 LCS 等于这一 LIS。所有行一起用耐心排序按列推进：
+    每行的 tails 加上行偏移后拼成一个全局有序数组，一次 searchsorted 即可得到各行的插入位置。
+    """
+    n_rows, n_cols = position_rows.shape
+    sentinel = int(position_rows.max(initial=0)) + 1 # 大于任何有效位置
+    row_offsets = np.arange(n_rows, dtype=np.int64) * (sentinel + 1)
+    flat_tails = (np.full((n_rows, n_cols), sentinel, dtype=np.int64) + row_offsets[:, None]).ravel()
+    row_starts = np.arange(n_rows, dtype=np.int64) * n_cols
+    for col in range(n_cols):
+        valid = position_rows[:, col] >= 0
+        keys = position_rows[valid, col] + row_offsets[valid]
+        insert_at = np.searchsorted(flat_tails, keys, side='left')
+        flat_tails[insert_at] = keys
+    return np.sum(flat_tails.reshape(n_rows, n_cols) - row_offsets[:, None] < sentinel, axis=1)
+
+def batch_sequence_similarity(kernel_data, row, cols, metric="difflib", row_is_first=True):
+    """
+    计算一位选手 (row) 与多位选手 (cols) 之间的解题顺序相似度。
+
+    参数:
+    - kernel_data (dict): build_sequence_kernel_data 的返回值。
+    - row (int): 选手在 kernel_data 中的位置。
+    - cols (list): 其他选手的位置。
+    - metric (str): "difflib" 或 "lcs"，见 SEQUENCE_METRICS 的说明。
+    - row_is_first (bool or list): row 选手是否作为 seq1 (difflib 的结果与参数顺序有关)。
+
+    返回:
+    - np.ndarray: 与 cols 对应的相似度。
+    """
+    if metric not in SEQUENCE_METRICS:
+        raise ValueError(f"未知的序列相似度算法: {metric}")
+    codes_list, positions_list, distinct = kernel_data['codes'], kernel_data['positions'], kernel_data['distinct']
+    query_codes = codes_list[row]
+    first_flags = [row_is_first] * len(cols) if isinstance(row_is_first, bool) else list(row_is_first)
+    matched = np.zeros(len(cols), dtype=np.float64)
+    total_lens = np.array([len(query_codes) + len(codes_list[col]) for col in cols], dtype=np.float64)
+
+    pending = range(len(cols))
+    if metric == "lcs" and distinct[row] and query_codes and len(cols):
+        # 查询序列的每道题在其他选手序列中的位置 (len(cols) × len(query))，一次求出所有 LCS
+        position_rows = kernel_data['position_matrix'][np.asarray(cols)][:, query_codes]
+        matched[:] = _batch_lis_lengths(position_rows)
+        pending = [k for k, col in enumerate(cols) if not distinct[col]] # 含重复题目的序列单独计算
+
+    for k in pending:
+        other_codes = codes_list[cols[k]]
+        col = cols[k]
+        if not query_codes or not other_codes:
+            matched[k] = 0
+            continue
+        if metric == "lcs":
+            matched[k] = _lcs_length(query_codes, other_codes)
+        elif distinct[row] and distinct[col]:
+            if first_flags[k]:
+                matched[k] = _distinct_sequence_match_size(query_codes, positions_list[col], len(other_codes))
+            else:
+                matched[k] = _distinct_sequence_match_size(other_codes, positions_list[row], len(query_codes))
+        else:
+            codes_a, codes_b = (query_codes, other_codes) if first_flags[k] else (other_codes, query_codes)
+            matched[k] = sum(block.size for block in SequenceMatcher(None, codes_a, codes_b).get_matching_blocks())
+
+    # 与 calculate_sequence_similarity 相同: 两个序列都为空时为 1.0，只有一个为空时为 0.0
+    return np.divide(2.0 * matched, total_lens, out=np.ones_like(total_lens), where=total_lens > 0)
+
 def get_time_proximity_details(user1_data, user2_data, time_threshold_seconds):
     """
     获取两位选手共同解决的题目中，提交时间在指定阈值内的题目详情。
@@ -219,8 +562,108 @@ def get_time_proximity_details(user1_data, user2_data, time_threshold_seconds):
                 })
     return close_submissions
 
+def find_close_submissions(solve_index, time_threshold_seconds, focus_user_id=None):
+    """
+    在按时间排序的题目解题索引上用滑动窗口找出所有提交时间差不超过阈值的 (选手对, 题目)。
+    耗时只与时间接近的命中数量相关，而不是 选手对数 × 共同解题数。
+
+    参数:
+    - solve_index (dict): 题目ID -> 按时间排序的 [(解题时间毫秒, 选手ID), ...]。
+    - time_threshold_seconds (float): 时间阈值 (秒)，判断规则与 get_time_proximity_details 相同。
+    - focus_user_id: 如果指定，只查找与该选手相关的命中。
+
+    返回:
+    - dict: frozenset({选手A, 选手B}) -> [(题目ID, 选手A, 选手A解题时间, 选手B解题时间), ...]
+    """
+    close_hits = defaultdict(list)
+    for chall_id, solves in solve_index.items():
+        if focus_user_id is not None:
+            focus_time = next((t for t, uid in solves if uid == focus_user_id), None)
+            if focus_time is None:
+                continue
+            for solve_time, uid in solves:
+                if uid != focus_user_id and abs(focus_time - solve_time) / 1000.0 <= time_threshold_seconds:
+                    close_hits[frozenset((focus_user_id, uid))].append((chall_id, focus_user_id, focus_time, solve_time))
+            continue
+
+        window_start = 0
+        for j, (time_j, uid_j) in enumerate(solves):
+            # 左端点右移，直到窗口内所有解题与当前解题的时间差都不超过阈值 (不超过 j: 阈值为负时窗口为空，没有命中)
+            while window_start < j and (time_j - solves[window_start][0]) / 1000.0 > time_threshold_seconds:
+                window_start += 1
+            for time_i, uid_i in solves[window_start:j]:
+                close_hits[frozenset((uid_i, uid_j))].append((chall_id, uid_i, time_i, time_j))
+    return close_hits
+
+def format_close_submissions(pair_hits, user1_id):
+    """
+    将 find_close_submissions 中某一对的命中转换为 get_time_proximity_details 的返回格式，
+    user1 的时间放在 'user1_time_ms'。
+    """
+    close_submissions = []
+    for chall_id, uid_a, time_a_ms, time_b_ms in pair_hits:
+        time1_ms, time2_ms = (time_a_ms, time_b_ms) if uid_a == user1_id else (time_b_ms, time_a_ms)
+        close_submissions.append({
+            'challenge_id': chall_id,
+            'user1_time_ms': time1_ms,
+            'user2_time_ms': time2_ms,
+            'diff_seconds': round(abs(time1_ms - time2_ms) / 1000.0, 2) # 保留两位小数
+        })
+    return close_submissions
+
+def compute_pairwise_time_diff_stats(solve_times_ms):
+    """
+    计算一道题所有解题者两两之间提交时间差 |t_i - t_j| 的精确均值和标准差 (秒)。
+    对解题时间排序后用前缀和求出差值之和与平方和，不生成 O(k^2) 的选手对列表。
+
+    参数:
+    - solve_times_ms (list): 该题所有解题者的解题时间 (毫秒)。
+
+    返回:
+    - dict: {'mean': ..., 'std': ..., 'pair_count': ..., 'sorted_times_ms': ...}；
+      解题人数少于 2 时返回 None。'sorted_times_ms' 供 pairwise_diff_percentile 使用。
+    """
+    sorted_times = sorted(solve_times_ms)
+    k = len(sorted_times)
+    if k < 2:
+        return None
+
+    # 以最早解题时间为基准平移，差值不变且数值更小；整数时间戳下以下运算完全精确
+    base = sorted_times[0]
+    shifted = [t - base for t in sorted_times]
+    pair_count = k * (k - 1) // 2
+
+    # 排序后第 j 个值与其前面 j 个值的差之和为 j*x_j - prefix_j，合并后每个值的系数为 (2j - k + 1)
+    sum_diffs = sum(x * (2 * j - k + 1) for j, x in enumerate(shifted))
+    # 所有选手对差值平方和: sum_{i<j} (x_i - x_j)^2 = k * sum(x^2) - (sum(x))^2
+    sum_sq_diffs = k * sum(x * x for x in shifted) - sum(shifted) ** 2
+
+    mean_ms = sum_diffs / pair_count
+    variance_ms = max(0.0, (sum_sq_diffs * pair_count - sum_diffs * sum_diffs) / (pair_count * pair_count))
+    return {
+        'mean': mean_ms / 1000.0,
+        'std': float(np.sqrt(variance_ms)) / 1000.0,
+        'pair_count': pair_count,
+        'sorted_times_ms': np.asarray(sorted_times)
+    }
+
+def pairwise_diff_percentile(challenge_stats, diff_seconds):
+    """
+    返回 diff_seconds 在该题全部选手对时间差分布中的百分位 (0-100)，
+    即时间差不大于 diff_seconds 的选手对所占比例。
+    只依赖排好序的解题时间，用二分查找计数，复杂度 O(k log k)，不需要保存完整分布。
+    """
+    sorted_times = challenge_stats.get('sorted_times_ms') if challenge_stats else None
+    if sorted_times is None or len(sorted_times) < 2:
+        return None
+    diff_ms = diff_seconds * 1000.0 + 1e-6 # 容忍秒/毫秒换算带来的浮点误差
+    # 对每个 i，统计排在其后且时间不晚于 t_i + diff 的解题者数量
+    upper = np.searchsorted(sorted_times, sorted_times + diff_ms, side='right')
+    pairs_within = int(np.sum(upper - np.arange(1, len(sorted_times) + 1)))
+    return 100.0 * pairs_within / challenge_stats['pair_count']
+
 # 修改 analyze_submission_time_diff_distribution 函数，使其接收预计算的统计数据
-def analyze_submission_time_diff_distribution(user1_data, user2_data, challenge_id, challenge_stats):
+def analyze_submission_time_diff_distribution(user1_data, user2_data, challenge_id, challenge_stats, include_percentile=False):
     """
     分析特定选手对 (user1, user2) 在特定题目 (challenge_id) 上的提交时间差，
     与该题目的预计算时间差分布统计量 (均值、标准差) 进行比较。
@@ -230,6 +673,7 @@ def analyze_submission_time_diff_distribution(user1_data, user2_data, challenge_
     - user1_data, user2_data: 选手数据字典。
     - challenge_id: 题目ID。
     - challenge_stats: 包含该题目预计算统计量 {'mean': ..., 'std': ...} 的字典。
+    - include_percentile: 是否附带该时间差在全部选手对中的百分位 (需要 challenge_stats 含 'sorted_times_ms')。
 
     返回:
     - 包含Z-score等统计信息的字典，或包含错误/信息消息的字典。
@@ -267,7 +711,7 @@ def analyze_submission_time_diff_distribution(user1_data, user2_data, challenge_
         z_score = (pair_actual_diff_seconds - mean_diff_seconds) / std_diff_seconds
 
     # Z-score 越小（特别是负值），说明这对选手的提交时间差远小于平均水平，可能更“可疑”
-    return {
+    dist_result = {
         'challenge_id': challenge_id,
         # 'title': all_challenges_info.get(challenge_id, {}).get('title', f"题目_{challenge_id}"), # 题目名称将在调用处添加
         'pair_diff_seconds': round(pair_actual_diff_seconds, 2),
@@ -275,9 +719,717 @@ def analyze_submission_time_diff_distribution(user1_data, user2_data, challenge_
         'std_diff_seconds_all_pairs': round(std_diff_seconds, 2),
         'z_score': round(z_score, 3) if z_score is not None else "N/A"
     }
+    if include_percentile:
+        percentile = pairwise_diff_percentile(challenge_stats, pair_actual_diff_seconds)
+        dist_result['diff_percentile'] = round(percentile, 2) if percentile is not None else "N/A"
+    return dist_result
+
+
+DETAIL_LEVELS = ("full", "summary") # full: 每对附带时间线等详情；summary: 只保留标量分数，详情由 compute_pair_details 按需计算
+
+def compute_challenge_time_stats(solve_index, challenge_ids):
+    """
+    预计算每个题目在所有解决者之间的时间差统计量 (用于Z-score)。
+    只有解决人数 >= 3 且标准差不接近零的题目才有统计量。
+    """
+    challenge_time_stats = {} # 存储每个题目的 { 'mean': ..., 'std': ..., 'pair_count': ..., 'sorted_times_ms': ... }
+    for chall_id in challenge_ids:
+        # 只有解决人数 >= 3 (即至少 3 个选手对时间差) 才计算统计量
+        solves = solve_index.get(chall_id, [])
+        if len(solves) >= 3:
+            stats = compute_pairwise_time_diff_stats([solve_time_ms for solve_time_ms, _ in solves])
+            # 只有标准差不接近零时才存储统计量，避免后续Z-score计算问题
+            if stats and stats['std'] >= 1e-9:
+                challenge_time_stats[chall_id] = stats
+    return challenge_time_stats
+
+# --- 分阶段计时 ---
+# run_analysis / run_incremental_analysis 的结果带有 'timings' (阶段 -> 秒)。逐对循环中单独计时的是
+# PAIR_LOOP_STAGES 中的方法 (Jaccard 行块、解题顺序的批量计算、逐对 Z-score)，循环的其余开销计入 'pair_scoring'；
+# 并行执行时这些阶段为所有工作进程耗时之和，'pair_loop' 为实际经过的时间。
+PAIR_LOOP_STAGES = ("jaccard", "sequence", "time_diff_dist")
+
+def _add_time(timings, stage, start):
+    """把从 start (time.perf_counter() 的值) 到现在的耗时计入 timings[stage]，返回当前时刻。"""
+    now = time.perf_counter()
+    timings[stage] += now - start
+    return now
+
+def _collect_timings(context, pair_timings, pair_loop_seconds, extra_timings):
+    """合并准备阶段、逐对循环和 extra_timings 的耗时 (保留 4 位小数)。"""
+    timings = defaultdict(float, context['timings'])
+    for stage, seconds in extra_timings.items():
+        timings[stage] += seconds
+    for stage in PAIR_LOOP_STAGES:
+        if stage in pair_timings: # 未使用的方法不出现在结果中
+            timings[stage] += pair_timings[stage]
+    timings['pair_scoring'] = max(0.0, pair_timings.get('pair_loop', 0.0) - sum(pair_timings.get(stage, 0.0) for stage in PAIR_LOOP_STAGES))
+    timings['pair_loop'] = pair_loop_seconds
+    return {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+# 逐对计算用到的选手数据字段 (ContestantTable 在分析期间只生成这些视图)
+PAIR_RECORD_FIELDS = ('name', 'total_score', 'solved_set', 'solved_sequence', 'solved_timed')
+
+def _prepare_analysis_context(contestant_data, rarity_weights, all_challenges_info, analysis_params):
+    """
+    构建一次分析所需的全局数据: 选手顺序、题目时间差统计量、时间接近命中、关联矩阵和序列数据。
+    串行执行和多进程分片执行共用这一步，结果中不含任何逐对计算的内容。
+    如果指定的目标用户不存在，返回的字典中带有 'error'。
+    """
+    methods = analysis_params.get("methods", [])
+    user_ids = list(contestant_data.keys())
+    timings = defaultdict(float) # 准备阶段各步骤的耗时
+    started = time.perf_counter()
+    contestant_table = None
+    if isinstance(contestant_data, ContestantTable):
+        contestant_table = contestant_data
+        user_name_to_id = dict(zip(contestant_table.names, contestant_table.user_ids))
+        # 逐对计算需要频繁查询解题集合和时间，本次分析期间生成这些视图，分析结束后即释放
+        contestant_data = contestant_table.to_dict(PAIR_RECORD_FIELDS)
+    else:
+        user_name_to_id = {data['name']: uid for uid, data in contestant_data.items() if 'name' in data}
+    started = _add_time(timings, 'record_views', started)
+
+    context = {
+        'contestant_data': contestant_data,
+        'contestant_table': contestant_table,
+        'all_challenges_info': all_challenges_info,
+        'analysis_params': analysis_params,
+        'methods': methods,
+        'user_ids': user_ids,
+        'target_uid': None,
+        'threshold_sec': analysis_params.get("time_proximity_seconds", 300),
+        'min_common_solves': int(analysis_params.get("min_common_solves", 1) or 0),
+        'sequence_metric': analysis_params.get("sequence_metric", "difflib"),
+        'detail_level': analysis_params.get("detail_level", "full"),
+        'timings': timings,
+        'pair_timings': defaultdict(float) # 逐对循环中的耗时 (见 _analyze_rows)
+    }
+    if context['detail_level'] not in DETAIL_LEVELS:
+        raise ValueError(f"未知的结果详细程度: {context['detail_level']}")
+    edge_policy(analysis_params) # 边选择策略无效时在开始计算之前报错
+
+    target_name = analysis_params.get("target_username")
+    if target_name:
+        if target_name not in user_name_to_id:
+            context['error'] = f"目标用户 '{target_name}' 未在活跃选手中找到。"
+            return context
+        context['target_uid'] = user_name_to_id[target_name]
+
+    # 题目 -> 按时间排序的解题记录 (preprocess_data 中已建立)
+    solve_index = get_challenge_solve_index(contestant_table or contestant_data, all_challenges_info)
+    started = _add_time(timings, 'solve_index', started)
+
+    # --- 优化步骤：预计算每个题目在所有解决者之间的时间差统计量 (用于Z-score) ---
+    challenge_time_stats = {}
+    if "time_diff_dist" in methods:
+        print("正在预计算每个题目在所有解决者之间的时间差统计量 (用于Z-score)...")
+        challenge_time_stats = compute_challenge_time_stats(solve_index, all_challenges_info.keys())
+        print("题目时间差统计量预计算完成。")
+        started = _add_time(timings, 'time_diff_stats', started)
+    context['challenge_time_stats'] = challenge_time_stats
+    # --- 优化步骤结束 ---
+
+    # 时间接近性: 在题目解题索引上一次扫描得到所有接近的 (选手对, 题目)
+    context['close_hits'] = {}
+    if "time_proximity" in methods:
+        context['close_hits'] = find_close_submissions(solve_index, context['threshold_sec'], focus_user_id=context['target_uid'])
+        started = _add_time(timings, 'time_proximity', started)
+
+    # 构建 选手×题目 关联矩阵，Jaccard 类分数按行块批量计算。
+    # 矩阵的每一列即 题目 -> 解题者 的倒排索引，行块乘积同时给出每对的共同解题数，
+    # 共同解题数低于 min_common_solves 的选手对不会成为候选 (它们在各方法上几乎都只能得 0 分)
+    source = contestant_table or contestant_data
+    context['solve_matrix'] = build_solve_matrix(source, user_ids, rarity_weights)
+    started = _add_time(timings, 'solve_matrix', started)
+    context['sequence_kernel_data'] = None
+    if "sequence" in methods:
+        context['sequence_kernel_data'] = build_sequence_kernel_data(source, user_ids)
+        _add_time(timings, 'sequence', started)
+    return context
+
+def _iter_candidate_pairs(context, row_positions, pair_stats, on_row_done=None):
+    """
+    按行块批量计算 Jaccard 并筛选候选对，逐对产出 (uid1, uid2, 该对的批量分数)。
+    每处理完一行调用 on_row_done(本行覆盖的选手对数，含被跳过的对)。
+    """
+    user_ids = context['user_ids']
+    methods = context['methods']
+    target_mode = context['target_uid'] is not None
+    sequence_kernel_data = context['sequence_kernel_data']
+    pair_timings = context['pair_timings']
+
+    for block_start in range(0, len(row_positions), PAIR_BLOCK_ROWS):
+        block_rows = row_positions[block_start:block_start + PAIR_BLOCK_ROWS]
+        started = time.perf_counter()
+        jaccard_block = compute_jaccard_block(context['solve_matrix'], block_rows, weighted="weighted_jaccard" in methods)
+        _add_time(pair_timings, 'jaccard', started)
+        weighted_block = jaccard_block['weighted_jaccard']
+        for offset, row in enumerate(block_rows):
+            if target_mode:
+                other_positions = np.delete(np.arange(len(user_ids)), row)
+            else:
+                other_positions = np.arange(row + 1, len(user_ids))
+            candidate_positions = other_positions[jaccard_block['intersection'][offset, other_positions] >= context['min_common_solves']]
+            pair_stats['candidate_pairs'] += len(candidate_positions)
+            pair_stats['skipped_pairs'] += len(other_positions) - len(candidate_positions)
+
+            candidate_list = candidate_positions.tolist()
+            ordered_pairs = []
+            for col in candidate_list:
+                uid_a, uid_b = user_ids[row], user_ids[col]
+                if target_mode:
+                    uid_a, uid_b = sorted((uid_a, uid_b)) # 确保对的顺序一致
+                ordered_pairs.append((uid_a, uid_b))
+
+            sequence_scores = None
+            if sequence_kernel_data is not None:
+                # 当前行选手与所有候选选手的解题顺序相似度一次算出 (序列顺序与 (uid1, uid2) 一致)
+                started = time.perf_counter()
+                sequence_scores = batch_sequence_similarity(
+                    sequence_kernel_data, row, candidate_list, context['sequence_metric'],
+                    row_is_first=[uid_a == user_ids[row] for uid_a, _ in ordered_pairs]
+                )
+                _add_time(pair_timings, 'sequence', started)
+
+            for k, col in enumerate(candidate_list):
+                uid_a, uid_b = ordered_pairs[k]
+                yield uid_a, uid_b, {
+                    'jaccard': float(jaccard_block['jaccard'][offset, col]),
+                    'weighted_jaccard': float(weighted_block[offset, col]) if weighted_block is not None else None,
+                    'sequence': float(sequence_scores[k]) if sequence_scores is not None else None
+                }
+
+            if on_row_done:
+                on_row_done(len(other_positions))
+
+def _score_pair(context, uid1, uid2, batch_scores, previous=None, changed_challenges=None):
+    """
+    计算一对选手的全部指标和综合得分。
+    detail_level 为 "summary" 时只保留标量分数 (时间接近计数、显著 Z-score 题数)，不生成各类详情列表。
+    增量分析时 previous 为上一次该对的结果 (两位选手的解题记录都没有变化)，
+    时间接近性结果直接沿用，Z-score 只重算 changed_challenges 中统计量变化的题目。
+
+    返回:
+    - (pair_scores_summary, network_edge)；综合得分低于 min_similarity_threshold 时 network_edge 为 None。
+      选手数据缺失时返回 (None, None)。
+    """
+    contestant_data = context['contestant_data']
+    all_challenges_info = context['all_challenges_info']
+    analysis_params = context['analysis_params']
+    methods = context['methods']
+    summary_only = context['detail_level'] == "summary"
+
+    data1 = contestant_data.get(uid1) # 使用 .get() 避免 KeyError
+    data2 = contestant_data.get(uid2)
+
+    if not data1 or not data2: # 如果某个用户数据缺失，跳过这对
+        print(f"警告 (run_analysis): 用户数据缺失，跳过对 {uid1}-{uid2}")
+        return None, None
+
+    name1, name2 = data1.get('name', f"User_{uid1}"), data2.get('name', f"User_{uid2}")
+
+    pair_scores_summary = {'pair_names': (name1, name2), 'pair_ids': (uid1, uid2)}
+    combined_score_factors_weighted = []
+    common_challenge_ids_for_pair = data1.get('solved_set', set()).intersection(data2.get('solved_set', set())) # 提取共同解题一次
+    # 增量分析中先后顺序不变、共同解题的统计量也都没有变化时，Z-score 详情和时间线整体沿用
+    same_orientation = previous is not None and list(previous['pair_ids']) == [uid1, uid2]
+    reuse_previous_details = same_orientation and changed_challenges.isdisjoint(common_challenge_ids_for_pair)
+
+    # a. Jaccard 相似度 (由关联矩阵批量计算，与 calculate_jaccard_index 结果一致)
+    if "jaccard" in methods:
+        j_score = batch_scores['jaccard']
+        pair_scores_summary['jaccard'] = round(j_score, 3)
+        combined_score_factors_weighted.append((j_score, 1.0))
+
+    # b. 加权 Jaccard 相似度 (与 calculate_weighted_jaccard_index 结果一致)
+    if "weighted_jaccard" in methods:
+         wj_score = batch_scores['weighted_jaccard']
+         pair_scores_summary['weighted_jaccard'] = round(wj_score, 3)
+         combined_score_factors_weighted.append((wj_score, 1.5))
+
+    # c. 解题顺序相似度
+    if "sequence" in methods:
+        seq_score = batch_scores['sequence'] # 整数化序列批量计算，默认与 calculate_sequence_similarity 一致
+        pair_scores_summary['sequence_similarity'] = round(seq_score, 3)
+        combined_score_factors_weighted.append((seq_score, 1.2))
+
+    # d. 提交时间接近性分析
+    if "time_proximity" in methods and summary_only:
+        if previous is not None:
+            close_count = previous['time_proximity']['count']
+        else:
+            close_count = len(context['close_hits'].get(frozenset((uid1, uid2)), []))
+        pair_scores_summary['time_proximity'] = {'count': close_count, 'threshold_seconds': context['threshold_sec']}
+    elif "time_proximity" in methods:
+        if previous is not None:
+            close_subs_details = previous['time_proximity']['details']
+            if list(previous['pair_ids']) != [uid1, uid2]: # 上次两人的先后顺序相反
+                close_subs_details = [
+                    dict(detail, user1_time_ms=detail['user2_time_ms'], user2_time_ms=detail['user1_time_ms'])
+                    for detail in close_subs_details
+                ]
+        else:
+            close_subs_details = format_close_submissions(context['close_hits'].get(frozenset((uid1, uid2)), []), uid1)
+        pair_scores_summary['time_proximity'] = {
+            'count': len(close_subs_details),
+            'threshold_seconds': context['threshold_sec'],
+            'details': close_subs_details
+        }
+    if "time_proximity" in methods:
+        close_count = pair_scores_summary['time_proximity']['count']
+        # 启发式评分: 接近提交数 / (共同解题数 / 2) (至少1)
+        if common_challenge_ids_for_pair: # 使用前面提取的共同题目列表
+             time_prox_heuristic_score = min(1.0, close_count / (max(1, len(common_challenge_ids_for_pair) / 2.0)))
+             combined_score_factors_weighted.append((time_prox_heuristic_score, 1.8))
+        elif close_count > 0 :
+             # 如果没有共同解题（不应该发生，因为close_subs_details基于共同题目），
+             # 但时间接近详情里有东西，可能数据有误或逻辑问题，给一个基础分
+             combined_score_factors_weighted.append((0.5, 1.8))
+
+
+    # e. 提交时间差分布分析 (Z-score)
+    z_started = time.perf_counter() if "time_diff_dist" in methods else None
+    if "time_diff_dist" in methods and summary_only:
+        if reuse_previous_details:
+            significant_z_score_count = previous['significant_z_score_count']
+        else:
+            significant_z_score_count = _significant_z_score_count(context, data1, data2, common_challenge_ids_for_pair)
+        pair_scores_summary['significant_z_score_count'] = significant_z_score_count
+    elif "time_diff_dist" in methods:
+        if reuse_previous_details:
+            dist_analysis_results_for_pair = previous['time_distribution_analysis']
+            significant_z_score_count = sum(
+                1 for item in dist_analysis_results_for_pair
+                if isinstance(item.get('z_score'), (int, float)) and item['z_score'] < -1.5
+            )
+        else:
+            previous_items = None
+            if previous is not None:
+                previous_items = {item['challenge_id']: item for item in previous.get('time_distribution_analysis', [])}
+            dist_analysis_results_for_pair, significant_z_score_count = _time_distribution_for_pair(
+                context, data1, data2, common_challenge_ids_for_pair, previous_items, changed_challenges
+            )
+        pair_scores_summary['time_distribution_analysis'] = dist_analysis_results_for_pair
+    if "time_diff_dist" in methods:
+        # 启发式评分：显著负 Z-score 题数 / (共同解题数 / 2) (至少1)
+        if common_challenge_ids_for_pair: # 使用前面提取的共同题目列表
+             z_score_heuristic_score = min(1.0, significant_z_score_count / (max(1, len(common_challenge_ids_for_pair) / 2.0)))
+             combined_score_factors_weighted.append((z_score_heuristic_score, 1.3)) # 给予一个权重
+        _add_time(context['pair_timings'], 'time_diff_dist', z_started)
+
+    # 为“详情”准备共同解题时间线数据 (摘要模式下由 compute_pair_details 按需生成)
+    if summary_only:
+        pass
+    elif reuse_previous_details:
+        pair_scores_summary['common_challenge_timeline_data'] = previous['common_challenge_timeline_data']
+    elif same_orientation:
+        # 时间线本身不变，只替换统计量变化的题目的 Z-score 信息
+        z_items_by_id = {item['challenge_id']: item for item in pair_scores_summary.get('time_distribution_analysis', [])}
+        pair_scores_summary['common_challenge_timeline_data'] = [
+            dict(entry, z_score_details=z_items_by_id.get(entry['id'])) if entry['id'] in changed_challenges else entry
+            for entry in previous['common_challenge_timeline_data']
+        ]
+    else:
+        pair_scores_summary['common_challenge_timeline_data'] = _common_challenge_timeline(
+            context, data1, data2, common_challenge_ids_for_pair, pair_scores_summary.get('time_distribution_analysis', [])
+        )
+
+    network_edge = _finalize_pair_scores(pair_scores_summary, combined_score_factors_weighted, analysis_params)
+    return pair_scores_summary, network_edge
+
+def _significant_z_score_count(context, data1, data2, common_challenge_ids):
+    """
+    只统计显著负 Z-score (< -1.5) 的题目数量，不生成详情字典。
+    判断方式与 analyze_submission_time_diff_distribution 相同 (Z-score 先保留 3 位小数再比较)。
+    """
+    challenge_time_stats = context['challenge_time_stats']
+    times1, times2 = data1['solved_timed'], data2['solved_timed']
+    significant_z_score_count = 0
+    for chall_id in common_challenge_ids:
+        stats = challenge_time_stats.get(chall_id)
+        if stats:
+            z_score = (abs(times1[chall_id] - times2[chall_id]) / 1000.0 - stats['mean']) / stats['std']
+            if round(z_score, 3) < -1.5:
+                significant_z_score_count += 1
+    return significant_z_score_count
+
+def _time_distribution_for_pair(context, data1, data2, common_challenge_ids, previous_items=None, changed_challenges=None, include_percentile=False):
+    """
+    计算一对选手在共同解题上的 Z-score 详情。
+    如果给出 previous_items (题目ID -> 上次的结果) 和 changed_challenges，
+    统计量未变化的题目直接沿用上次的结果。
+
+    返回:
+    - (详情列表, 显著负 Z-score 的题目数量)
+    """
+    dist_analysis_results_for_pair = []
+    significant_z_score_count = 0 # 计算显著负 Z-score 的题目数量
+
+    # 遍历共同解题，使用预计算的统计量
+    for chall_id_z in common_challenge_ids:
+        if previous_items is not None and chall_id_z not in changed_challenges:
+            dist_res_item = previous_items.get(chall_id_z)
+        else:
+            # 获取预计算的统计量，只对有有效预计算统计量的题目进行 Z-score 计算
+            stats_for_this_challenge = context['challenge_time_stats'].get(chall_id_z)
+            dist_res_item = None
+            if stats_for_this_challenge:
+                dist_res_item = analyze_submission_time_diff_distribution(
+                    data1, data2, chall_id_z, stats_for_this_challenge, include_percentile
+                )
+                if dist_res_item: # analyze_submission_time_diff_distribution 返回None或字典
+                    # 添加题目名称到结果中
+                    dist_res_item['title'] = context['all_challenges_info'].get(chall_id_z, {}).get('title', f"题目_{chall_id_z}")
+
+        if dist_res_item:
+            dist_analysis_results_for_pair.append(dist_res_item)
+            # 判断Z-score是否显著小于平均水平
+            if 'z_score' in dist_res_item and isinstance(dist_res_item['z_score'], (int, float)):
+                if dist_res_item['z_score'] < -1.5: # 使用 -1.5 作为显著阈值
+                    significant_z_score_count +=1
+    return dist_analysis_results_for_pair, significant_z_score_count
+
+def _common_challenge_timeline(context, data1, data2, common_challenge_ids, z_score_items):
+    """组织一对选手共同解题的时间线数据 (按 user1 的解题时间排序)，附带每题的 Z-score 信息。"""
+    all_challenges_info = context['all_challenges_info']
+    name1 = data1.get('name', "User_1")
+    name2 = data2.get('name', "User_2")
+    current_pair_timeline_data = []
+    z_score_items_by_id = {}
+    for item in z_score_items:
+        z_score_items_by_id.setdefault(item.get('challenge_id'), item) # 与按顺序查找第一个匹配项的结果一致
+
+    for chall_id_tl in common_challenge_ids: # 使用前面提取的共同题目列表
+        # 查找当前题目的Z-score信息
+        z_score_info_for_this_chall = z_score_items_by_id.get(chall_id_tl)
+
+        # 确保获取到有效的解题时间，尽管preprocess_data应该已经筛选了
+        time1_ms_tl = data1.get('solved_timed', {}).get(chall_id_tl)
+        time2_ms_tl = data2.get('solved_timed', {}).get(chall_id_tl)
+
+        if time1_ms_tl is not None and time2_ms_tl is not None:
+             current_pair_timeline_data.append({
+                'id': chall_id_tl,
+                'title': all_challenges_info.get(chall_id_tl, {}).get('title', f'题目_{chall_id_tl}'),
+                'user1_name': name1,
+                'user1_time_ms': time1_ms_tl,
+                'user2_name': name2,
+                'user2_time_ms': time2_ms_tl,
+                'z_score_details': z_score_info_for_this_chall # 加入Z-score信息
+             })
+
+    # 按user1的解题时间排序
+    current_pair_timeline_data.sort(key=lambda x: x.get('user1_time_ms', float('inf'))) # 使用get并提供默认值处理可能的None
+    return current_pair_timeline_data
+
+def _finalize_pair_scores(pair_scores_summary, combined_score_factors_weighted, analysis_params):
+    """
+    根据各方法的 (得分, 权重) 计算综合得分并写入 pair_scores_summary。
+
+    返回:
+    - 关系图的边；综合得分低于 min_similarity_threshold 或边选择策略不是 "threshold" 时为 None。
+    """
+    # 计算综合得分 - 这里使用了硬编码的权重，可以根据需要调整
+    total_weighted_score = sum(score * weight for score, weight in combined_score_factors_weighted)
+    total_weights = sum(weight for _, weight in combined_score_factors_weighted)
+    overall_similarity_heuristic = total_weighted_score / total_weights if total_weights > 0 else 0.0
+    pair_scores_summary['overall_similarity_heuristic'] = round(overall_similarity_heuristic, 3)
+
+    # 添加到关系图的边数据中 - 根据整体相似度阈值筛选 (其他边选择策略在循环结束后统一选择，见 select_network_edges)
+    if (analysis_params.get("edge_policy") or "threshold") != "threshold":
+        return None
+    if overall_similarity_heuristic < analysis_params.get("min_similarity_threshold", 0.0):
+        return None
+    return _network_edge(pair_scores_summary)
+
+def _network_edge(pair_scores_summary):
+    name1, name2 = pair_scores_summary['pair_names']
+    return {
+        'source': name1,
+        'target': name2,
+        'weight': pair_scores_summary['overall_similarity_heuristic'],
+        'metrics_summary': {
+            'j': pair_scores_summary.get('jaccard', 'N/A'),
+            'wj': pair_scores_summary.get('weighted_jaccard', 'N/A'),
+            's': pair_scores_summary.get('sequence_similarity', 'N/A'),
+            'tp_c': pair_scores_summary.get('time_proximity', {}).get('count', 'N/A')
+        }
+    }
 
 
-def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_params):
+# --- 关系图的边的稀疏化 ---
+# threshold: 综合得分不低于 min_similarity_threshold 的选手对都是边 (默认；阈值为 0 时边数为 O(n²))；
+# knn: 每位选手只保留综合得分最高的 edge_top_k 条边 (任一端点保留即保留)，
+#      另外保留综合得分不低于 edge_keep_above 的边 (为 None 时不保留额外的边)；
+# backbone: 视差过滤 (Serrano 等, 2009): 边的权重占某个端点总权重的比例在该端点的度下显著
+#      (alpha_ij = (1 - p_ij)^(k_i - 1) < edge_backbone_alpha) 时保留，同样另外保留 edge_keep_above 以上的边。
+# 后两种策略在逐对循环中不生成边 (不会先构造全部边的列表)，循环结束后对全部选手对的综合得分用数组运算选择，
+# 比较使用保留 3 位小数的综合得分；min_similarity_threshold 仍是边的下限。
+EDGE_POLICIES = ("threshold", "knn", "backbone")
+DEFAULT_EDGE_TOP_K = 10
+DEFAULT_BACKBONE_ALPHA = 0.05
+
+def edge_policy(analysis_params):
+    """规范化的边选择策略及其参数 (键与分析参数相同)；策略未知或参数超出范围时抛出 ValueError。"""
+    policy = analysis_params.get("edge_policy") or "threshold"
+    if policy not in EDGE_POLICIES:
+        raise ValueError(f"未知的边选择策略: {policy}，可选: {', '.join(EDGE_POLICIES)}")
+    settings = {'edge_policy': policy, 'min_similarity_threshold': float(analysis_params.get("min_similarity_threshold", 0.0) or 0.0)}
+    if policy == "knn":
+        top_k = analysis_params.get("edge_top_k")
+        settings['edge_top_k'] = DEFAULT_EDGE_TOP_K if top_k is None else int(top_k)
+        if settings['edge_top_k'] < 1:
+            raise ValueError(f"edge_top_k 必须是正整数: {top_k}")
+    elif policy == "backbone":
+        alpha = analysis_params.get("edge_backbone_alpha")
+        settings['edge_backbone_alpha'] = DEFAULT_BACKBONE_ALPHA if alpha is None else float(alpha)
+        if not 0 < settings['edge_backbone_alpha'] < 1:
+            raise ValueError(f"edge_backbone_alpha 必须在 (0, 1) 之间: {alpha}")
+    if policy != "threshold":
+        keep_above = analysis_params.get("edge_keep_above")
+        settings['edge_keep_above'] = None if keep_above is None else float(keep_above)
+    return settings
+
+def _top_k_edges_per_node(ends, weights, n_nodes, k):
+    """每个节点权重最高的 k 条边 (并列时按边的顺序) 的并集，返回布尔掩码。"""
+    n_edges = len(weights)
+    nodes = np.concatenate((ends[:, 0], ends[:, 1]))
+    edge_ids = np.concatenate((np.arange(n_edges), np.arange(n_edges)))
+    order = np.lexsort((edge_ids, -np.concatenate((weights, weights)), nodes))
+    sorted_nodes = nodes[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_nodes, sorted_nodes, side='left') # 在该节点的边中的名次
+    selected = np.zeros(n_edges, dtype=bool)
+    selected[edge_ids[order][rank < k]] = True
+    return selected
+
+def _disparity_backbone(ends, weights, n_nodes, alpha):
+    """视差过滤: 对任一端点显著的边 (只有一条边的节点保留这条边)，返回布尔掩码。"""
+    strength = np.bincount(ends[:, 0], weights, n_nodes) + np.bincount(ends[:, 1], weights, n_nodes)
+    degree = np.bincount(ends[:, 0], minlength=n_nodes) + np.bincount(ends[:, 1], minlength=n_nodes)
+    selected = np.zeros(len(weights), dtype=bool)
+    for end in (ends[:, 0], ends[:, 1]):
+        share = np.divide(weights, strength[end], out=np.zeros(len(weights)), where=strength[end] > 0)
+        selected |= (degree[end] <= 1) | ((1.0 - share) ** (degree[end] - 1) < alpha)
+    return selected
+
+def select_network_edges(similar_pairs, analysis_params):
+    """
+    按 analysis_params 的边选择策略 (knn / backbone) 从全部选手对中选择关系图的边。
+
+    返回:
+    - (network_edges, edge_selection): edge_selection 为规范化的策略参数，另带 'candidate_edges'
+      (不低于 min_similarity_threshold 的选手对数) 和 'edges' (保留的边数)。
+    """
+    settings = edge_policy(analysis_params)
+    weights = np.fromiter((pair['overall_similarity_heuristic'] for pair in similar_pairs), dtype=np.float64, count=len(similar_pairs))
+    node_index = {}
+    ends = np.fromiter((node_index.setdefault(uid, len(node_index)) for pair in similar_pairs for uid in pair['pair_ids']),
+                       dtype=np.int64, count=2 * len(similar_pairs)).reshape(-1, 2)
+    candidates = np.flatnonzero(weights >= settings['min_similarity_threshold'])
+    keep = np.zeros(len(similar_pairs), dtype=bool)
+    if settings.get('edge_keep_above') is not None:
+        keep[candidates[weights[candidates] >= settings['edge_keep_above']]] = True
+    if settings['edge_policy'] == "knn":
+        keep[candidates[_top_k_edges_per_node(ends[candidates], weights[candidates], len(node_index), settings['edge_top_k'])]] = True
+    elif settings['edge_policy'] == "backbone":
+        keep[candidates[_disparity_backbone(ends[candidates], weights[candidates], len(node_index), settings['edge_backbone_alpha'])]] = True
+    network_edges = [_network_edge(similar_pairs[k]) for k in np.flatnonzero(keep).tolist()]
+    return network_edges, dict(settings, candidate_edges=int(len(candidates)), edges=len(network_edges))
+
+def _apply_edge_policy(results, analysis_params, stage_timings):
+    """逐对循环结束后: threshold 以外的策略在此选择边；结果中记录 'edge_selection'。"""
+    started = time.perf_counter()
+    if edge_policy(analysis_params)['edge_policy'] == "threshold":
+        results['edge_selection'] = dict(edge_policy(analysis_params), candidate_edges=len(results['network_edges']),
+                                         edges=len(results['network_edges']))
+    else:
+        results['network_edges'], results['edge_selection'] = select_network_edges(results['similar_pairs'], analysis_params)
+        stage_timings['edge_selection'] = time.perf_counter() - started
+
+def _analyze_rows(context, row_positions, on_row_done=None):
+    """
+    分析以 row_positions 中各选手为第一位的所有候选选手对。
+
+    返回:
+    - (similar_pairs, network_edges, pair_stats)，顺序与选手行顺序一致；pair_stats['timings'] 为逐对循环中各阶段的耗时。
+    """
+    similar_pairs, network_edges = [], []
+    pair_stats = {'candidate_pairs': 0, 'skipped_pairs': 0}
+    context['pair_timings'] = defaultdict(float) # 工作进程中的上下文会执行多个分片，每次单独计时
+    started = time.perf_counter()
+    for uid1, uid2, batch_scores in _iter_candidate_pairs(context, row_positions, pair_stats, on_row_done):
+        pair_scores_summary, network_edge = _score_pair(context, uid1, uid2, batch_scores)
+        if pair_scores_summary is None:
+            continue
+        similar_pairs.append(pair_scores_summary)
+        if network_edge is not None:
+            network_edges.append(network_edge)
+    _add_time(context['pair_timings'], 'pair_loop', started)
+    pair_stats['timings'] = dict(context['pair_timings'])
+    return similar_pairs, network_edges, pair_stats
+
+
+# --- 多进程分片执行 ---
+# 选手数据以 CSR 形式 (每位选手的解题偏移、题目编号、解题时间) 写入一块共享内存，
+# 工作进程启动时从中重建选手数据和分析上下文，每个任务只传递分片的行范围。
+PARALLEL_MIN_PAIRS = 20000 # 选手对数少于此值时多进程的启动开销得不偿失，直接串行执行
+DEFAULT_SHARD_ROWS = 64 # 默认每个分片包含的选手行数
+
+_worker_context = None # 工作进程内的分析上下文 (由 _init_shard_worker 建立)
+
+def _pack_contestant_data(contestant_data, user_ids):
+    """
+    将选手数据压缩为 CSR 数组并写入共享内存。
+
+    返回:
+    - (shared_memory, layout)；layout 只包含数组形状、名字和选手/题目的元信息，用于传给工作进程。
+    contestant_data 为 ContestantTable (行顺序与 user_ids 相同) 时直接复制它的数组。
+    """
+    if isinstance(contestant_data, ContestantTable) and contestant_data.user_ids == list(user_ids):
+        challenge_ids = contestant_data.challenge_ids
+        arrays = {
+            'offsets': contestant_data.offsets,
+            'codes': contestant_data.challenges,
+            'times': contestant_data.times
+        }
+    else:
+        challenge_codes = {}
+        offsets = [0]
+        codes, times = [], []
+        for uid in user_ids:
+            data = contestant_data[uid]
+            for chall_id in data.get('solved_sequence', []):
+                codes.append(challenge_codes.setdefault(chall_id, len(challenge_codes)))
+                times.append(data['solved_timed'][chall_id])
+            offsets.append(len(codes))
+        challenge_ids = list(challenge_codes.keys())
+
+        time_dtype = np.int64 if all(isinstance(t, (int, np.integer)) for t in times) else np.float64
+        arrays = {
+            'offsets': np.asarray(offsets, dtype=np.int64),
+            'codes': np.asarray(codes, dtype=np.int32),
+            'times': np.asarray(times, dtype=time_dtype)
+        }
+    total_bytes = sum(arr.nbytes for arr in arrays.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total_bytes))
+
+    layout = {'shm_name': shm.name, 'arrays': {}, 'challenge_ids': challenge_ids,
+              'user_ids': user_ids,
+              'names': [contestant_data[uid].get('name', f"User_{uid}") for uid in user_ids],
+              'total_scores': [contestant_data[uid].get('total_score', 0) for uid in user_ids]}
+    position = 0
+    for key, arr in arrays.items():
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=position)[:] = arr
+        layout['arrays'][key] = (position, arr.shape, arr.dtype.str)
+        position += arr.nbytes
+    return shm, layout
+
+def _unpack_contestant_data(layout):
+    """从共享内存重建 run_analysis 需要的选手数据字典。"""
+    shm = shared_memory.SharedMemory(name=layout['shm_name'])
+    try:
+        arrays = {key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=position).copy()
+                  for key, (position, shape, dtype) in layout['arrays'].items()}
+    finally:
+        shm.close()
+
+    challenge_ids = layout['challenge_ids']
+    offsets, codes, times = arrays['offsets'], arrays['codes'].tolist(), arrays['times'].tolist()
+    contestant_data = {}
+    for row, uid in enumerate(layout['user_ids']):
+        start, end = offsets[row], offsets[row + 1]
+        sequence = [challenge_ids[code] for code in codes[start:end]]
+        contestant_data[uid] = {
+            'name': layout['names'][row],
+            'total_score': layout['total_scores'][row],
+            'solved_set': set(sequence),
+            'solved_sequence': sequence,
+            'solved_timed': dict(zip(sequence, times[start:end]))
+        }
+    return contestant_data
+
+def _init_shard_worker(layout, rarity_weights, all_challenges_info, analysis_params):
+    """工作进程初始化: 从共享内存读取选手数据并建立分析上下文 (每个进程只执行一次)。"""
+    global _worker_context
+    contestant_data = _unpack_contestant_data(layout)
+    # 父进程传来的题目信息不含 'solves_by_time'，在这里按相同的题目顺序重建，保证结果顺序与串行一致
+    for chall_id, solves in build_challenge_solve_index(contestant_data).items():
+        all_challenges_info.setdefault(chall_id, {})['solves_by_time'] = solves
+    _worker_context = _prepare_analysis_context(contestant_data, rarity_weights, all_challenges_info, analysis_params)
+
+def _run_shard(row_positions):
+    """工作进程中执行一个分片。"""
+    return _analyze_rows(_worker_context, row_positions)
+
+def _analyze_rows_parallel(context, rarity_weights, row_positions, workers, shard_rows, on_shard_done=None):
+    """
+    将行分成若干分片在进程池中执行，按分片顺序合并结果，保证与串行执行的顺序一致。
+    on_shard_done(分片的行列表) 在每个分片合并后调用；它抛出异常时取消尚未开始的分片并向上抛出。
+    """
+    # 每行的选手对数随行号递减，行号交错分配会打乱顺序，因此使用连续的行范围作为分片
+    shards = [row_positions[i:i + shard_rows] for i in range(0, len(row_positions), shard_rows)]
+    # 题目解题索引可由共享内存中的选手数据重建，不随初始化参数传递
+    all_challenges_info = {chall_id: {k: v for k, v in info.items() if k != 'solves_by_time'}
+                           for chall_id, info in context['all_challenges_info'].items()}
+
+    similar_pairs, network_edges = [], []
+    pair_stats = {'candidate_pairs': 0, 'skipped_pairs': 0, 'timings': defaultdict(float)}
+    shm, layout = _pack_contestant_data(context['contestant_table'] or context['contestant_data'], context['user_ids'])
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_shard_worker,
+            initargs=(layout, rarity_weights, all_challenges_info, context['analysis_params'])
+        ) as executor:
+            try:
+                for shard_no, (shard_pairs, shard_edges, shard_stats) in enumerate(executor.map(_run_shard, shards), start=1):
+                    similar_pairs.extend(shard_pairs)
+                    network_edges.extend(shard_edges)
+                    pair_stats['candidate_pairs'] += shard_stats['candidate_pairs']
+                    pair_stats['skipped_pairs'] += shard_stats['skipped_pairs']
+                    for stage, seconds in shard_stats['timings'].items():
+                        pair_stats['timings'][stage] += seconds
+                    if shard_no % max(1, len(shards) // 10) == 0 or shard_no == len(shards):
+                        print(f"  已完成 {shard_no}/{len(shards)} 个分片...")
+                    if on_shard_done:
+                        on_shard_done(shards[shard_no - 1])
+            except BaseException:
+                # 否则退出 with 时会等待所有已提交的分片执行完
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+    finally:
+        shm.close()
+        shm.unlink()
+    return similar_pairs, network_edges, pair_stats
+
+
+def _build_network_nodes(contestant_data):
+    """准备关系图的节点数据 (每位活跃选手一个节点)。"""
+    print("正在准备网络图节点数据...")
+    network_nodes = []
+    if isinstance(contestant_data, ContestantTable):
+        for row, uid in enumerate(contestant_data.user_ids):
+            network_nodes.append({
+                'id': contestant_data.names[row],
+                'user_id_internal': uid,
+                'score': contestant_data.total_scores[row],
+                'solved_count': contestant_data.solved_count(row)
+            })
+        print(f"已准备 {len(network_nodes)} 个节点。")
+        return network_nodes
+    for uid, data in contestant_data.items():
+        network_nodes.append({
+            'id': data.get('name', f"User_{uid}"), # Cytoscape 使用 id 作为唯一标识
+            'user_id_internal': uid, # 保留内部ID
+            'score': data.get('total_score', 0),
+            'solved_count': len(data.get('solved_set', set()))
+        })
+    print(f"已准备 {len(network_nodes)} 个节点。")
+    return network_nodes
+
+def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_params, progress_callback=None):
     """
     主分析函数，根据指定的参数对选手数据进行多维度相似性分析。
 
@@ -289,10 +1441,23 @@ def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_
         - "methods": list, 需要执行的分析方法列表。
         - "time_proximity_seconds": int, 时间接近性判断的阈值 (秒)。
         - "min_similarity_threshold": float, 用于筛选关系图边的最小综合相似度。
+        - "edge_policy": str, 关系图的边选择策略，"threshold" (默认)、"knn" 或 "backbone" (见 EDGE_POLICIES 上方的说明)；
+          "edge_top_k" (knn，默认 DEFAULT_EDGE_TOP_K)、"edge_backbone_alpha" (backbone，默认 DEFAULT_BACKBONE_ALPHA)、
+          "edge_keep_above" (两者都适用，默认 None) 为策略的参数。
         - "target_username": str or None, 如果指定，则只分析与该用户相关的选手对。
+        - "min_common_solves": int, 至少有多少道共同解题的选手对才会被计算 (默认 1；0 表示计算所有对)。
+        - "sequence_metric": str, 解题顺序相似度算法，"difflib" (默认，与 SequenceMatcher 一致) 或 "lcs"。
+        - "parallel_workers": int, 进程数 (默认 1，即串行，不超过 CPU 核数)；大于 1 时按行分片并行计算。
+        - "parallel_shard_rows": int, 每个分片包含的选手行数 (默认 DEFAULT_SHARD_ROWS)。
+        - "detail_level": str, "full" (默认，每对附带时间线、Z-score 和接近提交列表) 或 "summary"
+          (只保留标量分数，Z-score 以 'significant_z_score_count' 给出；详情用 compute_pair_details 按需计算)。
+    - progress_callback (callable or None): 每处理完一行选手 (并行时每个分片) 调用
+      progress_callback(已处理的选手对数, 总对数)；回调抛出的异常 (如任务被取消) 会中止分析并向上抛出。
 
     返回:
-    - results (dict): 包含分析结果的字典，如相似选手对列表、网络图节点和边等。
+    - results (dict): 包含分析结果的字典，如相似选手对列表、网络图节点和边等，
+      以及 'pair_stats' (总对数、计算的候选对数、跳过的对数)、'edge_selection' (边选择策略、候选边数和保留的边数)
+      和 'timings' (各阶段耗时，秒)。
     """
     start_time = time.time() # 开始计时
     print("分析引擎启动...") # 添加启动日志
@@ -307,261 +1472,90 @@ def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_
         print("警告 (run_analysis): 传入的 contestant_data 为空。无法进行分析。")
         return results
 
-    user_ids = list(contestant_data.keys())
-    user_name_to_id = {data['name']: uid for uid, data in contestant_data.items() if 'name' in data}
-
     # 1. 准备关系图的节点数据
-    print("正在准备网络图节点数据...")
-    for uid, data in contestant_data.items():
-        results['network_nodes'].append({
-            'id': data.get('name', f"User_{uid}"), # Cytoscape 使用 id 作为唯一标识
-            'user_id_internal': uid, # 保留内部ID
-            'score': data.get('total_score', 0),
-            'solved_count': len(data.get('solved_set', set()))
-        })
-    print(f"已准备 {len(results['network_nodes'])} 个节点。")
-
-
-    # --- 优化步骤：预计算每个题目在所有解决者之间的时间差统计量 (用于Z-score) ---
-    challenge_time_stats = {} # 存储每个题目的 { 'mean': ..., 'std': ... }
-    if "time_diff_dist" in analysis_params.get("methods", []):
-        print("正在预计算每个题目在所有解决者之间的时间差统计量 (用于Z-score)...")
-        all_challenge_ids = all_challenges_info.keys()
-        processed_challenge_count = 0
-        for chall_id in all_challenge_ids:
-            processed_challenge_count += 1
-            # if processed_challenge_count % 50 == 0 or processed_challenge_count == len(all_challenge_ids):
-            #     print(f"  已处理 {processed_challenge_count}/{len(all_challenge_ids)} 个题目统计量...") # 可选进度
-
-            # 收集所有解决了此题的选手ID
-            user_ids_solved_this_chall = [
-                uid for uid, data in contestant_data.items()
-                if chall_id in data.get('solved_timed', {}) # 使用 .get() 防止 solved_timed 键不存在
-            ]
-
-            # 只有解决人数 >= 3 且有时间数据才计算统计量
-            if len(user_ids_solved_this_chall) >= 3:
-                all_time_diffs_for_chall_seconds = []
-                # 计算所有解出此题的选手对之间的提交时间差 (秒)
-                for pair_combo_ids in combinations(user_ids_solved_this_chall, 2):
-                    uid_a, uid_b = pair_combo_ids
-                    # 再次使用 .get() 确保时间数据存在
-                    time_a_ms = contestant_data[uid_a]['solved_timed'].get(chall_id)
-                    time_b_ms = contestant_data[uid_b]['solved_timed'].get(chall_id)
-                    if time_a_ms is not None and time_b_ms is not None:
-                         all_time_diffs_for_chall_seconds.append(abs(time_a_ms - time_b_ms) / 1000.0)
-
-                # 确保有足够的时间差数据点来计算标准差
-                if len(all_time_diffs_for_chall_seconds) >= 2: # 至少需要2个差值数据点 (即至少3人解出)
-                     mean_diff_seconds = np.mean(all_time_diffs_for_chall_seconds)
-                     std_diff_seconds = np.std(all_time_diffs_for_chall_seconds)
-                     # 只有标准差不接近零时才存储统计量，避免后续Z-score计算问题
-                     if std_diff_seconds >= 1e-9:
-                        challenge_time_stats[chall_id] = {
-                            'mean': mean_diff_seconds,
-                            'std': std_diff_seconds
-                        }
-        print("题目时间差统计量预计算完成。")
-    # --- 优化步骤结束 ---
-
-
-    # 2. 确定要比较的选手对
-    user_pairs_to_compare = []
-    if analysis_params.get("target_username"): # 如果指定了目标用户
-        target_name = analysis_params["target_username"]
-        if target_name not in user_name_to_id:
-            print(f"警告 (run_analysis): 目标用户 '{target_name}' 未在活跃选手中找到。")
-            results['error'] = f"目标用户 '{target_name}' 未在活跃选手中找到。"
-            return results
-
-        target_uid = user_name_to_id[target_name]
-        for uid_other in user_ids:
-            # 确保不与自己比较，并且只比较目标用户与其他人 (避免重复，sorted tuple handled below)
-            if uid_other != target_uid:
-                 user_pairs_to_compare.append(tuple(sorted((target_uid, uid_other)))) # 确保对的顺序一致
+    started = time.perf_counter()
+    results['network_nodes'] = _build_network_nodes(contestant_data)
+    stage_timings = {'network_nodes': time.perf_counter() - started}
+
+    # 2. 准备全局数据并确定要比较的选手对
+    context = _prepare_analysis_context(contestant_data, rarity_weights, all_challenges_info, analysis_params)
+    if 'error' in context:
+        print(f"警告 (run_analysis): {context['error']}")
+        results['error'] = context['error']
+        return results
 
-        user_pairs_to_compare = list(set(user_pairs_to_compare)) # 去重
+    user_ids = context['user_ids']
+    if context['target_uid'] is not None: # 如果指定了目标用户，只比较目标用户与其他人
+        row_positions = [user_ids.index(context['target_uid'])]
+        total_pairs_to_compare = len(user_ids) - 1
     else: # 否则，比较所有可能的选手对
-        user_pairs_to_compare = list(combinations(user_ids, 2))
+        row_positions = list(range(len(user_ids)))
+        total_pairs_to_compare = len(user_ids) * (len(user_ids) - 1) // 2
 
-    if not user_pairs_to_compare:
+    if total_pairs_to_compare <= 0:
         print("没有可供比较的选手对。")
         return results
 
     # --- 添加日志输出：开始计算 ---
-    total_pairs_to_compare = len(user_pairs_to_compare)
-    print(f"开始计算 {total_pairs_to_compare} 对选手相似度...")
+    print(f"开始计算 {total_pairs_to_compare} 对选手相似度 (至少 {context['min_common_solves']} 道共同解题才计算)...")
     # ------------------------------
 
-    # 3. 遍历选手对进行分析
-    pairs_processed_count = 0 # 用于进度计数
-    for uid1, uid2 in user_pairs_to_compare:
-        pairs_processed_count += 1
-        # --- 添加可选日志输出：显示计算进度 (例如，每处理 10% 或一定数量) ---
-        # 只有在计算对数较多时才输出进度，避免刷屏
-        if total_pairs_to_compare > 100 and (pairs_processed_count % (total_pairs_to_compare // 10) == 0 or pairs_processed_count == total_pairs_to_compare):
-             print(f"  已处理 {pairs_processed_count}/{total_pairs_to_compare} 对...")
-        # ----------------------------------------------------------------------
-
-
-        data1 = contestant_data.get(uid1) # 使用 .get() 避免 KeyError
-        data2 = contestant_data.get(uid2)
-
-        if not data1 or not data2: # 如果某个用户数据缺失，跳过这对
-            print(f"警告 (run_analysis): 用户数据缺失，跳过对 {uid1}-{uid2}") # 这行代码已经存在
-            continue
-
-        name1, name2 = data1.get('name', f"User_{uid1}"), data2.get('name', f"User_{uid2}")
-
-        pair_scores_summary = {'pair_names': (name1, name2), 'pair_ids': (uid1, uid2)}
-        combined_score_factors_weighted = []
-        common_challenge_ids_for_pair = data1.get('solved_set', set()).intersection(data2.get('solved_set', set())) # 提取共同解题一次
-
-        # a. Jaccard 相似度
-        if "jaccard" in analysis_params.get("methods", []):
-            # 直接使用共同解题集合和各自的解题集合
-            set1 = data1.get('solved_set', set())
-            set2 = data2.get('solved_set', set())
-            # 重新计算 Jaccard，虽然 common_ids_for_pair 已知交集，但为了代码清晰
-            j_score = calculate_jaccard_index(set1, set2)
-            pair_scores_summary['jaccard'] = round(j_score, 3)
-            combined_score_factors_weighted.append((j_score, 1.0))
-
-        # b. 加权 Jaccard 相似度
-        if "weighted_jaccard" in analysis_params.get("methods", []):
-             set1 = data1.get('solved_set', set())
-             set2 = data2.get('solved_set', set())
-             wj_score = calculate_weighted_jaccard_index(set1, set2, rarity_weights)
-             pair_scores_summary['weighted_jaccard'] = round(wj_score, 3)
-             combined_score_factors_weighted.append((wj_score, 1.5))
-
-        # c. 解题顺序相似度
-        if "sequence" in analysis_params.get("methods", []):
-            seq1 = data1.get('solved_sequence', [])
-            seq2 = data2.get('solved_sequence', [])
-            seq_score = calculate_sequence_similarity(seq1, seq2)
-            pair_scores_summary['sequence_similarity'] = round(seq_score, 3)
-            combined_score_factors_weighted.append((seq_score, 1.2))
-
-        # d. 提交时间接近性分析
-        if "time_proximity" in analysis_params.get("methods", []):
-            threshold_sec = analysis_params.get("time_proximity_seconds", 300)
-            close_subs_details = get_time_proximity_details(data1, data2, threshold_sec)
-            pair_scores_summary['time_proximity'] = {
-                'count': len(close_subs_details),
-                'threshold_seconds': threshold_sec,
-                'details': close_subs_details
-            }
-            # 启发式评分: 接近提交数 / (共同解题数 / 2) (至少1)
-            if common_challenge_ids_for_pair: # 使用前面提取的共同题目列表
-                 time_prox_heuristic_score = min(1.0, len(close_subs_details) / (max(1, len(common_challenge_ids_for_pair) / 2.0)))
-                 combined_score_factors_weighted.append((time_prox_heuristic_score, 1.8))
-            elif len(close_subs_details) > 0 :
-                 # 如果没有共同解题（不应该发生，因为close_subs_details基于共同题目），
-                 # 但时间接近详情里有东西，可能数据有误或逻辑问题，给一个基础分
-                 combined_score_factors_weighted.append((0.5, 1.8))
-
-
-        # e. 提交时间差分布分析 (Z-score)
-        dist_analysis_results_for_pair = []
-        if "time_diff_dist" in analysis_params.get("methods", []):
-            significant_z_score_count = 0 # 计算显著负 Z-score 的题目数量
-
-            # 遍历共同解题，使用预计算的统计量
-            for chall_id_z in common_challenge_ids_for_pair:
-                # 获取预计算的统计量
-                stats_for_this_challenge = challenge_time_stats.get(chall_id_z)
-
-                # 只对有有效预计算统计量的题目进行 Z-score 计算
-                if stats_for_this_challenge:
-                    dist_res_item = analyze_submission_time_diff_distribution(
-                        data1, data2, chall_id_z, stats_for_this_challenge
-                    )
-                    if dist_res_item: # analyze_submission_time_diff_distribution 返回None或字典
-                        # 添加题目名称到结果中
-                        dist_res_item['title'] = all_challenges_info.get(chall_id_z, {}).get('title', f"题目_{chall_id_z}")
-                        dist_analysis_results_for_pair.append(dist_res_item)
-                        # 判断Z-score是否显著小于平均水平
-                        if 'z_score' in dist_res_item and isinstance(dist_res_item['z_score'], (int, float)):
-                            if dist_res_item['z_score'] < -1.5: # 使用 -1.5 作为显著阈值
-                                significant_z_score_count +=1
-                # else:
-                    # print(f"调试: 题目 {chall_id_z} 无有效统计量，跳过Z-score计算。") # 可选调试日志
-
-
-            pair_scores_summary['time_distribution_analysis'] = dist_analysis_results_for_pair
-
-            # 启发式评分：显著负 Z-score 题数 / (共同解题数 / 2) (至少1)
-            if common_challenge_ids_for_pair: # 使用前面提取的共同题目列表
-                 z_score_heuristic_score = min(1.0, significant_z_score_count / (max(1, len(common_challenge_ids_for_pair) / 2.0)))
-                 combined_score_factors_weighted.append((z_score_heuristic_score, 1.3)) # 给予一个权重
-
-
-        # --- 为“详情”准备共同解题时间线数据 ---
-        # 遍历共同解题，组织时间线数据
-        current_pair_timeline_data = []
-        # 从已经计算好的 Z-score 结果中获取信息 (即 pair_scores_summary['time_distribution_analysis'])
-        z_score_analysis_from_summary = pair_scores_summary.get('time_distribution_analysis', [])
-
-        for chall_id_tl in common_challenge_ids_for_pair: # 使用前面提取的共同题目列表
-            # 查找当前题目的Z-score信息
-            z_score_info_for_this_chall = next(
-                (item for item in z_score_analysis_from_summary if item.get('challenge_id') == chall_id_tl),
-                None
-            )
-
-            # 确保获取到有效的解题时间，尽管preprocess_data应该已经筛选了
-            time1_ms_tl = data1.get('solved_timed', {}).get(chall_id_tl)
-            time2_ms_tl = data2.get('solved_timed', {}).get(chall_id_tl)
-
-            if time1_ms_tl is not None and time2_ms_tl is not None:
-                 current_pair_timeline_data.append({
-                    'id': chall_id_tl,
-                    'title': all_challenges_info.get(chall_id_tl, {}).get('title', f'题目_{chall_id_tl}'),
-                    'user1_name': name1,
-                    'user1_time_ms': time1_ms_tl,
-                    'user2_name': name2,
-                    'user2_time_ms': time2_ms_tl,
-                    'z_score_details': z_score_info_for_this_chall # 加入Z-score信息
-                 })
-
-        # 按user1的解题时间排序
-        current_pair_timeline_data.sort(key=lambda x: x.get('user1_time_ms', float('inf'))) # 使用get并提供默认值处理可能的None
-
-        pair_scores_summary['common_challenge_timeline_data'] = current_pair_timeline_data
-        # --- 共同解题时间线数据准备结束 ---
-
-
-        # 计算综合得分 - 这里使用了硬编码的权重，可以根据需要调整
-        total_weighted_score = sum(score * weight for score, weight in combined_score_factors_weighted)
-        total_weights = sum(weight for _, weight in combined_score_factors_weighted)
-        overall_similarity_heuristic = total_weighted_score / total_weights if total_weights > 0 else 0.0
-        pair_scores_summary['overall_similarity_heuristic'] = round(overall_similarity_heuristic, 3)
-
-        results['similar_pairs'].append(pair_scores_summary)
-
-        # 添加到关系图的边数据中 - 根据整体相似度阈值筛选
-        if overall_similarity_heuristic >= analysis_params.get("min_similarity_threshold", 0.0):
-             results['network_edges'].append({
-                'source': name1,
-                'target': name2,
-                'weight': round(overall_similarity_heuristic, 3),
-                'metrics_summary': {
-                    'j': pair_scores_summary.get('jaccard', 'N/A'),
-                    'wj': pair_scores_summary.get('weighted_jaccard', 'N/A'),
-                    's': pair_scores_summary.get('sequence_similarity', 'N/A'),
-                    'tp_c': pair_scores_summary.get('time_proximity', {}).get('count', 'N/A')
-                }
-            })
+    # 3. 遍历选手对进行分析 (选手对数足够多且配置了多个进程时分片并行)
+    pair_loop_started = time.perf_counter()
+    workers = max(1, min(int(analysis_params.get("parallel_workers", 1) or 1), multiprocessing.cpu_count())) # 不超过 CPU 核数
+    shard_rows = int(analysis_params.get("parallel_shard_rows", DEFAULT_SHARD_ROWS) or DEFAULT_SHARD_ROWS)
+    if workers > 1 and len(row_positions) > 1 and total_pairs_to_compare >= PARALLEL_MIN_PAIRS:
+        print(f"使用 {workers} 个进程并行计算，每个分片 {shard_rows} 行...")
+        shard_progress = {'covered': 0}
+
+        def report_shard_progress(shard):
+            if progress_callback:
+                # 第 r 行包含 (选手数 - 1 - r) 个选手对
+                shard_progress['covered'] += sum(len(user_ids) - 1 - row for row in shard)
+                progress_callback(shard_progress['covered'], total_pairs_to_compare)
+
+        similar_pairs, network_edges, pair_stats = _analyze_rows_parallel(
+            context, rarity_weights, row_positions, workers, shard_rows, report_shard_progress
+        )
+    else:
+        progress = {'covered': 0, 'step': max(1, total_pairs_to_compare // 10)}
+        progress['next_mark'] = progress['step']
+
+        def report_progress(row_pairs):
+            # --- 显示计算进度 (每覆盖 10% 的选手对输出一次，包含被跳过的对) ---
+            # 只有在计算对数较多时才输出进度，避免刷屏
+            progress['covered'] += row_pairs
+            if total_pairs_to_compare > 100 and (progress['covered'] >= progress['next_mark'] or progress['covered'] == total_pairs_to_compare):
+                print(f"  已处理 {progress['covered']}/{total_pairs_to_compare} 对...")
+                progress['next_mark'] = (progress['covered'] // progress['step'] + 1) * progress['step']
+            if progress_callback:
+                progress_callback(progress['covered'], total_pairs_to_compare)
+
+        similar_pairs, network_edges, pair_stats = _analyze_rows(context, row_positions, report_progress)
+
+    pair_loop_seconds = time.perf_counter() - pair_loop_started
+    results['similar_pairs'] = similar_pairs
+    results['network_edges'] = network_edges
+    results['pair_stats'] = {
+        'total_pairs': total_pairs_to_compare,
+        'candidate_pairs': pair_stats['candidate_pairs'],
+        'skipped_pairs': pair_stats['skipped_pairs'], # 共同解题数不足而未计算的选手对
+        'min_common_solves': context['min_common_solves']
+    }
 
     # --- 添加日志输出：计算完成 ---
-    print("选手相似度计算完成，正在排序和组织结果...")
+    print(f"选手相似度计算完成 (计算 {pair_stats['candidate_pairs']} 对，跳过 {pair_stats['skipped_pairs']} 对)，正在排序和组织结果...")
     # ------------------------------
 
+    started = time.perf_counter()
     results['similar_pairs'].sort(key=lambda x: x.get('overall_similarity_heuristic', 0), reverse=True)
+    stage_timings['sort_results'] = time.perf_counter() - started
+    _apply_edge_policy(results, analysis_params, stage_timings)
 
     end_time = time.time() # 结束计时
     duration = end_time - start_time
+    stage_timings['total'] = duration
+    results['timings'] = _collect_timings(context, pair_stats['timings'], pair_loop_seconds, stage_timings)
     print(f"分析引擎运行完成。总耗时: {duration:.2f} 秒。")
     # ------------------------------
 
@@ -569,6 +1563,282 @@ def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_
     return results
 
 
+# --- 单个选手对的详情 (按需计算) ---
+def prepare_pair_detail_data(contestant_data, all_challenges_info):
+    """
+    为按需计算选手对详情准备全局数据 (题目时间差统计量)。
+    返回的字典可以在同一份预处理数据上反复传给 compute_pair_details。
+    """
+    solve_index = get_challenge_solve_index(contestant_data, all_challenges_info)
+    return {
+        'contestant_data': contestant_data,
+        'all_challenges_info': all_challenges_info,
+        'solve_index': solve_index,
+        'challenge_time_stats': compute_challenge_time_stats(solve_index, all_challenges_info.keys())
+    }
+
+def compute_pair_details(detail_data, uid1, uid2, time_proximity_seconds=300):
+    """
+    计算一对选手的详情: 时间接近的提交列表、逐题 Z-score (附带时间差百分位) 和共同解题时间线。
+    内容与 detail_level="full" 时该对结果中的对应字段一致。
+
+    返回:
+    - dict，包含 'pair_names', 'pair_ids', 'time_proximity', 'time_distribution_analysis',
+      'common_challenge_timeline_data'；任一选手不存在时返回 None。
+    """
+    contestant_data = detail_data['contestant_data']
+    data1, data2 = contestant_data.get(uid1), contestant_data.get(uid2)
+    if not data1 or not data2:
+        return None
+
+    common_challenge_ids = data1['solved_set'].intersection(data2['solved_set'])
+
+    # 按题目索引顺序检查共同解题的时间差，与 find_close_submissions 的结果顺序一致
+    pair_hits = []
+    for chall_id in detail_data['solve_index']:
+        if chall_id in common_challenge_ids:
+            time1_ms, time2_ms = data1['solved_timed'][chall_id], data2['solved_timed'][chall_id]
+            if abs(time1_ms - time2_ms) / 1000.0 <= time_proximity_seconds:
+                pair_hits.append((chall_id, uid1, time1_ms, time2_ms))
+    close_subs_details = format_close_submissions(pair_hits, uid1)
+
+    z_score_items, _ = _time_distribution_for_pair(detail_data, data1, data2, common_challenge_ids, include_percentile=True)
+    return {
+        'pair_names': (data1.get('name', f"User_{uid1}"), data2.get('name', f"User_{uid2}")),
+        'pair_ids': (uid1, uid2),
+        'time_proximity': {
+            'count': len(close_subs_details),
+            'threshold_seconds': time_proximity_seconds,
+            'details': close_subs_details
+        },
+        'time_distribution_analysis': z_score_items,
+        'common_challenge_timeline_data': _common_challenge_timeline(detail_data, data1, data2, common_challenge_ids, z_score_items)
+    }
+
+
+# --- 增量分析 ---
+# 记分板刷新后大多数选手的解题记录不变。只依赖两位选手自身数据的指标
+# (Jaccard、解题顺序、时间接近性) 对这些选手对直接沿用上一次的结果；
+# 依赖全局状态的指标在本次重新计算: 加权 Jaccard (罕见度权重随解题人数变化，矩阵批量计算代价很低)，
+# 以及 Z-score (只重算解题记录发生变化的题目)。
+INCREMENTAL_PARAM_KEYS = (
+    "methods", "time_proximity_seconds", "min_similarity_threshold",
+    "target_username", "min_common_solves", "sequence_metric", "detail_level"
+)
+SEQUENCE_RECOVERY_MAX_LEN = 1000 # 两个序列总长小于此值时，可由保留 3 位小数的相似度精确还原匹配数
+
+def _iter_records(contestant_data, fields):
+    """逐个产出 (选手ID, 选手数据)；ContestantTable 只生成 fields 中的字段。"""
+    if isinstance(contestant_data, ContestantTable):
+        return ((uid, contestant_data.record(row, fields)) for row, uid in enumerate(contestant_data.user_ids))
+    return contestant_data.items()
+
+def build_analysis_snapshot(contestant_data, all_challenges_info, analysis_params):
+    """
+    记录一次分析的输入，供下一次 run_incremental_analysis 比较差异。
+    返回可以直接写入 JSON 的字典；ID 都放在列表中而不是作为字典键，避免整数 ID 被转换为字符串。
+    """
+    return {
+        'params': {key: analysis_params.get(key) for key in INCREMENTAL_PARAM_KEYS},
+        'users': [
+            [uid, data.get('name'), [[chall_id, solve_time] for chall_id, solve_time in data.get('solved_timed', {}).items()]]
+            for uid, data in _iter_records(contestant_data, ('name', 'solved_timed'))
+        ],
+        'challenges': [[chall_id, info.get('title')] for chall_id, info in all_challenges_info.items()]
+    }
+
+def _incremental_fallback_reason(previous_results, previous_snapshot, all_challenges_info, analysis_params):
+    """检查能否在上一次的结果上增量更新，不能时返回原因。"""
+    if not previous_results or not previous_snapshot:
+        return "没有上一次的分析结果"
+    if 'error' in previous_results or 'pair_stats' not in previous_results:
+        return "上一次的分析结果不完整"
+    if analysis_params.get("target_username"):
+        return "指定了目标用户"
+    current_params = {key: analysis_params.get(key) for key in INCREMENTAL_PARAM_KEYS}
+    if previous_snapshot.get('params') != current_params:
+        return "分析参数已改变"
+    current_challenges = [[chall_id, info.get('title')] for chall_id, info in all_challenges_info.items()]
+    if previous_snapshot.get('challenges') != current_challenges:
+        return "题目列表已改变"
+    previous_pairs = previous_results.get('similar_pairs') or []
+    if (analysis_params.get("detail_level", "full") == "full" and previous_pairs
+            and 'common_challenge_timeline_data' not in previous_pairs[0]):
+        return "上一次的结果不含选手对详情" # 例如从列式存储导出的摘要结果
+    return None
+
+def _diff_snapshot(previous_snapshot, contestant_data, all_challenges_info):
+    """
+    比较上一次快照与当前选手数据。
+
+    返回:
+    - (changed_uids, changed_challenges): 名称或解题记录有变化 (含新增) 的选手，
+      以及解题者集合或解题时间有变化的题目 (这些题目的时间差统计量需要重新计算)。
+    """
+    previous_users = {}
+    previous_solvers = defaultdict(set)
+    for uid, name, solves in previous_snapshot['users']:
+        previous_users[uid] = (name, {chall_id: solve_time for chall_id, solve_time in solves})
+        for chall_id, solve_time in solves:
+            previous_solvers[chall_id].add((solve_time, uid))
+
+    changed_uids = {
+        uid for uid, data in _iter_records(contestant_data, ('name', 'solved_timed'))
+        if previous_users.get(uid) != (data.get('name'), data.get('solved_timed', {}))
+    }
+
+    solve_index = get_challenge_solve_index(contestant_data, all_challenges_info)
+    changed_challenges = {
+        chall_id for chall_id in set(previous_solvers) | set(solve_index)
+        if previous_solvers.get(chall_id, set()) != set(solve_index.get(chall_id, []))
+    }
+    return changed_uids, changed_challenges
+
+def _recover_sequence_score(previous, uid1, uid2, data1, data2, metric):
+    """
+    由上一次保存的 (保留 3 位小数的) 解题顺序相似度还原未取整的值。
+    相似度为 2M/T (T 为两个序列总长)，T 不太大时 M 可以由取整后的值唯一确定。
+    无法还原 (序列过长，或 difflib 方式下两人先后顺序与上次相反) 时返回 None。
+    """
+    seq_value = previous.get('sequence_similarity')
+    total_len = len(data1.get('solved_sequence', [])) + len(data2.get('solved_sequence', []))
+    if not isinstance(seq_value, (int, float)) or total_len == 0 or total_len >= SEQUENCE_RECOVERY_MAX_LEN:
+        return None
+    if metric == "difflib" and list(previous['pair_ids']) != [uid1, uid2]:
+        return None # SequenceMatcher 的结果与参数顺序有关
+    return round(seq_value * total_len) / total_len
+
+def run_incremental_analysis(previous_results, previous_snapshot, contestant_data, rarity_weights, all_challenges_info, analysis_params, progress_callback=None):
+    """
+    在上一次的分析结果上增量更新，结果与对当前数据执行 run_analysis 一致。
+
+    参数:
+    - previous_results (dict): 上一次 run_analysis / run_incremental_analysis 的返回值。
+    - previous_snapshot (dict): 上一次分析时 build_analysis_snapshot 的返回值。
+    - 其余参数 (含 progress_callback) 与 run_analysis 相同。
+
+    涉及解题记录有变化的选手的对完整重算；其余对沿用 Jaccard、解题顺序和时间接近性结果，
+    重新计算加权 Jaccard、受影响题目的 Z-score 和综合得分。
+    没有上一次的结果、参数不同、指定了目标用户或题目列表变化时，退回 run_analysis 完整计算。
+
+    返回:
+    - results (dict): 与 run_analysis 结构相同，另带 'incremental_update'
+      (变化的选手数、变化的题目数、重新计算和沿用的选手对数)。
+    """
+    fallback_reason = _incremental_fallback_reason(previous_results, previous_snapshot, all_challenges_info, analysis_params)
+    if fallback_reason:
+        print(f"无法增量分析 ({fallback_reason})，执行完整分析...")
+        return run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_params, progress_callback)
+
+    start_time = time.time()
+    print("增量分析启动...")
+    results = {'similar_pairs': [], 'network_nodes': [], 'network_edges': []}
+    if not contestant_data:
+        print("警告 (run_incremental_analysis): 传入的 contestant_data 为空。无法进行分析。")
+        return results
+
+    changed_uids, changed_challenges = _diff_snapshot(previous_snapshot, contestant_data, all_challenges_info)
+    print(f"与上一次相比: {len(changed_uids)} 名选手、{len(changed_challenges)} 道题目的解题记录有变化。")
+
+    started = time.perf_counter()
+    results['network_nodes'] = _build_network_nodes(contestant_data)
+    stage_timings = {'network_nodes': time.perf_counter() - started}
+    context = _prepare_analysis_context(contestant_data, rarity_weights, all_challenges_info, analysis_params)
+    methods = context['methods']
+    user_ids = context['user_ids']
+    sequence_kernel_data = context['sequence_kernel_data']
+    previous_pairs = {frozenset(pair['pair_ids']): pair for pair in previous_results.get('similar_pairs', [])}
+
+    pair_stats = {'candidate_pairs': 0, 'skipped_pairs': 0, 'recomputed_pairs': 0, 'reused_pairs': 0}
+    total_pairs = len(user_ids) * (len(user_ids) - 1) // 2
+    covered_pairs = 0
+    pair_timings = context['pair_timings']
+    pair_loop_started = time.perf_counter()
+    for block_start in range(0, len(user_ids), PAIR_BLOCK_ROWS):
+        block_rows = list(range(block_start, min(len(user_ids), block_start + PAIR_BLOCK_ROWS)))
+        started = time.perf_counter()
+        jaccard_block = compute_jaccard_block(context['solve_matrix'], block_rows, weighted="weighted_jaccard" in methods)
+        _add_time(pair_timings, 'jaccard', started)
+        weighted_block = jaccard_block['weighted_jaccard']
+        for offset, row in enumerate(block_rows):
+            other_positions = np.arange(row + 1, len(user_ids))
+            candidate_list = other_positions[jaccard_block['intersection'][offset, other_positions] >= context['min_common_solves']].tolist()
+            pair_stats['candidate_pairs'] += len(candidate_list)
+            pair_stats['skipped_pairs'] += len(other_positions) - len(candidate_list)
+
+            uid1 = user_ids[row]
+            data1 = context['contestant_data'][uid1]
+            row_pairs = [] # [(uid2, 上一次的结果或 None, 批量分数)]
+            sequence_cols = [] # 需要重新计算解题顺序相似度的列
+            for col in candidate_list:
+                uid2 = user_ids[col]
+                previous = None
+                if uid1 not in changed_uids and uid2 not in changed_uids:
+                    previous = previous_pairs.get(frozenset((uid1, uid2)))
+                batch_scores = {
+                    'jaccard': float(jaccard_block['jaccard'][offset, col]),
+                    'weighted_jaccard': float(weighted_block[offset, col]) if weighted_block is not None else None,
+                    'sequence': None
+                }
+                if sequence_kernel_data is not None:
+                    if previous is not None:
+                        batch_scores['sequence'] = _recover_sequence_score(
+                            previous, uid1, uid2, data1, context['contestant_data'][uid2], context['sequence_metric']
+                        )
+                    if batch_scores['sequence'] is None:
+                        sequence_cols.append(col)
+                row_pairs.append((uid2, col, previous, batch_scores))
+
+            if sequence_cols:
+                started = time.perf_counter()
+                sequence_scores = batch_sequence_similarity(sequence_kernel_data, row, sequence_cols, context['sequence_metric'])
+                _add_time(pair_timings, 'sequence', started)
+                sequence_by_col = dict(zip(sequence_cols, sequence_scores.tolist()))
+                for _, col, _, batch_scores in row_pairs:
+                    if col in sequence_by_col:
+                        batch_scores['sequence'] = sequence_by_col[col]
+
+            for uid2, _, previous, batch_scores in row_pairs:
+                pair_scores_summary, network_edge = _score_pair(
+                    context, uid1, uid2, batch_scores, previous,
+                    changed_challenges if previous is not None else None
+                )
+                if pair_scores_summary is None:
+                    continue
+                pair_stats['reused_pairs' if previous is not None else 'recomputed_pairs'] += 1
+                results['similar_pairs'].append(pair_scores_summary)
+                if network_edge is not None:
+                    results['network_edges'].append(network_edge)
+
+            covered_pairs += len(other_positions)
+            if progress_callback:
+                progress_callback(covered_pairs, total_pairs)
+    pair_loop_seconds = _add_time(pair_timings, 'pair_loop', pair_loop_started) - pair_loop_started
+
+    results['pair_stats'] = {
+        'total_pairs': total_pairs,
+        'candidate_pairs': pair_stats['candidate_pairs'],
+        'skipped_pairs': pair_stats['skipped_pairs'],
+        'min_common_solves': context['min_common_solves']
+    }
+    results['incremental_update'] = {
+        'changed_users': len(changed_uids),
+        'changed_challenges': len(changed_challenges),
+        'recomputed_pairs': pair_stats['recomputed_pairs'],
+        'reused_pairs': pair_stats['reused_pairs']
+    }
+    print(f"增量更新完成: 重新计算 {pair_stats['recomputed_pairs']} 对，沿用 {pair_stats['reused_pairs']} 对。")
+
+    started = time.perf_counter()
+    results['similar_pairs'].sort(key=lambda x: x.get('overall_similarity_heuristic', 0), reverse=True)
+    stage_timings['sort_results'] = time.perf_counter() - started
+    _apply_edge_policy(results, analysis_params, stage_timings)
+    stage_timings['total'] = time.time() - start_time
+    results['timings'] = _collect_timings(context, pair_timings, pair_loop_seconds, stage_timings)
+    print(f"增量分析运行完成。总耗时: {stage_timings['total']:.2f} 秒。")
+    return results
+
+
 if __name__ == '__main__':
     # 用于直接测试此模块的功能
     print("测试分析引擎模块...")
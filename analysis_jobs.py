@@ -0,0 +1,193 @@
+# your_project_folder/analysis_jobs.py
+# 后台任务: 抓取数据、预计算和按需分析在有界线程池中执行，HTTP 请求只返回任务ID，
+# 前端通过 /api/jobs/<job_id> 轮询状态和进度，也可以取消排队中或执行中的任务。
+# 相同的请求 (相同的 dedupe_key) 在前一个任务结束前提交时不会重复计算，而是挂到同一个任务上。
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = 2 # 同时执行的任务数 (全局并发上限)，其余任务排队
+MAX_QUEUED_JOBS = 16 # 排队任务数上限，超出时拒绝新任务，避免服务器过载
+MAX_FINISHED_JOBS = 100 # 保留的已结束任务数 (超出后丢弃最早结束的)
+# 已结束任务的结果 (按需分析时是完整的结果) 在挂在该任务上的请求都取到之后，或结束后超过此时间，即被丢弃，
+# 之后只保留任务状态 ('result_expired' 为 True)；按需分析的结果另有 data_cache 的结果缓存 (有字节上限)
+JOB_RESULT_TTL_SECONDS = 300
+# 任务状态: queued -> running -> (cancelling ->) succeeded / failed / cancelled
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    """任务被取消时由进度回调抛出，用于中止正在执行的分析。"""
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限。"""
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="analysis-job")
+_jobs = OrderedDict() # job_id -> 任务字典 (按提交顺序)
+_active_by_key = {} # dedupe_key -> 未结束的任务ID
+_jobs_lock = threading.Lock()
+
+def _drop_result(job):
+    """调用方需持有 _jobs_lock。"""
+    job['result'] = None
+    job['result_expired'] = True
+
+def _prune_finished_jobs():
+    """丢弃超过 MAX_FINISHED_JOBS 的已结束任务和超过 JOB_RESULT_TTL_SECONDS 的任务结果。调用方需持有 _jobs_lock。"""
+    now = time.time()
+    for job in _jobs.values():
+        if job['result'] is not None and job['finished_at'] is not None and now - job['finished_at'] > JOB_RESULT_TTL_SECONDS:
+            _drop_result(job)
+    finished = [job_id for job_id, job in _jobs.items() if job['status'] in FINISHED_STATUSES]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+def _release_dedupe_key(job):
+    """任务结束或取消后，相同的请求应重新提交。调用方需持有 _jobs_lock。"""
+    if job['dedupe_key'] is not None and _active_by_key.get(job['dedupe_key']) == job['id']:
+        del _active_by_key[job['dedupe_key']]
+
+def _make_progress_reporter(job):
+    """
+    返回传给任务函数的进度回调 report(stage, done=None, total=None)。
+    任务被请求取消时，下一次调用回调会抛出 JobCancelled。
+    """
+    def report(stage, done=None, total=None):
+        if job['cancel_event'].is_set():
+            raise JobCancelled()
+        job['progress'] = {'stage': stage, 'done': done, 'total': total}
+    return report
+
+def _run_job(job, func, args):
+    with _jobs_lock:
+        if job['cancel_event'].is_set(): # 排队期间被取消
+            return
+        job['status'] = "running"
+        job['started_at'] = time.time()
+    try:
+        result = func(_make_progress_reporter(job), *args)
+        status, error = "succeeded", None
+    except JobCancelled:
+        result, status, error = None, "cancelled", None
+    except Exception as e:
+        result, status, error = None, "failed", str(e)
+        print(f"后台任务 {job['id']} ({job['kind']}) 执行出错: {e}")
+    with _jobs_lock:
+        # 取消请求到达时任务已执行完 (没有再报告进度) 的，仍记为成功，其结果 (如已写入的缓存) 已经生效
+        job.update({'status': status, 'result': result, 'error': error, 'finished_at': time.time()})
+        _release_dedupe_key(job)
+        _prune_finished_jobs()
+    job['done_event'].set()
+
+def submit_job(kind, func, *args, dedupe_key=None):
+    """
+    提交一个后台任务，立即返回。
+
+    参数:
+    - kind (str): 任务类型 (如 "fetch_data"、"analyze")，仅用于展示。
+    - func (callable): 以 func(report, *args) 调用，report 为进度回调，返回值作为任务结果；
+      抛出的异常记为任务失败。
+    - dedupe_key (str or None): 请求的规范化标识。已有相同标识的任务在排队或执行时，
+      不再提交新任务，而是返回该任务 (调用方得到同一个结果)。
+
+    返回:
+    - (job_id, coalesced): coalesced 为 True 表示挂到了已有的任务上。
+    排队任务数已达 MAX_QUEUED_JOBS 时抛出 JobQueueFull。
+    """
+    # 查找相同标识的任务、检查排队上限和登记新任务在同一个临界区内完成，并发的相同请求只会创建一个任务
+    with _jobs_lock:
+        active_id = _active_by_key.get(dedupe_key) if dedupe_key is not None else None
+        if active_id is not None:
+            _jobs[active_id]['subscribers'] += 1
+            return active_id, True
+        if sum(1 for job in _jobs.values() if job['status'] == "queued") >= MAX_QUEUED_JOBS:
+            raise JobQueueFull()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': "queued",
+            'progress': {'stage': "queued", 'done': None, 'total': None},
+            'result': None,
+            'result_fetches': 0, # 取走结果的次数，达到 subscribers 后丢弃结果
+            'result_expired': False,
+            'error': None,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'dedupe_key': dedupe_key,
+            'subscribers': 1, # 挂在该任务上的请求数，全部取消后才真正取消
+            'cancel_event': threading.Event(),
+            'done_event': threading.Event() # 任务结束 (含排队时被取消) 时设置，见 wait_job
+        }
+        _jobs[job['id']] = job
+        if dedupe_key is not None:
+            _active_by_key[dedupe_key] = job['id']
+    _executor.submit(_run_job, job, func, args)
+    return job['id'], False
+
+def _job_view(job, include_result):
+    """调用方需持有 _jobs_lock。"""
+    view = {key: job[key] for key in ('id', 'kind', 'status', 'progress', 'error', 'submitted_at', 'started_at', 'finished_at', 'subscribers')}
+    if job['status'] == "queued":
+        view['queue_position'] = sum(1 for other in _jobs.values()
+                                     if other['status'] == "queued" and other['submitted_at'] < job['submitted_at'])
+    if job['result_expired']:
+        view['result_expired'] = True
+    elif include_result and job['status'] == "succeeded":
+        view['result'] = job['result']
+        job['result_fetches'] += 1
+        if job['result_fetches'] >= job['subscribers']: # 每个挂在任务上的请求都已取到结果
+            _drop_result(job)
+    return view
+
+def get_job(job_id, include_result=True):
+    """
+    返回任务状态 (成功结束时包含 'result')；任务不存在时返回 None。
+    带结果的查询计为取走一次结果，结果被丢弃后 'result_expired' 为 True (见 JOB_RESULT_TTL_SECONDS)。
+    """
+    with _jobs_lock:
+        _prune_finished_jobs()
+        job = _jobs.get(job_id)
+        return _job_view(job, include_result) if job else None
+
+def wait_job(job_id, timeout=None):
+    """
+    在服务器内部等待任务结束 (供后台线程使用，如实时更新的轮询)，返回任务状态 (成功时包含 'result')。
+    超时时返回当前状态；任务不存在时返回 None。
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return None
+    job['done_event'].wait(timeout)
+    with _jobs_lock:
+        return _job_view(job, True)
+
+def list_jobs():
+    """返回所有保留的任务状态 (不含结果)，按提交顺序。"""
+    with _jobs_lock:
+        return [_job_view(job, False) for job in _jobs.values()]
+
+def cancel_job(job_id):
+    """
+    请求取消任务。多个请求挂在同一任务上时，只有全部取消后才真正取消。
+    排队中的任务直接取消；执行中的任务在下一次报告进度时中止。
+    返回: 取消后的任务状态；任务不存在时返回 None。
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] in ("queued", "running") and job['subscribers'] > 1:
+            job['subscribers'] -= 1
+        elif job['status'] not in FINISHED_STATUSES:
+            job['cancel_event'].set()
+            _release_dedupe_key(job) # 正在取消的任务不再接受新的请求
+            if job['status'] == "queued":
+                job.update({'status': "cancelled", 'finished_at': time.time()})
+                job['done_event'].set()
+                _prune_finished_jobs()
+            else:
+                job['status'] = "cancelling"
+        return _job_view(job, False)
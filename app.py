@@ -1,235 +1,890 @@
 # your_project_folder/app.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, stream_with_context
 from flask_cors import CORS
 import data_fetcher # 你的数据获取模块
 import analysis_engine # 你的分析引擎模块
+import result_index # 缓存结果的查询索引
+import result_store # 缓存结果的列式存储
+import analysis_jobs # 后台任务队列
+import data_cache # 预处理结果和按需分析结果的缓存
+import metrics # 各阶段耗时和计数器 (/api/metrics)
+import live_updates # 实时更新的轮询和 SSE 推送 (/api/live)
+import gzip
+import hashlib
 import time
 import os
-import json
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone # 确保导入
 
 app = Flask(__name__)
 CORS(app)
 
-SCOREBOARD_DATA_FILE = data_fetcher.DATA_FILE # 从 data_fetcher 获取文件名
-ANALYSIS_RESULTS_FILE = "analysis_results.json" # 缓存分析结果的文件名
+ANALYSIS_STORE_DIR = "analysis_store" # 缓存分析结果的列式存储目录 (含用于增量分析的输入快照)，位于各比赛的目录下
+ALL_GAMES = "all" # POST /api/fetch_data?game=all 并发刷新全部比赛
+LIVE_MAX_PUSH_PAIRS = 500 # 一次推送的有变化的选手对 (及边) 数上限，超出时推送 reset，由前端重新查询
 
 # 定义一套用于预计算的默认参数
 DEFAULT_ANALYSIS_PARAMS = {
     "methods": ["jaccard", "weighted_jaccard", "sequence", "time_proximity", "time_diff_dist"],
     "time_proximity_seconds": 300,
-    "min_similarity_threshold": 0.0, # 预计算时包含所有可能的边，前端再按需过滤
+    "min_similarity_threshold": 0.0, # 预计算时不按阈值筛选边，前端再按需过滤
+    "edge_policy": "knn", # 关系图的边选择策略 (见 analysis_engine.EDGE_POLICIES)，避免边数随选手数平方增长
+    "edge_top_k": 10, # knn: 每位选手保留综合得分最高的边数
+    "edge_keep_above": 0.5, # 综合得分不低于此值的边总是保留
+    "edge_backbone_alpha": 0.05, # backbone: 视差过滤的显著性水平
     "min_user_score": 0, # 预计算时筛选用户，这个参数会传给 preprocess_data
+    "min_common_solves": 1, # 至少有 1 道共同解题的选手对才参与计算，其余对只计入统计
+    "sequence_metric": "difflib", # 解题顺序相似度算法: "difflib" (与 SequenceMatcher 一致) 或 "lcs"
+    # 每个分析使用的进程数，1 表示串行。最多 JOB_WORKERS 个任务同时分析 (如抓取数据和按需分析、多个比赛)，
+    # 各自建立进程池，因此平分 CPU 核数，同时运行的分析进程总数不超过核数
+    "parallel_workers": max(1, (os.cpu_count() or 1) // analysis_jobs.JOB_WORKERS),
+    "parallel_shard_rows": 64, # 每个并行分片包含的选手行数
+    "detail_level": "summary", # 结果只保留标量分数，选手对详情通过 /api/pair_details 按需计算
     "target_username": None 
 }
 
-def _perform_and_cache_default_analysis():
+def _store_dir(game):
+    return os.path.join(game['dir'], ANALYSIS_STORE_DIR)
+
+# 按需计算选手对详情时，计算过的详情放在一个小的 LRU 缓存中 (用户通常只会点开少数几对)
+PAIR_DETAIL_CACHE_SIZE = 256
+
+# 各比赛的内存状态，比赛之间互不影响:
+# - 'pair_index': 缓存分析结果的查询索引，列式存储切换到新版本后重新建立；
+# - 'pair_detail': 详情所需的索引 (按 数据版本, min_user_score 缓存) 和计算过的详情；
+# - 'default_analysis_lock': 同一比赛同一时间只执行一次默认分析。
+_game_states = {}
+_game_states_lock = threading.Lock()
+
+def _game_state(game):
+    with _game_states_lock:
+        if game['id'] not in _game_states:
+            _game_states[game['id']] = {
+                'pair_index': {'version': None, 'index': None},
+                'pair_index_lock': threading.Lock(),
+                'pair_detail': {'data_key': None, 'detail_data': None, 'uid_lookup': {}, 'details': OrderedDict()},
+                'pair_detail_lock': threading.Lock(),
+                'status_meta': {'version': None, 'meta': None}, # 状态栏使用的预计算元数据 (按版本缓存)
+                'default_analysis_lock': threading.Lock()
+            }
+        return _game_states[game['id']]
+
+@app.before_request
+def _resolve_game():
+    """/api/* 请求的比赛由查询参数 game 指定 (默认第一个比赛，见 data_fetcher.GAMES_FILE)，解析后放在 g.game。"""
+    if not request.path.startswith('/api/'):
+        return None
+    game_id = request.args.get('game', '').strip() or None
+    if game_id == ALL_GAMES and request.endpoint == 'force_fetch_data':
+        g.game = None
+        return None
+    g.game = data_fetcher.get_game(game_id)
+    if g.game is None:
+        return jsonify({"error": f"未知的比赛 '{game_id}'",
+                        "games": [game['id'] for game in data_fetcher.list_games()]}), 404
+    return None
+
+def _store_status_meta(game):
+    """比赛当前版本的预计算元数据，按版本缓存 (状态栏轮询时不必每次解析含选手列表的 meta.json)；尚无结果时返回 None。"""
+    version = result_store.current_version(_store_dir(game))
+    if version is None:
+        return None
+    status_meta = _game_state(game)['status_meta']
+    if status_meta['version'] != version:
+        meta = result_store.read_store_meta(_store_dir(game))
+        if meta is None:
+            return None
+        status_meta['meta'] = {key: value for key, value in meta.items() if key not in ('user_ids', 'network_nodes')}
+        status_meta['version'] = meta['version']
+    return status_meta['meta']
+
+def _get_cached_pair_index(game):
+    """返回比赛的缓存分析结果的查询索引；尚无缓存结果时返回 None。"""
+    version = result_store.current_version(_store_dir(game))
+    if version is None:
+        return None
+    state = _game_state(game)
+    with state['pair_index_lock']:
+        pair_index_state = state['pair_index']
+        if pair_index_state['index'] is None or pair_index_state['version'] != version:
+            store = result_store.open_result_store(_store_dir(game))
+            pair_index_state['index'] = result_index.build_pair_index(store)
+            pair_index_state['version'] = store['version']
+            app.logger.info(f"已为比赛 {game['id']} 的 {pair_index_state['index']['pair_count']} 个选手对建立查询索引")
+        return pair_index_state['index']
+
+def _get_pair_details(game, user1_id, user2_id, time_proximity_seconds, min_user_score):
     """
-    读取最新的 scoreboard 数据，执行默认参数的分析，并缓存结果。
+    计算 (或从缓存取出) 比赛中一对选手的详情。选手ID为字符串形式 (来自查询参数)。
+    返回: (详情字典, None) 或 (None, (错误信息, HTTP状态码))
     """
-    app.logger.info("后台开始执行默认分析并缓存...")
-    # 1. 获取当前最新的scoreboard数据 (不强制刷新，使用缓存或data_fetcher的逻辑)
-    raw_data, _ = data_fetcher.get_scoreboard_data(force_refresh=False) 
-    if not raw_data:
-        app.logger.error("错误: 无法加载 scoreboard 数据进行默认分析。")
-        return False
+    if not os.path.exists(game['data_file']):
+        return None, ("尚无缓存的计分板数据，请先刷新服务器数据。", 404)
+    raw_data, data_version = data_fetcher.load_scoreboard(game['id'])
+    data_key = (data_version, min_user_score)
+    state = _game_state(game)
+    detail_state = state['pair_detail']
+    with state['pair_detail_lock']:
+        if detail_state['data_key'] != data_key:
+            (contestant_data, _, all_challenges_info, _), raw_data = \
+                data_fetcher.get_preprocessed_scoreboard(raw_data, min_user_score)
+            detail_state.update({
+                'data_key': (data_cache.scoreboard_version(raw_data), min_user_score), # 数据文件被替换后重试时为新数据的版本
+                'detail_data': analysis_engine.prepare_pair_detail_data(contestant_data, all_challenges_info),
+                'uid_lookup': {str(uid): uid for uid in contestant_data},
+                'details': OrderedDict()
+            })
 
+        uid1 = detail_state['uid_lookup'].get(user1_id)
+        uid2 = detail_state['uid_lookup'].get(user2_id)
+        if uid1 is None or uid2 is None:
+            return None, ("选手不存在或未通过最低分数筛选。", 404)
+
+        detail_cache = detail_state['details']
+        cache_key = (uid1, uid2, time_proximity_seconds)
+        if cache_key in detail_cache:
+            detail_cache.move_to_end(cache_key)
+            return detail_cache[cache_key], None
+        details = analysis_engine.compute_pair_details(
+            detail_state['detail_data'], uid1, uid2, time_proximity_seconds
+        )
+        detail_cache[cache_key] = details
+        if len(detail_cache) > PAIR_DETAIL_CACHE_SIZE:
+            detail_cache.popitem(last=False)
+        return details, None
+
+def _load_previous_default_analysis(game):
+    """
+    读取比赛上一次缓存的默认分析结果 (从列式存储导出) 及其输入快照。
+    两者不全、或上一次使用的 min_user_score 与当前默认参数不同时返回 (None, None)，此时执行完整分析。
+    """
     try:
-        # 2. 数据预处理
-        # min_user_score 在 DEFAULT_ANALYSIS_PARAMS 中定义，用于此次预处理
-        min_score_for_preprocessing = DEFAULT_ANALYSIS_PARAMS.get("min_user_score", 0)
-        
-        contestant_data, rarity_weights, all_challenges_info, _ = \
-            analysis_engine.preprocess_data(raw_data, min_user_score=min_score_for_preprocessing) 
+        store = result_store.open_result_store(_store_dir(game))
+        if store is None:
+            return None, None
+        if (store['meta'].get('params_used') or {}).get("min_user_score") != DEFAULT_ANALYSIS_PARAMS.get("min_user_score"):
+            return None, None
+        previous_snapshot = result_store.read_store_snapshot(store)
+        if previous_snapshot is None:
+            return None, None
+        return result_store.export_results(store), previous_snapshot
+    except Exception as e:
+        app.logger.warn(f"读取上一次的分析缓存出错，将执行完整分析: {e}")
+        return None, None
+
+def _record_analysis_metrics(kind, game, results):
+    """把比赛的一次分析的各阶段耗时 (results['timings'] 中的引擎阶段) 和选手对计数记入 metrics。"""
+    timings = results.get('timings') or {}
+    metrics.observe_timings(timings, exclude=('total', 'load', 'parse', 'preprocess')) # 后三者在获取/预处理时已记录
+    if 'total' in timings:
+        metrics.observe('analysis', timings['total'])
+    pair_stats = results.get('pair_stats') or {}
+    mode = "incremental" if results.get('incremental_update') else "full"
+    metrics.inc('analysis_runs', kind=kind, mode=mode, game=game['id'])
+    metrics.inc('pairs_evaluated', pair_stats.get('candidate_pairs', 0), kind=kind, game=game['id'])
+    metrics.inc('pairs_skipped', pair_stats.get('skipped_pairs', 0), kind=kind, game=game['id'])
+
+def _perform_and_cache_default_analysis(game, progress_callback=None):
+    """
+    读取比赛最新的 scoreboard 数据，执行默认参数的分析，并缓存结果。
+    如果存在上一次的缓存结果和输入快照，只重新计算与解题记录有变化的选手相关的部分。
+    同一比赛同一时间只执行一次 (多个刷新任务同时执行时依次写入列式存储，后一次可在前一次的结果上增量更新)。
+    progress_callback(已处理的选手对数, 总对数) 会传给分析引擎；任务被取消时抛出的 JobCancelled 不会被吞掉。
+    """
+    with _game_state(game)['default_analysis_lock']:
+        app.logger.info(f"后台开始执行比赛 {game['id']} 的默认分析并缓存...")
+        timings = {} # 本次执行的各阶段耗时，与引擎的耗时一起写入结果的元数据
+        # 1. 获取当前最新的scoreboard数据 (不强制刷新，使用缓存或data_fetcher的逻辑)
+        with metrics.timed('load', timings):
+            raw_data, _ = data_fetcher.get_scoreboard_data(force_refresh=False, game_id=game['id'])
+        if not raw_data:
+            app.logger.error("错误: 无法加载 scoreboard 数据进行默认分析。")
+            return False
+
+        try:
+            # 2. 数据预处理
+            # min_user_score 在 DEFAULT_ANALYSIS_PARAMS 中定义，用于此次预处理
+            min_score_for_preprocessing = DEFAULT_ANALYSIS_PARAMS.get("min_user_score", 0)
             
-        analysis_output = {}
-        if not contestant_data:
-            app.logger.warn("警告: 预处理后无选手数据，无法执行默认分析。")
-            analysis_output = {
-                'params_used': DEFAULT_ANALYSIS_PARAMS,
-                'calculation_time_unix': time.time(),
-                'calculation_time_iso': datetime.now(timezone.utc).isoformat(), # 使用 timezone.utc
-                'results': {'similar_pairs': [], 'network_nodes': [], 'network_edges': [], 'message': '预处理后无活跃选手数据'}
-            }
-        else:
-            # 3. 执行分析 (移除 min_user_score 因为已在预处理中应用)
-            run_params_for_engine = {k: v for k, v in DEFAULT_ANALYSIS_PARAMS.items() if k != "min_user_score"}
-
-            analysis_results_obj = analysis_engine.run_analysis(
-                contestant_data,
-                rarity_weights,
-                all_challenges_info,
-                run_params_for_engine 
-            )
-            analysis_output = {
-                'params_used': DEFAULT_ANALYSIS_PARAMS, # 保存的是完整的默认参数记录
-                'calculation_time_unix': time.time(),
-                'calculation_time_iso': datetime.now(timezone.utc).isoformat(), # 使用 timezone.utc
-                'results': analysis_results_obj
-            }
-        
-        # 4. 保存结果到文件
-        with open(ANALYSIS_RESULTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(analysis_output, f, ensure_ascii=False, indent=2)
-        app.logger.info(f"默认分析结果已保存到 {ANALYSIS_RESULTS_FILE}")
-        return True
+            # 同一数据版本只预处理一次；数据文件在此期间被替换时改用新数据 (raw_data 为实际使用的数据描述)
+            (contestant_data, rarity_weights, all_challenges_info, _), raw_data = \
+                data_fetcher.get_preprocessed_scoreboard(raw_data, min_score_for_preprocessing, timings=timings)
+                
+            snapshot = None
+            if not contestant_data:
+                app.logger.warn("警告: 预处理后无选手数据，无法执行默认分析。")
+                analysis_results_obj = {'similar_pairs': [], 'network_nodes': [], 'network_edges': [], 'message': '预处理后无活跃选手数据'}
+            else:
+                # 3. 执行分析 (移除 min_user_score 因为已在预处理中应用)
+                run_params_for_engine = {k: v for k, v in DEFAULT_ANALYSIS_PARAMS.items() if k != "min_user_score"}
+
+                previous_results, previous_snapshot = _load_previous_default_analysis(game)
+                analysis_results_obj = analysis_engine.run_incremental_analysis(
+                    previous_results,
+                    previous_snapshot,
+                    contestant_data,
+                    rarity_weights,
+                    all_challenges_info,
+                    run_params_for_engine,
+                    progress_callback
+                )
+                snapshot = analysis_engine.build_analysis_snapshot(contestant_data, all_challenges_info, run_params_for_engine)
+                _record_analysis_metrics("default", game, analysis_results_obj)
+            analysis_results_obj['timings'] = dict(timings, **analysis_results_obj.get('timings', {}))
+            
+            # 4. 保存结果到列式存储 (保存的是完整的默认参数记录；结果为空时不保存快照，不能作为增量分析的基础)
+            # 有实时更新的订阅者时先打开旧版本 (写入新版本后旧目录被删除，已打开的 memmap 仍可读取)，用于比较变化
+            previous_store = result_store.open_result_store(_store_dir(game)) if live_updates.has_subscribers(game['id']) else None
+            with metrics.timed('store_write'):
+                version = result_store.write_result_store(
+                    _store_dir(game), analysis_results_obj, DEFAULT_ANALYSIS_PARAMS, time.time(), snapshot=snapshot,
+                    data_version=data_cache.scoreboard_version(raw_data), timings=analysis_results_obj['timings']
+                )
+            # 布局和社区划分、预压缩的导出 (包含在 store_write 中)
+            metrics.observe_timings({stage: analysis_results_obj['timings'].get(stage) for stage in ('graph_layout', 'export')})
+            app.logger.info(f"默认分析结果已保存到 {_store_dir(game)} (版本 {version})")
+            if live_updates.has_subscribers(game['id']):
+                _publish_store_update(game, previous_store)
+            return True
+        except analysis_jobs.JobCancelled:
+            app.logger.info("默认分析已取消，保留上一次的缓存结果。")
+            raise
+        except Exception as e:
+            app.logger.error(f"执行并缓存默认分析时出错: {e}", exc_info=True)
+            return False
+
+def _publish_store_update(game, previous_store):
+    """
+    把比赛的列式存储从 previous_store 到当前版本的变化推送给实时更新的订阅者 ('update' 事件):
+    有变化的选手对的摘要 ('pairs'，不再计算的选手对只有 'pair_names' 和 'removed')、
+    达到阈值的边 ('edges'，新增或得分变化) 和不再是边的选手对 ('edges_removed')。
+    选手集合变化或变化太多时 'reset' 为 True，不附带选手对，前端应重新查询。推送失败不影响分析结果。
+    """
+    try:
+        store = result_store.open_result_store(_store_dir(game))
+        with metrics.timed('live_diff'):
+            diff = result_store.diff_stores(previous_store, store)
+        payload = {
+            'game': game['id'],
+            'version': store['version'],
+            'data_version': store['meta'].get('data_version'),
+            'calculation_time_iso': store['meta'].get('calculation_time_iso'),
+            'reset': diff['reset'] or len(diff['changed']) > LIVE_MAX_PUSH_PAIRS,
+            'changed_pairs': None if diff['reset'] else len(diff['changed']),
+            'pairs': [],
+            'edges': [],
+            'edges_removed': []
+        }
+        if not payload['reset']:
+            for condensed in diff['changed']:
+                pair = result_store.pair_summary(store, int(condensed))
+                if pair is None:
+                    rows, cols = result_store.condensed_to_positions(store['n_users'], [condensed])
+                    names = (store['user_names'][int(rows[0])], store['user_names'][int(cols[0])])
+                    payload['pairs'].append({'pair_names': names, 'removed': True})
+                    continue
+                payload['pairs'].append(pair)
+                if store['edge'][condensed]:
+                    payload['edges'].append(result_store.edge_from_pair(pair))
+            for condensed in diff['edges_removed']:
+                rows, cols = result_store.condensed_to_positions(store['n_users'], [condensed])
+                payload['edges_removed'].append({'source': store['user_names'][int(rows[0])],
+                                                 'target': store['user_names'][int(cols[0])]})
+            payload['pairs'].sort(key=lambda pair: -(pair.get('overall_similarity_heuristic') or 0.0))
+        live_updates.publish(game['id'], 'update', payload)
     except Exception as e:
-        app.logger.error(f"执行并缓存默认分析时出错: {e}", exc_info=True)
+        app.logger.error(f"推送比赛 {game['id']} 的实时更新出错: {e}", exc_info=True)
+
+def _job_url(job_id):
+    return f"/api/jobs/{job_id}"
+
+JOB_RETRY_AFTER_SECONDS = 10 # 任务队列已满时建议客户端等待的秒数
+
+def _submit_job_response(message, kind, func, *args, dedupe_key=None):
+    """提交后台任务并返回 202 响应；任务队列已满时返回 503。"""
+    try:
+        job_id, coalesced = analysis_jobs.submit_job(kind, func, *args, dedupe_key=dedupe_key)
+    except analysis_jobs.JobQueueFull:
+        response = jsonify({"error": "服务器繁忙，排队的任务已达上限，请稍后重试。"})
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+        return response, 503
+    if coalesced:
+        message = '相同的任务正在执行，已加入该任务，完成后返回同一结果。'
+    return jsonify({
+        'message': message,
+        'job_id': job_id,
+        'coalesced': coalesced,
+        'status_url': _job_url(job_id)
+    }), 202
+
+def _default_analysis_is_current(game, data_version):
+    """比赛缓存的预计算结果是否已基于该数据版本、以当前的默认参数计算 (不影响结果的参数除外)。"""
+    if data_version is None:
+        return False
+    try:
+        meta = result_store.read_store_meta(_store_dir(game))
+    except (IOError, ValueError):
+        return False
+    if not meta or meta.get('data_version') != data_version:
         return False
+    cached_params = meta.get('params_used') or {}
+    return data_cache.analysis_cache_key(cached_params, cached_params.get("min_user_score", 0), data_version) == \
+        data_cache.analysis_cache_key(DEFAULT_ANALYSIS_PARAMS, DEFAULT_ANALYSIS_PARAMS.get("min_user_score", 0), data_version)
 
-@app.route('/api/fetch_data', methods=['POST'])
-def force_fetch_data():
-    # 这个接口现在只负责获取最新的 scoreboard_data.json
-    # 预计算分析将在获取成功后异步触发或由独立机制调用
-    data, fetch_time_str_from_fetcher = data_fetcher.get_scoreboard_data(force_refresh=True)
-    
-    response_message = ""
-    fetch_time_for_response = ""
-
-    if data:
-        # 原始数据获取成功，现在触发后台预计算
-        app.logger.info("原始数据获取成功，准备触发后台默认分析...")
-        
-        # 为了不阻塞此请求，实际生产中可以将 _perform_and_cache_default_analysis() 放入后台任务队列
-        # 这里为了简单，我们同步调用，但前端可能需要等待或得到一个“正在后台处理”的消息
-        analysis_cached_ok = _perform_and_cache_default_analysis() # 同步执行
-        
+def _analyze_fetched_game(report, game, data, fetch_time_str_from_fetcher):
+    """
+    获取比赛数据之后执行默认分析并缓存；服务器数据未变化 (数据版本不变) 且预计算结果已基于该版本时，跳过分析。
+    返回: {'game', 'message', 'fetch_time_iso', 'data_changed'}，获取失败时为 {'game', 'error'}。
+    """
+    if not data:
+        # fetch_time_str_from_fetcher 在失败时可能包含错误信息
+        return {'game': game['id'], 'error': f'原始数据获取失败: {fetch_time_str_from_fetcher}'}
+
+    data_changed = not _default_analysis_is_current(game, data_cache.scoreboard_version(data))
+    if not data_changed:
+        app.logger.info(f"比赛 {game['id']} 的原始数据未变化，跳过默认分析。")
+        response_message = '原始数据未变化，沿用已缓存的预计算结果。'
+    else:
+        # 原始数据获取成功，执行默认分析
+        app.logger.info(f"比赛 {game['id']} 的原始数据获取成功，开始执行默认分析...")
+        report("analyze")
+        analysis_cached_ok = _perform_and_cache_default_analysis(
+            game, lambda done, total: report("analyze", done, total)
+        )
         response_message = '原始数据获取成功。' + \
                            ("后台默认分析已完成并缓存。" if analysis_cached_ok else "后台默认分析执行失败，请检查服务器日志。")
-        
-        # fetch_time_str_from_fetcher 是格式化好的，或者我们从data中重新获取时间戳并格式化
-        raw_fetch_ts = data.get('fetch_timestamp_utc', 0)
-        if raw_fetch_ts > 0:
-            fetch_time_for_response = datetime.fromtimestamp(raw_fetch_ts, timezone.utc).isoformat()
-        else:
-            fetch_time_for_response = "N/A (时间戳无效)"
-            
-        return jsonify({
-            'message': response_message,
-            'fetch_time_iso': fetch_time_for_response # 返回原始数据的获取时间 (ISO格式)
-        })
+
+    # fetch_time_str_from_fetcher 是格式化好的，或者我们从data中重新获取时间戳并格式化
+    raw_fetch_ts = data.get('fetch_timestamp_utc', 0)
+    if raw_fetch_ts > 0:
+        fetch_time_for_response = datetime.fromtimestamp(raw_fetch_ts, timezone.utc).isoformat()
     else:
-        # fetch_time_str_from_fetcher 在失败时可能包含错误信息
-        return jsonify({'message': f'原始数据获取失败: {fetch_time_str_from_fetcher}', 'fetch_time_iso': None}), 500
+        fetch_time_for_response = "N/A (时间戳无效)"
+    return {
+        'game': game['id'],
+        'message': response_message,
+        'fetch_time_iso': fetch_time_for_response, # 返回原始数据的获取时间 (ISO格式)
+        'data_changed': data_changed # 是否执行了新的默认分析 (实时更新的轮询据此调整间隔)
+    }
 
+def _fetch_and_analyze_job(report, game_ids):
+    """
+    后台任务: 获取 game_ids 中各比赛的最新 scoreboard 数据 (多个比赛并发获取)，然后依次执行默认分析并缓存
+    (分析本身已按 parallel_workers 并行，依次执行避免多个比赛争抢 CPU)。
+    只有一个比赛时返回该比赛的结果，获取失败时任务失败；
+    多个比赛时返回 {'message', 'games': {比赛ID: 该比赛的结果}}，部分比赛失败不影响其他比赛。
+    """
+    report("fetch")
+    fetched = data_fetcher.get_scoreboard_data_for_games(game_ids, force_refresh=True)
+    game_results = {
+        game_id: _analyze_fetched_game(report, data_fetcher.get_game(game_id), data, fetch_time_str)
+        for game_id, (data, fetch_time_str) in fetched.items()
+    }
+    if len(game_results) == 1:
+        result = next(iter(game_results.values()))
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result
+    failed = [game_id for game_id, result in game_results.items() if 'error' in result]
+    message = f"已刷新 {len(game_results) - len(failed)} 个比赛。" + (f" 获取失败: {', '.join(failed)}" if failed else "")
+    return {'message': message, 'games': game_results}
 
-@app.route('/api/status', methods=['GET'])
-def get_status():
+@app.route('/api/fetch_data', methods=['POST'])
+def force_fetch_data():
+    """
+    提交后台任务: 获取比赛 (查询参数 game；game=all 时为全部比赛，并发获取) 最新的计分板数据并更新预计算。
+    立即返回 202 和任务ID，进度和结果 ('message'、'fetch_time_iso') 通过 /api/jobs/<job_id> 查询。
+    """
+    game_ids = [g.game['id']] if g.game is not None else [game['id'] for game in data_fetcher.list_games()]
+    # 刷新在执行时再次点击刷新，加入正在执行的任务 (它完成时数据已是最新的)
+    dedupe_key = f"fetch_data:{g.game['id'] if g.game is not None else ALL_GAMES}"
+    return _submit_job_response('数据刷新任务已提交，后台将获取数据并执行预计算。',
+                                "fetch_data", _fetch_and_analyze_job, game_ids, dedupe_key=dedupe_key)
+
+def _live_poll(game_id):
+    """
+    实时更新的一次轮询: 提交与“刷新服务器数据”相同的任务 (同一比赛的轮询和手动刷新合并为一个任务)，等待其结束。
+    返回数据是否有变化；任务失败、被取消或队列已满时抛出异常。
+    """
+    job_id, _ = analysis_jobs.submit_job("fetch_data", _fetch_and_analyze_job, [game_id],
+                                         dedupe_key=f"fetch_data:{game_id}")
+    job = analysis_jobs.wait_job(job_id)
+    if job is None or job['status'] != "succeeded":
+        raise RuntimeError(job.get('error') or job['status'] if job else "任务已被丢弃")
+    return (job.get('result') or {}).get('data_changed', False) # 结果已过期时按未变化处理
+
+@app.route('/api/live', methods=['GET'])
+def live_events():
+    """
+    Server-Sent Events: 订阅比赛 (查询参数 game) 的实时更新，并在订阅期间后台轮询该比赛的计分板 (间隔自适应)。
+    事件: 'status' (连接时的结果版本和轮询状态)、'poll' (每次轮询后)、'update' (预计算结果有新版本，见 _publish_store_update)、
+    'reset' (积压的事件被丢弃，应重新查询)。
+    """
+    game = g.game
+    subscriber = live_updates.subscribe(game['id'], poll=_live_poll)
+    initial = dict(live_updates.poller_status(game['id']), version=result_store.current_version(_store_dir(game)))
+    response = Response(stream_with_context(live_updates.stream_events(game['id'], subscriber, ('status', initial))),
+                        mimetype="text/event-stream")
+    response.headers['Cache-Control'] = "no-cache"
+    response.headers['X-Accel-Buffering'] = "no" # 经 nginx 反向代理时不缓冲
+    return response
+
+@app.route('/api/jobs', methods=['GET'])
+def list_analysis_jobs():
+    """列出保留的后台任务 (不含结果)。"""
+    return jsonify({'jobs': analysis_jobs.list_jobs()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """
+    查询后台任务的状态: 'status' (queued/running/cancelling/succeeded/failed/cancelled)、
+    'progress' ({'stage', 'done', 'total'})、'error'，成功结束时包含 'result'
+    (结果只保留到每个请求都取到一次或超时，之后为 'result_expired': true，需重新提交)。
+    """
+    job = analysis_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在或已过期"}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_analysis_job(job_id):
+    """取消排队中或执行中的后台任务 (执行中的分析在下一次报告进度时中止)。"""
+    job = analysis_jobs.cancel_job(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在或已过期"}), 404
+    return jsonify(job)
+
+
+def _game_status(game):
+    """比赛的原始数据和预计算结果的状态 (只读取元数据文件，不解析计分板数据、不加载分数数组)。"""
     scoreboard_fetch_time_iso = "N/A"
     scoreboard_source_info = "原始数据状态未知"
     
-    if os.path.exists(SCOREBOARD_DATA_FILE): # 使用从 data_fetcher 导入的常量
-        try:
-            with open(SCOREBOARD_DATA_FILE, 'r', encoding='utf-8') as f:
-                s_data = json.load(f)
-            s_fetch_ts = s_data.get('fetch_timestamp_utc', 0)
+    scoreboard_data_version = None
+    try:
+        s_meta = data_fetcher.read_scoreboard_meta(game['id']) # 只读元数据文件，不解析计分板数据
+        if s_meta is not None:
+            s_fetch_ts = s_meta.get('fetch_timestamp_utc', 0)
+            scoreboard_data_version = s_meta.get('data_version')
             if s_fetch_ts > 0:
                 s_utc_dt = datetime.fromtimestamp(s_fetch_ts, timezone.utc)
                 scoreboard_fetch_time_iso = s_utc_dt.isoformat()
                 scoreboard_source_info = '已缓存的原始数据'
             else:
                 scoreboard_source_info = '缓存的原始数据时间戳无效'
-        except Exception as e:
-            app.logger.error(f"读取原始数据缓存 ({SCOREBOARD_DATA_FILE}) 出错: {e}")
-            scoreboard_source_info = '读取原始数据缓存错误'
+    except Exception as e:
+        app.logger.error(f"读取原始数据缓存 ({game['data_file']}) 出错: {e}")
+        scoreboard_source_info = '读取原始数据缓存错误'
 
     analysis_calc_time_iso = "N/A"
     analysis_params_used = None
+    analysis_timings = None
     analysis_source_info = "无预计算的分析结果"
 
-    if os.path.exists(ANALYSIS_RESULTS_FILE):
-        try:
-            with open(ANALYSIS_RESULTS_FILE, 'r', encoding='utf-8') as f:
-                analysis_cache = json.load(f)
-            analysis_calc_time_iso = analysis_cache.get('calculation_time_iso', "N/A")
-            analysis_params_used = analysis_cache.get('params_used')
+    try:
+        analysis_meta = _store_status_meta(game) # 只读元数据，不加载分数数组
+        if analysis_meta is not None:
+            analysis_calc_time_iso = analysis_meta.get('calculation_time_iso', "N/A")
+            analysis_params_used = analysis_meta.get('params_used')
+            analysis_timings = analysis_meta.get('timings')
             analysis_source_info = '已缓存的预计算分析结果'
-        except Exception as e:
-            app.logger.error(f"读取分析结果缓存 ({ANALYSIS_RESULTS_FILE}) 出错: {e}")
-            analysis_source_info = '读取分析结果缓存错误'
+    except Exception as e:
+        app.logger.error(f"读取分析结果缓存 ({_store_dir(game)}) 出错: {e}")
+        analysis_source_info = '读取分析结果缓存错误'
             
-    return jsonify({
+    return {
+        'game': {'id': game['id'], 'name': game['name']},
         'last_data_fetch_time_iso': scoreboard_fetch_time_iso, # 原始计分板数据的获取时间
         'scoreboard_source_info': scoreboard_source_info,
+        'scoreboard_data_version': scoreboard_data_version, # 获取时间戳 + 内容哈希
         'last_analysis_time_iso': analysis_calc_time_iso,   # 预计算分析结果的生成时间
         'default_analysis_params_used': analysis_params_used, # 预计算时使用的参数
-        'analysis_source_info': analysis_source_info
-    })
+        'last_analysis_timings': analysis_timings, # 预计算时各阶段的耗时 (秒)
+        'analysis_source_info': analysis_source_info,
+        'live': live_updates.poller_status(game['id']) # 实时更新的订阅者和轮询状态
+    }
+
+def _revalidated_response(response, etag, endpoint):
+    """
+    设置强 ETag 和 Cache-Control: no-cache (浏览器可以缓存，但每次使用前向服务器验证)；
+    请求的 If-None-Match 与 ETag 匹配时把 response 改为 304，不发送响应体，
+    但保留 Vary 等表示相关的头部 (共享缓存据此区分 gzip 和未压缩的表示)。
+    """
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        response.set_data(b"")
+        response.headers.pop('Content-Encoding', None)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = "no-cache"
+    metrics.inc('conditional_responses', endpoint=endpoint, result="not_modified" if response.status_code == 304 else "full")
+    return response
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """查询参数 game 指定的比赛的状态，以及进程内缓存的统计 (所有比赛共用)。内容未变化时对 If-None-Match 返回 304。"""
+    response = jsonify(dict(_game_status(g.game), data_cache_stats=data_cache.cache_stats()))
+    return _revalidated_response(response, hashlib.sha256(response.get_data()).hexdigest(), "status")
+
+@app.route('/api/games', methods=['GET'])
+def list_configured_games():
+    """列出配置的全部比赛及其状态 (第一个为未指定 game 时使用的默认比赛)。"""
+    return jsonify({'games': [_game_status(game) for game in data_fetcher.list_games()]})
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def _directory_size(path):
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        total += sum(_file_size(os.path.join(dir_path, name)) or 0 for name in file_names)
+    return total
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的运行指标: 各阶段耗时、获取/分析/缓存计数器，以及数据文件大小、缓存和任务的当前状态。"""
+    data_sizes, store_sizes = [], []
+    for game in data_fetcher.list_games():
+        data_size = _file_size(game['data_file'])
+        if data_size is not None:
+            data_sizes.append(({'game': game['id']}, data_size))
+        store_version = result_store.current_version(_store_dir(game))
+        if store_version is not None:
+            store_sizes.append(({'game': game['id']}, _directory_size(os.path.join(_store_dir(game), store_version))))
+    gauges = [("scoreboard_file_bytes", "计分板数据文件的大小", data_sizes),
+              ("analysis_store_bytes", "预计算结果当前版本的大小 (列式存储)", store_sizes)]
+    cache_stats = data_cache.cache_stats()
+    gauges.append(("cache_entries", "进程内缓存的条目数", [({'cache': "preprocess"}, cache_stats['preprocessed_entries']),
+                                                       ({'cache': "result"}, cache_stats['result_entries'])]))
+    gauges.append(("result_cache_bytes", "按需分析结果缓存的估算大小", [({}, cache_stats['result_bytes'])]))
+    job_counts = {}
+    for job in analysis_jobs.list_jobs():
+        job_counts[job['status']] = job_counts.get(job['status'], 0) + 1
+    gauges.append(("jobs", "后台任务数 (按状态)", [({'status': status}, count) for status, count in sorted(job_counts.items())]))
+    gauges.append(("live_poll_interval_seconds", "实时更新当前的轮询间隔 (按比赛)", live_updates.poll_interval_gauges()))
+    return Response(metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.route('/api/get_cached_analysis', methods=['GET'])
 def get_cached_analysis():
-    if os.path.exists(ANALYSIS_RESULTS_FILE):
-        try:
-            with open(ANALYSIS_RESULTS_FILE, 'r', encoding='utf-8') as f:
-                analysis_data = json.load(f)
+    # 返回列式存储的完整导出 (大型比赛时体积很大，前端应优先使用 /api/pairs 分页查询)。
+    # 导出在生成预计算结果时已序列化并以 gzip 压缩 (result_store.read_export)，客户端接受 gzip 时直接返回压缩文件；
+    # ETag 不变时对 If-None-Match 返回 304
+    try:
+        export = result_store.read_export(_store_dir(g.game))
+        if export is not None:
             # 返回的是包含 'params_used', 'calculation_time_iso', 'results' 的整个对象
-            return jsonify(analysis_data) 
-        except Exception as e:
-            app.logger.error(f"读取或发送分析缓存文件 ({ANALYSIS_RESULTS_FILE}) 失败: {e}", exc_info=True)
-            return jsonify({"error": "读取分析缓存失败", "details": str(e)}), 500
-    else:
-        return jsonify({"error": "尚无缓存的分析结果，请先刷新服务器数据以生成。", 
-                        "results": None, 
-                        "params_used": None, 
-                        "calculation_time_iso": None}), 404
+            export_path, etag = export
+            accepts_gzip = request.accept_encodings['gzip'] > 0
+            etag = f"{etag}-gzip" if accepts_gzip else etag # 强 ETag 区分压缩和未压缩的表示
+            response = Response(mimetype="application/json")
+            if not request.if_none_match.contains(etag):
+                with open(export_path, 'rb') as f:
+                    body = f.read()
+                response.set_data(body if accepts_gzip else gzip.decompress(body))
+                if accepts_gzip:
+                    response.headers['Content-Encoding'] = "gzip"
+            response.vary.add('Accept-Encoding')
+            return _revalidated_response(response, etag, "get_cached_analysis")
+    except Exception as e:
+        app.logger.error(f"读取或导出分析缓存 ({_store_dir(g.game)}) 失败: {e}", exc_info=True)
+        return jsonify({"error": "读取分析缓存失败", "details": str(e)}), 500
+    return jsonify({"error": "尚无缓存的分析结果，请先刷新服务器数据以生成。", 
+                    "results": None, 
+                    "params_used": None, 
+                    "calculation_time_iso": None}), 404
 
-@app.route('/api/analyze', methods=['POST']) # 这个接口现在用于“按需重新计算”
-def analyze_data_on_demand():
-    frontend_params = request.json
-    if not frontend_params:
-        return jsonify({"error": "请求体必须是 JSON 格式"}), 400
+@app.route('/api/pairs', methods=['GET'])
+def query_cached_pairs():
+    """
+    分页查询缓存的选手对 (只返回表格所需的标量数据)。
+    查询参数: user (选手名)、min_<排序键> (如 min_overall、min_jaccard)、sort (排序键，默认 overall)、
+    order (desc/asc)、cursor (上一页返回的 next_cursor)、limit (每页数量)。
+    """
+    try:
+        index = _get_cached_pair_index(g.game)
+    except Exception as e:
+        app.logger.error(f"建立分析结果索引失败: {e}", exc_info=True)
+        return jsonify({"error": "读取分析缓存失败", "details": str(e)}), 500
+    if index is None:
+        return jsonify({"error": "尚无缓存的分析结果，请先刷新服务器数据以生成。"}), 404
 
-    app.logger.info(f"收到按需分析请求，参数: {frontend_params}")
+    try:
+        min_scores = {
+            key: float(request.args[f"min_{key}"])
+            for key in result_index.PAIR_SORT_KEYS if request.args.get(f"min_{key}")
+        }
+        page = result_index.query_pairs(
+            index,
+            user_name=request.args.get('user', '').strip() or None,
+            min_scores=min_scores,
+            sort_key=request.args.get('sort', 'overall'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            cursor=request.args.get('cursor') or None,
+            limit=int(request.args.get('limit', result_index.DEFAULT_PAGE_SIZE))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    page.update({
+        'params_used': index['params_used'],
+        'calculation_time_iso': index['calculation_time_iso'],
+        'total_pairs': index['pair_count'],
+        'pair_stats': index['pair_stats']
+    })
+    return jsonify(page)
+
+@app.route('/api/pairs/<int:position>', methods=['GET'])
+def get_cached_pair_details(position):
+    """
+    返回缓存结果中一个选手对的完整数据 (含时间线等详情)，position 来自 /api/pairs 的结果行。
+    存储中只有标量分数，详情按预计算使用的参数按需计算后合并。
+    """
+    index = _get_cached_pair_index(g.game)
+    if index is None:
+        return jsonify({"error": "尚无缓存的分析结果，请先刷新服务器数据以生成。"}), 404
+    if position >= index['pair_count']:
+        return jsonify({"error": "选手对不存在，分析结果可能已更新"}), 404
+    pair = result_index.pair_summary_at(index, position)
+
+    params_used = index['params_used'] or DEFAULT_ANALYSIS_PARAMS
+    try:
+        details, error = _get_pair_details(
+            g.game, str(pair['pair_ids'][0]), str(pair['pair_ids'][1]),
+            params_used.get("time_proximity_seconds", 300), params_used.get("min_user_score", 0)
+        )
+    except Exception as e:
+        app.logger.error(f"计算选手对详情时出错: {e}", exc_info=True)
+        return jsonify({"error": f"计算选手对详情时出错: {str(e)}"}), 500
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    return jsonify(dict(pair, **details))
+
+@app.route('/api/neighbors', methods=['GET'])
+def query_cached_neighbors():
+    """
+    查询缓存结果中与某位选手最相似的 k 位选手 (使用预先建立的邻居索引，不重新分析)。
+    查询参数: user (选手名) 或 user_id、method (排序依据的方法，默认 overall)、k (默认 20)、
+    min_score (可选，该方法得分的下限)、details (默认 1，为返回的 k 对按需计算时间线等详情；0 表示只返回分数)。
+    """
+    user_name = request.args.get('user', '').strip() or None
+    user_id = request.args.get('user_id', '').strip() or None
+    if not user_name and not user_id:
+        return jsonify({"error": "必须提供 user 或 user_id"}), 400
+    index = _get_cached_pair_index(g.game)
+    if index is None:
+        return jsonify({"error": "尚无缓存的分析结果，请先刷新服务器数据以生成。"}), 404
+
+    try:
+        min_score = request.args.get('min_score')
+        result = result_index.query_neighbors(
+            index, user_name=user_name, user_id=user_id,
+            method=request.args.get('method', 'overall'),
+            k=int(request.args.get('k', result_index.DEFAULT_NEIGHBORS)),
+            min_score=float(min_score) if min_score else None
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get('details', '1') != '0':
+        params_used = index['params_used'] or DEFAULT_ANALYSIS_PARAMS
+        for position, item in enumerate(result['items']):
+            try:
+                details, error = _get_pair_details(
+                    g.game, str(item['pair_ids'][0]), str(item['pair_ids'][1]),
+                    params_used.get("time_proximity_seconds", 300), params_used.get("min_user_score", 0)
+                )
+            except Exception as e:
+                app.logger.error(f"计算选手对详情时出错: {e}", exc_info=True)
+                return jsonify({"error": f"计算选手对详情时出错: {str(e)}"}), 500
+            if error:
+                return jsonify({"error": error[0]}), error[1]
+            result['items'][position] = dict(item, **details)
+
+    result.update({
+        'method': request.args.get('method', 'overall'),
+        'params_used': index['params_used'],
+        'calculation_time_iso': index['calculation_time_iso']
+    })
+    return jsonify(result)
+
+@app.route('/api/pair_details', methods=['GET'])
+def get_pair_details():
+    """
+    按需计算一对选手的详情 (时间线、逐题 Z-score、时间接近的提交)。
+    查询参数: user1, user2 (选手ID)、time_proximity_seconds (默认 300)、min_user_score (默认 0)，
+    后两者应与生成该对结果的分析参数一致。
+    """
+    user1_id, user2_id = request.args.get('user1'), request.args.get('user2')
+    if not user1_id or not user2_id:
+        return jsonify({"error": "必须提供 user1 和 user2"}), 400
+    try:
+        time_proximity_seconds = float(request.args.get('time_proximity_seconds', DEFAULT_ANALYSIS_PARAMS["time_proximity_seconds"]))
+        min_user_score = float(request.args.get('min_user_score', 0))
+    except ValueError:
+        return jsonify({"error": "time_proximity_seconds 和 min_user_score 必须是数字"}), 400
+    if time_proximity_seconds.is_integer():
+        time_proximity_seconds = int(time_proximity_seconds)
+    if min_user_score.is_integer():
+        min_user_score = int(min_user_score)
+
+    try:
+        details, error = _get_pair_details(g.game, user1_id, user2_id, time_proximity_seconds, min_user_score)
+    except Exception as e:
+        app.logger.error(f"计算选手对详情时出错: {e}", exc_info=True)
+        return jsonify({"error": f"计算选手对详情时出错: {str(e)}"}), 500
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    return jsonify(details)
+
+@app.route('/api/graph', methods=['GET'])
+def get_cached_graph():
+    """
+    返回缓存结果的关系图数据，边按 min_weight (默认 0) 和 user (可选) 在服务端筛选。
+    节点带有预先计算的坐标和社区；collapse=1 时每个社区折叠为一个节点 (见 result_index.query_graph)。
+    """
+    index = _get_cached_pair_index(g.game)
+    if index is None:
+        return jsonify({"error": "尚无缓存的分析结果，请先刷新服务器数据以生成。"}), 404
+    try:
+        min_weight = float(request.args.get('min_weight', 0) or 0)
+    except ValueError:
+        return jsonify({"error": "min_weight 必须是数字"}), 400
+    collapse = request.args.get('collapse', '0').lower() in ("1", "true", "yes")
+    return jsonify(result_index.query_graph(index, min_weight, request.args.get('user', '').strip() or None, collapse))
+
+def _normalize_frontend_value(value):
+    """前端参数的规范形式: 字符串去掉首尾空白，整数值的浮点数转换为整数 (300.0 与 300 相同)，列表中的各项同样处理并去重。"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, list):
+        return list(dict.fromkeys(_normalize_frontend_value(item) for item in value))
+    return value
+
+def _engine_params_from_frontend(frontend_params):
+    """
+    从 frontend_params 中提取 run_analysis 需要的参数 (min_user_score 在 preprocess_data 中使用，不包含在内)。
+    参数在这里规范化一次 (见 _normalize_frontend_value，空的目标用户名视为未指定)，
+    传给分析引擎和用于结果缓存键的是同一份参数。
+    """
+    params = {
+        "methods": frontend_params.get("methods", DEFAULT_ANALYSIS_PARAMS["methods"]), # 如果前端没传，用默认的
+        "time_proximity_seconds": frontend_params.get("time_proximity_seconds", DEFAULT_ANALYSIS_PARAMS["time_proximity_seconds"]),
+        "min_similarity_threshold": frontend_params.get("min_similarity_threshold", DEFAULT_ANALYSIS_PARAMS["min_similarity_threshold"]),
+        "edge_policy": frontend_params.get("edge_policy", DEFAULT_ANALYSIS_PARAMS["edge_policy"]),
+        "edge_top_k": frontend_params.get("edge_top_k", DEFAULT_ANALYSIS_PARAMS["edge_top_k"]),
+        "edge_keep_above": frontend_params.get("edge_keep_above", DEFAULT_ANALYSIS_PARAMS["edge_keep_above"]),
+        "edge_backbone_alpha": frontend_params.get("edge_backbone_alpha", DEFAULT_ANALYSIS_PARAMS["edge_backbone_alpha"]),
+        "min_common_solves": frontend_params.get("min_common_solves", DEFAULT_ANALYSIS_PARAMS["min_common_solves"]),
+        "sequence_metric": frontend_params.get("sequence_metric", DEFAULT_ANALYSIS_PARAMS["sequence_metric"]),
+        "target_username": frontend_params.get("target_username", None),
+        "detail_level": frontend_params.get("detail_level", DEFAULT_ANALYSIS_PARAMS["detail_level"]),
+        # 并行度由服务器配置决定，不接受前端传入
+        "parallel_workers": DEFAULT_ANALYSIS_PARAMS["parallel_workers"],
+        "parallel_shard_rows": DEFAULT_ANALYSIS_PARAMS["parallel_shard_rows"]
+    }
+    params = {key: _normalize_frontend_value(value) for key, value in params.items()}
+    params["target_username"] = params["target_username"] or None
+    return params
 
-    raw_data, _ = data_fetcher.get_scoreboard_data(force_refresh=False) # 使用当前缓存的scoreboard数据
+def _on_demand_analysis_job(report, game, frontend_params):
+    """
+    后台任务: 使用比赛当前缓存的 scoreboard 数据和前端参数执行一次分析。
+    相同数据版本和相同 (规范化后) 参数的结果从缓存返回，结果中的 'cache' 说明是否命中。
+    """
+    report("load")
+    timings = {} # 本次执行的各阶段耗时 (命中结果缓存时为空)
+    with metrics.timed('load', timings):
+        raw_data, _ = data_fetcher.get_scoreboard_data(force_refresh=False, game_id=game['id']) # 使用当前缓存的scoreboard数据
     if not raw_data:
-        raw_data_fetch_time_iso = "N/A"
-        try: # 尝试从已失效的raw_data中获取时间戳
-            raw_data_fetch_time_iso = datetime.fromtimestamp(raw_data.get('fetch_timestamp_utc',0), timezone.utc).isoformat() if raw_data.get('fetch_timestamp_utc',0) > 0 else "N/A"
-        except: pass
-        return jsonify({"error": f"加载计分板数据失败，无法进行按需分析。", "data_fetch_time_iso": raw_data_fetch_time_iso }), 500
+        raise RuntimeError("加载计分板数据失败，无法进行按需分析。")
     
     raw_data_fetch_time_iso = datetime.fromtimestamp(raw_data['fetch_timestamp_utc'], timezone.utc).isoformat()
 
 
-    min_user_score_from_frontend = frontend_params.get("min_user_score", 0)
+    min_user_score_from_frontend = _normalize_frontend_value(frontend_params.get("min_user_score", 0))
+    run_params_for_engine = _engine_params_from_frontend(frontend_params)
+    data_version = data_cache.scoreboard_version(raw_data)
+    cache_key = data_cache.analysis_cache_key(run_params_for_engine, min_user_score_from_frontend, data_version)
+    cached_output = data_cache.get_cached_result(cache_key)
+    if cached_output is not None:
+        app.logger.info(f"按需分析命中结果缓存 ({cache_key[:12]})")
+        return dict(cached_output, analysis_parameters=frontend_params,
+                    cache={'hit': True, 'key': cache_key, 'data_version': data_version})
     
     try:
-        contestant_data, rarity_weights, all_challenges_info, _ = \
-            analysis_engine.preprocess_data(raw_data, min_user_score=min_user_score_from_frontend)
+        report("preprocess")
+        (contestant_data, rarity_weights, all_challenges_info, _), used_data = \
+            data_fetcher.get_preprocessed_scoreboard(raw_data, min_user_score_from_frontend, timings=timings)
+        if used_data is not raw_data: # 数据文件在此期间被新数据替换，结果按新数据的版本缓存
+            raw_data = used_data
+            raw_data_fetch_time_iso = datetime.fromtimestamp(raw_data['fetch_timestamp_utc'], timezone.utc).isoformat()
+            data_version = data_cache.scoreboard_version(raw_data)
+            cache_key = data_cache.analysis_cache_key(run_params_for_engine, min_user_score_from_frontend, data_version)
         if not contestant_data:
-             return jsonify({
+             return {
                  "message": "按需分析：根据您的筛选，未找到活跃选手。", 
                  "data_fetch_time_iso": raw_data_fetch_time_iso,
                  "analysis_parameters": frontend_params, # 返回的是用于本次计算的前端参数
                  "results": {'similar_pairs': [], 'network_nodes': [], 'network_edges': [], 'message': '按需分析：预处理后无活跃选手数据'}
-            })
-        
-        # 从 frontend_params 中提取 run_analysis 需要的参数
-        run_params_for_engine = {
-            "methods": frontend_params.get("methods", DEFAULT_ANALYSIS_PARAMS["methods"]), # 如果前端没传，用默认的
-            "time_proximity_seconds": frontend_params.get("time_proximity_seconds", DEFAULT_ANALYSIS_PARAMS["time_proximity_seconds"]),
-            "min_similarity_threshold": frontend_params.get("min_similarity_threshold", DEFAULT_ANALYSIS_PARAMS["min_similarity_threshold"]),
-            "target_username": frontend_params.get("target_username", None)
-            # min_user_score 已经在 preprocess_data 中使用，不传入 run_analysis
-        }
+            }
 
+        report("analyze")
         on_demand_results_obj = analysis_engine.run_analysis(
             contestant_data,
             rarity_weights,
             all_challenges_info,
-            run_params_for_engine 
+            run_params_for_engine,
+            lambda done, total: report("analyze", done, total)
         )
-        return jsonify({
+        _record_analysis_metrics("on_demand", game, on_demand_results_obj)
+        on_demand_results_obj['timings'] = dict(timings, **on_demand_results_obj.get('timings', {}))
+        output = {
             "message": "按需分析完成",
             "data_fetch_time_iso": raw_data_fetch_time_iso, # 使用的 scoreboard 的采集时间
             "analysis_parameters": frontend_params,     # 本次分析使用的参数
             "calculation_time_iso": datetime.now(timezone.utc).isoformat(), # 本次按需计算的时间
             "results": on_demand_results_obj
-        })
+        }
+        data_cache.put_cached_result(cache_key, data_version, output, game_id=game['id'])
+        return dict(output, cache={'hit': False, 'key': cache_key, 'data_version': data_version})
+    except analysis_jobs.JobCancelled:
+        app.logger.info("按需分析已取消。")
+        raise
     except Exception as e:
         app.logger.error(f"按需分析过程中出错: {e}", exc_info=True)
-        return jsonify({"error": f"按需分析过程中出错: {str(e)}"}), 500
+        raise RuntimeError(f"按需分析过程中出错: {str(e)}")
+
+@app.route('/api/analyze', methods=['POST']) # 这个接口现在用于“按需重新计算”
+def analyze_data_on_demand():
+    """
+    提交按需分析的后台任务，立即返回 202 和任务ID；
+    结果 ('results'、'analysis_parameters'、'calculation_time_iso' 等) 通过 /api/jobs/<job_id> 查询。
+    """
+    frontend_params = request.json
+    if not frontend_params:
+        return jsonify({"error": "请求体必须是 JSON 格式"}), 400
+
+    app.logger.info(f"收到按需分析请求，参数: {frontend_params}")
+    # 相同参数、相同数据版本的分析正在执行时，加入该任务而不是重复计算
+    dedupe_key = None
+    try:
+        s_meta = data_fetcher.read_scoreboard_meta(g.game['id'])
+    except Exception as e:
+        s_meta = None
+        app.logger.warn(f"读取原始数据元数据出错，本次请求不与其他请求合并: {e}")
+    if s_meta is not None:
+        cache_key = data_cache.analysis_cache_key(
+            _engine_params_from_frontend(frontend_params), _normalize_frontend_value(frontend_params.get("min_user_score", 0)),
+            s_meta.get('data_version')
+        )
+        dedupe_key = f"analyze:{g.game['id']}:{cache_key}" if cache_key else None
+    return _submit_job_response('按需分析任务已提交。', "analyze", _on_demand_analysis_job, g.game, frontend_params,
+                                dedupe_key=dedupe_key)
 
 # --- 原有的静态文件服务路由 ---
 @app.route('/')
@@ -246,13 +901,14 @@ if __name__ == '__main__':
         logging.basicConfig(level=logging.INFO)
     app.logger.info("Flask 应用准备启动...")
     
-    # # 首次启动时，如果分析结果文件不存在，并且原始数据文件存在，则尝试触发一次默认分析
-    # if not os.path.exists(ANALYSIS_RESULTS_FILE):
-    #     app.logger.info(f"{ANALYSIS_RESULTS_FILE} 不存在，检查是否需要启动时预计算。")
-    #     if os.path.exists(SCOREBOARD_DATA_FILE):
-    #         app.logger.info(f"发现 {SCOREBOARD_DATA_FILE}，将在启动时执行一次默认分析。")
-    #         _perform_and_cache_default_analysis()
-    #     else:
-    #         app.logger.warn(f"原始计分板数据 ({SCOREBOARD_DATA_FILE}) 也不存在，无法在启动时执行默认分析。请先刷新一次服务器数据。")
+    # # 首次启动时，如果比赛的分析结果不存在，并且原始数据文件存在，则尝试触发一次默认分析
+    # for game in data_fetcher.list_games():
+    #     if result_store.current_version(_store_dir(game)) is None:
+    #         app.logger.info(f"{_store_dir(game)} 中没有分析结果，检查是否需要启动时预计算。")
+    #         if os.path.exists(game['data_file']):
+    #             app.logger.info(f"发现 {game['data_file']}，将在启动时执行一次默认分析。")
+    #             _perform_and_cache_default_analysis(game)
+    #         else:
+    #             app.logger.warn(f"原始计分板数据 ({game['data_file']}) 也不存在，无法在启动时执行默认分析。请先刷新一次服务器数据。")
             
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,210 @@
+# your_project_folder/benchmark.py
+# 在不同规模的合成计分板 (scoreboard_generator.py) 上分别测量预处理和每种分析方法的耗时与内存峰值，
+# 结果写入 JSON (每个 规模 x 阶段 一条记录，便于画出随规模变化的曲线)，
+# 并可与之前保存的结果比较，发现性能退化。
+# 用法:
+#   python benchmark.py --sizes 200,500,1000 -o benchmark_results.json
+#   python benchmark.py --sizes 200,500,1000 --baseline benchmark_results.json   # 有退化时退出码为 1
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import analysis_engine
+import scoreboard_generator
+import scoreboard_stream
+
+ALL_METHODS = ["jaccard", "weighted_jaccard", "sequence", "time_proximity", "time_diff_dist"]
+
+def _measure(func, repeat, track_memory):
+    """
+    执行 func repeat 次并计时；track_memory 时再执行一次，用 tracemalloc 记录内存峰值
+    (tracemalloc 会拖慢执行，因此不与计时混在一起；numpy 数组的内存也会被记录)。
+    返回: (最后一次的返回值, 各次耗时列表, 内存峰值 MB 或 None)
+    """
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()): # 分析引擎的进度输出
+            start = time.perf_counter()
+            result = func()
+            seconds.append(time.perf_counter() - start)
+    peak_mb = None
+    if track_memory:
+        result = None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = func()
+            peak_mb = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak_mb
+
+def _record(base, stage, seconds, peak_mb, **extra):
+    return dict(base, stage=stage, runs=len(seconds),
+                seconds_min=round(min(seconds), 4), seconds_median=round(statistics.median(seconds), 4),
+                peak_memory_mb=peak_mb, **extra)
+
+def planted_recall(similar_pairs, planted_clusters):
+    """综合得分最高的 P 对中 (P 为植入的组内选手对数) 植入的选手对所占的比例；没有植入小组时返回 None。"""
+    planted = {frozenset((a, b)) for group in planted_clusters for i, a in enumerate(group) for b in group[i + 1:]}
+    if not planted:
+        return None
+    top = [frozenset(pair['pair_ids']) for pair in similar_pairs[:len(planted)]]
+    return round(sum(1 for pair in top if pair in planted) / len(planted), 4)
+
+def run_size(n_teams, args):
+    """测量一个规模: 预处理 (字典 / 流式读取文件) 以及每种方法单独和全部方法一起的 run_analysis。"""
+    clusters = args.clusters if args.clusters is not None else max(1, n_teams // 100)
+    scoreboard, planted_clusters = scoreboard_generator.generate_scoreboard(
+        n_teams, args.challenges, seed=args.seed, time_distribution=args.distribution, clusters=clusters
+    )
+    base = {
+        'teams': n_teams,
+        'challenges': args.challenges,
+        'solves': sum(len(item['solvedChallenges']) for item in scoreboard['items']),
+        'distribution': args.distribution,
+        'planted_clusters': len(planted_clusters)
+    }
+    records = []
+
+    fd, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(scoreboard, f, ensure_ascii=False)
+        base['file_bytes'] = os.path.getsize(path)
+        outputs, seconds, peak_mb = _measure(
+            lambda: analysis_engine.preprocess_data(scoreboard, min_user_score=0), args.repeat, args.memory)
+        records.append(_record(base, "preprocess_data", seconds, peak_mb))
+        _, seconds, peak_mb = _measure(lambda: scoreboard_stream.preprocess_file(path), args.repeat, args.memory)
+        records.append(_record(base, "preprocess_stream", seconds, peak_mb))
+    finally:
+        os.remove(path)
+
+    contestant_data, rarity_weights, all_challenges_info, _ = outputs
+    base['users_analyzed'] = len(contestant_data)
+    params = {
+        "time_proximity_seconds": 300,
+        "min_similarity_threshold": args.threshold,
+        "min_common_solves": 1,
+        "sequence_metric": args.sequence_metric,
+        "detail_level": "summary",
+        "target_username": None,
+        "parallel_workers": args.workers
+    }
+    stages = [[method] for method in args.methods]
+    if len(args.methods) > 1:
+        stages.append(list(args.methods))
+    for methods in stages:
+        run_params = dict(params, methods=methods)
+        results, seconds, peak_mb = _measure(
+            lambda: analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, run_params),
+            args.repeat, args.memory)
+        extra = {'pairs': len(results.get('similar_pairs', []))}
+        if len(methods) > 1:
+            extra['planted_recall'] = planted_recall(results.get('similar_pairs', []), planted_clusters)
+        stage = "run_analysis:" + ("all" if len(methods) > 1 else methods[0])
+        records.append(_record(base, stage, seconds, peak_mb, **extra))
+    return records
+
+def compare_with_baseline(records, baseline_records, tolerance, min_seconds):
+    """
+    与基准结果比较 (按 队伍数、题目数、阶段 对应)，返回退化的条目列表。
+    耗时 (中位数) 或内存峰值超过基准的 (1 + tolerance) 倍时视为退化；两次耗时都低于 min_seconds 的阶段只比较内存。
+    """
+    baseline = {(r['teams'], r['challenges'], r['stage']): r for r in baseline_records}
+    regressions = []
+    for record in records:
+        previous = baseline.get((record['teams'], record['challenges'], record['stage']))
+        if previous is None:
+            continue
+        checks = [('seconds_median', max(record['seconds_median'], previous['seconds_median']) >= min_seconds),
+                  ('peak_memory_mb', record.get('peak_memory_mb') is not None and previous.get('peak_memory_mb'))]
+        for field, comparable in checks:
+            if comparable and record[field] > previous[field] * (1 + tolerance):
+                regressions.append({'teams': record['teams'], 'challenges': record['challenges'], 'stage': record['stage'],
+                                    'field': field, 'baseline': previous[field], 'current': record[field]})
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="预处理和各分析方法的规模测试")
+    parser.add_argument("--sizes", default="200,500,1000", help="队伍数，逗号分隔")
+    parser.add_argument("--challenges", type=int, default=40)
+    parser.add_argument("--methods", default=",".join(ALL_METHODS), help="要测量的方法，逗号分隔")
+    parser.add_argument("--distribution", choices=scoreboard_generator.TIME_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--clusters", type=int, default=None, help="植入的串通小组数 (默认每 100 支队伍一组)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段计时的次数 (报告最小值和中位数)")
+    parser.add_argument("--workers", type=int, default=1, help="run_analysis 的 parallel_workers (大于 1 时子进程的内存不计入峰值)")
+    parser.add_argument("--threshold", type=float, default=0.0, help="min_similarity_threshold")
+    parser.add_argument("--sequence-metric", choices=["difflib", "lcs"], default="difflib")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="不测量内存峰值")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对退化比例")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="耗时低于此值的阶段不比较耗时 (噪声太大)")
+    args = parser.parse_args()
+    args.methods = [method.strip() for method in args.methods.split(",") if method.strip()]
+    unknown = [method for method in args.methods if method not in ALL_METHODS]
+    if unknown:
+        parser.error(f"未知的方法: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    records = []
+    for n_teams in sizes:
+        print(f"--- {n_teams} 支队伍 x {args.challenges} 道题 ---")
+        for record in run_size(n_teams, args):
+            records.append(record)
+            memory = f"{record['peak_memory_mb']:.1f} MB" if record['peak_memory_mb'] is not None else "-"
+            recall = f"  植入小组召回率 {record['planted_recall']}" if record.get('planted_recall') is not None else ""
+            print(f"  {record['stage']:<32} {record['seconds_median']:>9.3f} s  峰值 {memory}{recall}")
+
+    output = {
+        'meta': {
+            'created_utc': datetime.now(timezone.utc).isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+        },
+        'results': records
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline_records = json.load(f)['results']
+        regressions = compare_with_baseline(records, baseline_records, args.tolerance, args.min_seconds)
+        for item in regressions:
+            print(f"退化: {item['teams']} 支队伍 {item['stage']} {item['field']} {item['baseline']} -> {item['current']}")
+        if regressions:
+            sys.exit(1)
+        print(f"与 {args.baseline} 相比没有超过 {args.tolerance:.0%} 的退化。")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+# your_project_folder/contestant_table.py
+# 预处理后的选手数据的紧凑存储: 选手和题目都映射为整数编号，全部解题记录按选手连续存放 (CSR)，
+# 每位选手的记录按解题时间排序。解题集合、顺序和 题目->时间 的映射按需生成，不常驻内存
+# (旧的每选手字典把同一份解题记录存了四遍，内存几乎都花在 Python 对象的开销上)。
+# ContestantTable 同时是 选手ID -> 选手数据字典 的只读映射，字典的形状与旧版 preprocess_data 的结果相同，
+# 按字典访问的现有代码无需修改；需要可修改的普通字典时使用 to_dict()。
+from collections.abc import Mapping
+import numpy as np
+
+# 选手数据字典的全部字段 (与旧版 preprocess_data 的结果相同)
+RECORD_FIELDS = ('name', 'total_score', 'solved_set', 'solved_sequence', 'solved_timed', 'solved_codes', 'solved_full_info')
+
+def _compact_numbers(values):
+    """全为整数时使用 int64，否则使用 float64 (NaN 表示缺失)。"""
+    values = np.asarray(values, dtype=np.float64)
+    if np.all(np.isfinite(values)) and np.all(values == np.floor(values)):
+        return values.astype(np.int64)
+    return values
+
+class ContestantTable(Mapping):
+    """
+    选手解题记录的 CSR 表。
+
+    属性:
+    - user_ids / names / total_scores (list): 按行排列的选手ID、名称和总分；row_of 为 选手ID -> 行号。
+    - challenge_ids (list): 题目编号 -> 题目ID (preprocess_data 生成的表与 all_challenges_info 的 'index' 一致)。
+    - offsets (int64[选手数+1]): 第 row 位选手的解题记录位于 [offsets[row], offsets[row+1])。
+    - challenges (int32): 题目编号；times (int64，非整数时 float64): 解题时间 (毫秒)；
+      scores (int64 或 float64): 本次解题获得的分数。
+    """
+
+    def __init__(self, user_ids, names, total_scores, challenge_ids, offsets, challenges, times, scores):
+        self.user_ids = list(user_ids)
+        self.names = list(names)
+        self.total_scores = list(total_scores)
+        self.challenge_ids = list(challenge_ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.challenges = np.asarray(challenges, dtype=np.int32)
+        self.times = _compact_numbers(times)
+        self.scores = _compact_numbers(scores)
+        self.row_of = {uid: row for row, uid in enumerate(self.user_ids)}
+
+    @classmethod
+    def from_dict(cls, contestant_data, challenge_ids=None):
+        """
+        由 选手ID -> 选手数据字典 (需要 'solved_sequence' 和 'solved_timed') 构建。
+        challenge_ids 指定题目编号的顺序，未列出的题目按首次出现的顺序追加。
+        """
+        challenge_ids = list(challenge_ids or [])
+        challenge_codes = {chall_id: code for code, chall_id in enumerate(challenge_ids)}
+        offsets, codes, times, scores = [0], [], [], []
+        for data in contestant_data.values():
+            full_info = data.get('solved_full_info')
+            for k, chall_id in enumerate(data.get('solved_sequence', [])):
+                if chall_id not in challenge_codes:
+                    challenge_codes[chall_id] = len(challenge_ids)
+                    challenge_ids.append(chall_id)
+                codes.append(challenge_codes[chall_id])
+                times.append(full_info[k]['time'] if full_info else data['solved_timed'][chall_id])
+                score = full_info[k].get('score_obtained') if full_info else None
+                scores.append(np.nan if score is None else score)
+            offsets.append(len(codes))
+        return cls(list(contestant_data.keys()),
+                   [data.get('name', f"User_{uid}") for uid, data in contestant_data.items()],
+                   [data.get('total_score', 0) for data in contestant_data.values()],
+                   challenge_ids, offsets, codes, times, scores)
+
+    # --- 映射接口: table[uid] 返回按需生成的选手数据字典 ---
+    def __getitem__(self, uid):
+        return self.record(self.row_of[uid])
+
+    def __iter__(self):
+        return iter(self.user_ids)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, uid):
+        return uid in self.row_of
+
+    @property
+    def nbytes(self):
+        """数组部分占用的字节数。"""
+        return self.offsets.nbytes + self.challenges.nbytes + self.times.nbytes + self.scores.nbytes
+
+    # --- 按需生成的视图 ---
+    def solved_codes(self, row):
+        """按解题时间排列的题目编号。"""
+        return self.challenges[self.offsets[row]:self.offsets[row + 1]].tolist()
+
+    def solved_sequence(self, row):
+        challenge_ids = self.challenge_ids
+        return [challenge_ids[code] for code in self.solved_codes(row)]
+
+    def solved_set(self, row):
+        return set(self.solved_sequence(row))
+
+    def solved_timed(self, row):
+        """题目ID -> 解题时间 (毫秒)；同一题目出现多次时取最后一次，与旧版相同。"""
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return dict(zip(self.solved_sequence(row), self.times[start:end].tolist()))
+
+    def solved_count(self, row):
+        """解出的不同题目数。"""
+        return len(set(self.solved_codes(row)))
+
+    def record(self, row, fields=RECORD_FIELDS):
+        """第 row 位选手的数据字典 (只包含 fields 中的字段)。"""
+        start, end = self.offsets[row], self.offsets[row + 1]
+        codes = self.challenges[start:end].tolist()
+        sequence = [self.challenge_ids[code] for code in codes]
+        times = self.times[start:end].tolist()
+        views = {
+            'name': lambda: self.names[row],
+            'total_score': lambda: self.total_scores[row],
+            'solved_set': lambda: set(sequence),
+            'solved_sequence': lambda: sequence,
+            'solved_timed': lambda: dict(zip(sequence, times)),
+            'solved_codes': lambda: codes,
+            'solved_full_info': lambda: [
+                {'id': chall_id, 'time': solve_time, 'score_obtained': None if score != score else score}
+                for chall_id, solve_time, score in zip(sequence, times, self.scores[start:end].tolist())
+            ]
+        }
+        return {field: views[field]() for field in fields}
+
+    def to_dict(self, fields=RECORD_FIELDS):
+        """兼容适配器: 转换为普通的 选手ID -> 选手数据字典 (全部生成，占用与旧版相同的内存)。"""
+        return {uid: self.record(row, fields) for row, uid in enumerate(self.user_ids)}
+
+    def solve_rows(self):
+        """每条解题记录所属的行号。"""
+        return np.repeat(np.arange(len(self.user_ids), dtype=np.int64), np.diff(self.offsets))
+
+    def distinct_solves(self):
+        """
+        每位选手每道题只保留最后一条记录 (与 solved_timed 一致) 的解题记录下标。
+        返回: (下标数组, 对应的行号数组)，按下标升序。
+        """
+        rows = self.solve_rows()
+        if len(self.challenges) == 0:
+            return np.zeros(0, dtype=np.int64), rows
+        keys = rows * len(self.challenge_ids) + self.challenges
+        _, last_in_reversed = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last_in_reversed)
+        return keep, rows[keep]
+
+    def solve_index(self):
+        """
+        题目ID -> 按解题时间升序排列的 [(解题时间毫秒, 选手ID), ...]，时间相同时按选手行号排序。
+        题目按编号顺序排列 (与 preprocess_data 中 all_challenges_info 的顺序一致)，只包含有人解出的题目。
+        """
+        keep, rows = self.distinct_solves()
+        codes, times = self.challenges[keep], self.times[keep]
+        order = np.lexsort((rows, times, codes))
+        codes, times, rows = codes[order], times[order].tolist(), rows[order].tolist()
+        boundaries = np.flatnonzero(np.diff(codes)) + 1
+        index = {}
+        user_ids = self.user_ids
+        for start, end in zip([0] + boundaries.tolist(), boundaries.tolist() + [len(codes)]):
+            if end > start:
+                index[self.challenge_ids[codes[start]]] = [(times[k], user_ids[rows[k]]) for k in range(start, end)]
+        return index
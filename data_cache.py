@@ -0,0 +1,190 @@
+# your_project_folder/data_cache.py
+# 进程内缓存: preprocess_data 的结果和按需分析的结果。
+# 数据版本 = 获取时间戳 + 内容哈希；计分板数据本身不常驻内存 (data_fetcher 返回的只是数据文件的描述)，
+# 同一版本、同一 min_user_score 的预处理结果 (从数据文件流式解析得到) 直接复用，按条目数 LRU 淘汰。
+# 按需分析的结果按 (规范化的分析参数, min_user_score, 数据版本) 的哈希缓存，按条目数和总字节数 LRU 淘汰，
+# 某个比赛的数据版本变化时清除该比赛其他版本的结果 (多个比赛共用同一组缓存)。
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+import analysis_engine
+import metrics
+import scoreboard_stream
+
+MAX_PREPROCESSED_ENTRIES = 8 # 保留的预处理结果数 (不同版本或 min_user_score 各占一条)
+MAX_RESULT_ENTRIES = 16 # 保留的按需分析结果数
+MAX_RESULT_BYTES = 256 * 1024 * 1024 # 按需分析结果的总大小上限 (按 JSON 序列化后的长度估算)
+# 不影响分析结果的参数 (只决定计算方式)，不参与缓存键
+RESULT_KEY_IGNORED_PARAMS = ("parallel_workers", "parallel_shard_rows")
+
+_current = {} # 比赛ID -> 最近一次读取或写入的数据版本
+_current_lock = threading.Lock()
+
+_preprocessed = OrderedDict() # (数据版本, min_user_score) -> preprocess_data 的返回值
+_preprocessing = {} # (数据版本, min_user_score) -> threading.Event，正在预处理 (完成或失败时设置)
+_preprocess_lock = threading.Lock() # 只保护上面两个字典，预处理本身在锁外执行
+_results = OrderedDict() # 缓存键 -> {'version', 'game', 'result', 'bytes'}
+_results_state = {'bytes': 0}
+_results_lock = threading.Lock()
+_stats = {'preprocess_hits': 0, 'preprocess_misses': 0, 'result_hits': 0, 'result_misses': 0}
+_stats_lock = threading.Lock()
+
+def _count(stat, cache, result):
+    with _stats_lock:
+        _stats[stat] += 1
+    metrics.inc('cache_requests', cache=cache, result=result)
+
+def _lru_put(cache, key, value, max_entries):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
+
+def scoreboard_version(data):
+    """
+    数据版本字符串: "获取时间戳:内容哈希前16位"。
+    数据中没有 'content_sha256' (例如手工构造的数据) 时返回 None，此时不缓存预处理结果。
+    """
+    if not data or not data.get('content_sha256'):
+        return None
+    return f"{data.get('fetch_timestamp_utc', 0)}:{data['content_sha256'][:16]}"
+
+def set_current_version(version, game_id=None):
+    """data_fetcher 读取或写入比赛 game_id 的数据文件后调用；数据版本变化时清除该比赛其他版本的按需分析结果。"""
+    with _current_lock:
+        changed = version != _current.get(game_id)
+        _current[game_id] = version
+    if changed and version is not None:
+        invalidate_results(keep_version=version, game_id=game_id)
+
+def _preprocess(scoreboard_data, min_user_score, timings=None):
+    """执行预处理，耗时 ('parse'、'preprocess') 记入 metrics，并在指定时累加到 timings。"""
+    stage_timings = {}
+    if scoreboard_data.get('source_file'): # data_fetcher 返回的数据文件描述: 流式解析文件
+        outputs = scoreboard_stream.preprocess_file(scoreboard_data['source_file'], min_user_score,
+                                                    file_key=scoreboard_data.get('file_key'), timings=stage_timings)
+    else:
+        started = time.perf_counter()
+        outputs = analysis_engine.preprocess_data(scoreboard_data, min_user_score=min_user_score)
+        stage_timings['preprocess'] = time.perf_counter() - started
+    metrics.observe_timings(stage_timings)
+    if timings is not None:
+        for stage, seconds in stage_timings.items():
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+    return outputs
+
+def get_preprocessed(scoreboard_data, min_user_score=0, timings=None):
+    """
+    返回 analysis_engine.preprocess_data(scoreboard_data, min_user_score) 的结果，
+    同一数据版本和 min_user_score 只计算一次: 已有线程在预处理同一份数据时等待其结果，
+    不同数据或不同 min_user_score 的预处理并行执行，互不阻塞。返回的数据应视为只读 (分析引擎不会修改它们)。
+    scoreboard_data 可以是计分板字典，也可以是 data_fetcher 返回的数据文件描述 (含 'source_file')。
+    指定 timings 字典时，本次实际执行的解析和预处理耗时累加到其中 (命中缓存时不变)。
+    """
+    version = scoreboard_version(scoreboard_data)
+    if version is None:
+        return _preprocess(scoreboard_data, min_user_score, timings)
+    key = (version, min_user_score)
+    done = None # 由本线程预处理时为通知等待者的 Event
+    while True:
+        with _preprocess_lock:
+            if key in _preprocessed:
+                _preprocessed.move_to_end(key)
+                outputs = _preprocessed[key]
+                break
+            pending = _preprocessing.get(key)
+            if pending is None:
+                done = _preprocessing[key] = threading.Event()
+                break
+        pending.wait() # 其他线程正在预处理；失败时没有结果，回到循环开头由本线程重新预处理
+    if done is None:
+        _count('preprocess_hits', 'preprocess', 'hit')
+        return outputs
+
+    _count('preprocess_misses', 'preprocess', 'miss')
+    try:
+        outputs = _preprocess(scoreboard_data, min_user_score, timings)
+        with _preprocess_lock:
+            _lru_put(_preprocessed, key, outputs, MAX_PREPROCESSED_ENTRIES)
+        return outputs
+    finally:
+        with _preprocess_lock:
+            del _preprocessing[key]
+        done.set()
+
+def _normalize_param(value):
+    """缓存键中参数值的规范形式。字符串不在这里处理: 调用方传入的就是交给分析引擎的参数 (见 app._engine_params_from_frontend)。"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value) # 300 与 300.0 视为相同
+    if isinstance(value, (list, tuple)):
+        return sorted({_normalize_param(item) for item in value}, key=str) # 方法列表与顺序、重复无关
+    return value
+
+def analysis_cache_key(run_params, min_user_score, data_version):
+    """
+    按需分析结果的缓存键: 规范化后的分析参数、min_user_score 和数据版本的 sha256。
+    data_version 为 None (数据没有内容哈希) 时返回 None，表示不缓存。
+    """
+    if data_version is None:
+        return None
+    canonical = {key: _normalize_param(value) for key, value in run_params.items()
+                 if key not in RESULT_KEY_IGNORED_PARAMS}
+    canonical['min_user_score'] = _normalize_param(min_user_score)
+    canonical['data_version'] = data_version
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def get_cached_result(key):
+    """取出缓存的按需分析结果；没有时返回 None。返回的结果应视为只读。"""
+    if key is None:
+        return None
+    with _results_lock:
+        entry = _results.get(key)
+        if entry is not None:
+            _results.move_to_end(key)
+    if entry is None:
+        _count('result_misses', 'result', 'miss')
+        return None
+    _count('result_hits', 'result', 'hit')
+    return entry['result']
+
+def _evict_results(max_entries, max_bytes):
+    """调用方需持有 _results_lock。"""
+    while _results and (len(_results) > max_entries or _results_state['bytes'] > max_bytes):
+        _, entry = _results.popitem(last=False)
+        _results_state['bytes'] -= entry['bytes']
+
+def put_cached_result(key, data_version, result, game_id=None):
+    """缓存比赛 game_id 的按需分析结果；单个结果超过字节上限时不缓存。"""
+    if key is None:
+        return
+    with metrics.timed('result_cache_serialize'): # 估算大小时的 JSON 序列化
+        size = len(json.dumps(result, ensure_ascii=False))
+    if size > MAX_RESULT_BYTES:
+        return
+    with _results_lock:
+        if key in _results:
+            _results_state['bytes'] -= _results.pop(key)['bytes']
+        _results[key] = {'version': data_version, 'game': game_id, 'result': result, 'bytes': size}
+        _results_state['bytes'] += size
+        _evict_results(MAX_RESULT_ENTRIES, MAX_RESULT_BYTES)
+
+def invalidate_results(keep_version=None, game_id=None):
+    """清除比赛 game_id 的按需分析结果 (保留数据版本为 keep_version 的结果)。"""
+    with _results_lock:
+        for key in [key for key, entry in _results.items()
+                    if entry['game'] == game_id and entry['version'] != keep_version]:
+            _results_state['bytes'] -= _results.pop(key)['bytes']
+
+def cache_stats():
+    """缓存命中统计和当前条目数 (各锁只短暂持有，不会等待正在进行的预处理)。"""
+    with _stats_lock:
+        stats = dict(_stats)
+    with _preprocess_lock:
+        stats['preprocessed_entries'] = len(_preprocessed)
+    with _results_lock:
+        stats.update(result_entries=len(_results), result_bytes=_results_state['bytes'])
+    return stats
@@ -1,55 +1,298 @@
 # your_project_folder/data_fetcher.py
 import requests
+from requests.adapters import HTTPAdapter
+import hashlib
 import json
 import time
 import os
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import data_cache # 预处理结果的进程内缓存
+import metrics # 运行指标 (/api/metrics)
+import scoreboard_stream # 计分板 JSON 的流式解析
 
-DATA_FILE = "scoreboard_data.json" # 缓存文件名
+DATA_FILE = "scoreboard_data.json" # 缓存文件名 (服务器返回的原始内容)
+META_FILE = "scoreboard_meta.json" # 数据文件的元数据 (获取时间、内容哈希、ETag 等)，查询状态时无需读取大文件
 CACHE_DURATION_SECONDS = 300 # 缓存持续时间，例如5分钟 (300秒)
-GAME_SERVER_URL = "http://your_gzctf_platform_url/api/game/${比赛ID}/scoreboard"
+# 也可以用环境变量 GZCTF_SCOREBOARD_URL 指定 (例如指向本地的 mock_gzctf_server.py)
+GAME_SERVER_URL = os.environ.get("GZCTF_SCOREBOARD_URL", "http://your_gzctf_platform_url/api/game/${比赛ID}/scoreboard")
 
 """↑例如:http://127.0.0.1:8080/api/game/7/scoreboard"""
 
-def fetch_data_from_server():
+# 同时分析多个比赛时，在 GAMES_FILE 中配置 比赛ID -> {"url", "name" (可选), "min_interval_seconds" (可选)}，例如:
+#   {"main": {"url": "http://ctf.example.com/api/game/7/scoreboard", "name": "主赛道"},
+#    "freshman": {"url": "http://ctf.example.com/api/game/8/scoreboard", "min_interval_seconds": 5}}
+# 没有该文件时只有一个比赛 DEFAULT_GAME_ID，地址为 GAME_SERVER_URL。未指定比赛的请求使用第一个比赛。
+# 比赛 DEFAULT_GAME_ID 的数据文件仍为 DATA_FILE / META_FILE，其他比赛的在 GAMES_DIR/<比赛ID>/ 下。
+GAMES_FILE = os.environ.get("GZCTF_GAMES_FILE", "games.json")
+GAMES_DIR = "games"
+DEFAULT_GAME_ID = "default"
+GAME_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$") # 比赛ID同时用作目录名
+FETCH_MIN_INTERVAL_SECONDS = 1.0 # 同一比赛两次请求 (含重试) 之间的最小间隔，可按比赛配置 min_interval_seconds
+FETCH_WORKERS = 4 # 同时获取数据的比赛数
+
+FETCH_TIMEOUT_SECONDS = 10 # 单次请求超时
+FETCH_MAX_RETRIES = 3 # 超时、连接失败或服务器返回 RETRY_STATUS_CODES 时的最大重试次数
+FETCH_BACKOFF_SECONDS = 0.5 # 重试等待的基数，第 n 次重试等待 [0, 基数 * 2^n) 内的随机时间
+FETCH_BACKOFF_MAX_SECONDS = 10
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+FETCH_CHUNK_BYTES = 1 << 20 # 下载时每次写入磁盘的字节数
+
+_session_state = {'session': None}
+_session_lock = threading.Lock()
+_games_state = {'games': None} # 比赛ID -> 比赛字典 (见 _make_game)，按配置顺序
+_games_lock = threading.Lock()
+
+def _make_game(game_id, config):
+    if not GAME_ID_PATTERN.match(game_id):
+        raise ValueError(f"比赛ID '{game_id}' 只能包含字母、数字、'_' 和 '-'")
+    if not config.get('url'):
+        raise ValueError(f"比赛 '{game_id}' 未配置 url")
+    directory = "" if game_id == DEFAULT_GAME_ID else os.path.join(GAMES_DIR, game_id)
+    return {
+        'id': game_id,
+        'name': config.get('name') or game_id,
+        'url': config['url'],
+        'dir': directory, # 该比赛的数据文件和分析结果所在的目录 ("" 为当前目录)
+        'data_file': os.path.join(directory, DATA_FILE),
+        'meta_file': os.path.join(directory, META_FILE),
+        'min_interval_seconds': float(config.get('min_interval_seconds', FETCH_MIN_INTERVAL_SECONDS)),
+        'lock': threading.RLock(), # 同一比赛同一时间只有一个请求在获取并写入数据文件 (重建元数据时也持有，避免读到写了一半的状态)
+        'rate_lock': threading.Lock(),
+        'next_request_at': 0.0 # 下一次允许向该比赛的服务器发送请求的时间 (time.monotonic())
+    }
+
+def _load_games():
+    """读取 GAMES_FILE 中的比赛配置 (只读取一次)；文件不存在时只有比赛 DEFAULT_GAME_ID。"""
+    with _games_lock:
+        if _games_state['games'] is None:
+            try:
+                with open(GAMES_FILE, 'r', encoding='utf-8') as f:
+                    configs = json.load(f)
+            except FileNotFoundError:
+                configs = {DEFAULT_GAME_ID: {'url': GAME_SERVER_URL}}
+            if not configs:
+                raise ValueError(f"{GAMES_FILE} 中没有配置比赛")
+            _games_state['games'] = {game_id: _make_game(game_id, config) for game_id, config in configs.items()}
+        return _games_state['games']
+
+def list_games():
+    """全部比赛 (比赛字典: 'id'、'name'、'url'、'dir'、'data_file'、'meta_file' 等)，按配置顺序。"""
+    return list(_load_games().values())
+
+def get_game(game_id=None):
+    """返回比赛字典；game_id 为 None 时返回第一个比赛，比赛不存在时返回 None。"""
+    games = _load_games()
+    if game_id is None:
+        return next(iter(games.values()))
+    return games.get(game_id)
+
+def _require_game(game_id):
+    game = get_game(game_id)
+    if game is None:
+        raise ValueError(f"未知的比赛 '{game_id}'")
+    return game
+
+def _get_session():
+    """复用同一个带连接池的 Session (保持与服务器的连接，避免每次重新握手；各比赛并发获取时共用)。"""
+    with _session_lock:
+        if _session_state['session'] is None:
+            session = requests.Session()
+            session.headers.update({ # 根据你的实际请求包添加必要的头信息
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36", # 示例 User-Agent
+                "Accept": "application/json, text/plain, */*",
+                "Accept-Encoding": "gzip, deflate", # 通常服务器会处理gzip
+                "Accept-Language": "zh-CN,zh;q=0.9" # 接受的语言
+                # "Host": "127.0.0.1:8880" # requests库会自动从URL中提取Host
+            })
+            adapter = HTTPAdapter(pool_connections=max(2, len(list_games())), pool_maxsize=max(4, FETCH_WORKERS))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session_state['session'] = session
+        return _session_state['session']
+
+def _backoff_delay(attempt, retry_after=None):
+    """第 attempt 次重试前的等待秒数 (full jitter)；服务器给出 Retry-After 时不少于该值。"""
+    delay = random.uniform(0, min(FETCH_BACKOFF_MAX_SECONDS, FETCH_BACKOFF_SECONDS * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, min(FETCH_BACKOFF_MAX_SECONDS, float(retry_after)))
+        except ValueError:
+            pass # HTTP 日期格式的 Retry-After，忽略
+    return delay
+
+def _wait_for_rate_limit(game):
+    """同一比赛的两次请求至少间隔 min_interval_seconds (不同比赛互不影响)。"""
+    with game['rate_lock']:
+        now = time.monotonic()
+        delay = game['next_request_at'] - now
+        game['next_request_at'] = max(now, game['next_request_at']) + game['min_interval_seconds']
+    if delay > 0:
+        time.sleep(delay)
+
+def _get_with_retry(game, headers):
+    """向比赛的服务器发送 GET 请求，超时、连接失败和可重试的状态码按抖动的指数退避重试。"""
+    session = _get_session()
+    url = game['url']
+    for attempt in range(FETCH_MAX_RETRIES + 1):
+        _wait_for_rate_limit(game)
+        try:
+            response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS, stream=True)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if attempt == FETCH_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt)
+            metrics.inc('fetch_retries', game=game['id'])
+            print(f"请求失败 ({type(e).__name__})，{delay:.2f} 秒后重试 ({attempt + 1}/{FETCH_MAX_RETRIES})...")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == FETCH_MAX_RETRIES:
+                return response
+            delay = _backoff_delay(attempt, response.headers.get("Retry-After"))
+            metrics.inc('fetch_retries', game=game['id'])
+            print(f"服务器返回 {response.status_code}，{delay:.2f} 秒后重试 ({attempt + 1}/{FETCH_MAX_RETRIES})...")
+            response.close()
+        time.sleep(delay)
+
+def _read_meta_file(game):
+    try:
+        with open(game['meta_file'], 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+
+def _format_fetch_time(fetch_timestamp):
+    # 将UTC时间戳格式化为易读的字符串
+    return time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(fetch_timestamp))
+
+def _reuse_unchanged_data(game, meta, response, reason, outcome):
+    """服务器数据与本地缓存相同: 不重写数据文件，只更新元数据中的检查时间和验证信息。outcome 为计入 metrics 的获取结果。"""
+    metrics.inc('fetch', result=outcome, game=game['id'])
+    meta = dict(meta, last_checked_utc=time.time())
+    if response.headers.get("ETag"):
+        meta['etag'] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        meta['last_modified'] = response.headers["Last-Modified"]
+    _write_meta_file(game, meta)
+    print(f"服务器数据未变化 ({reason})，沿用 {game['data_file']}。")
+    data = _scoreboard_from_meta(game, meta)
+    return data, _format_fetch_time(data['fetch_timestamp_utc'])
+
+def _copy_prefix(source_path, target, n_bytes):
+    with open(source_path, 'rb') as source:
+        while n_bytes > 0:
+            block = source.read(min(FETCH_CHUNK_BYTES, n_bytes))
+            if not block:
+                break
+            target.write(block)
+            n_bytes -= len(block)
+
+def _download_to_file(response, path, hasher, current_path=None):
     """
-    从游戏服务器获取原始数据，并保存到本地JSON文件。
-    同时记录获取数据的时间戳。
+    把响应内容按块写入 path，同时计算哈希并流式校验 JSON 结构 (不在内存中保留完整内容)。
+    指定 current_path (本地现有的数据文件) 时先与其逐块比较，相同的部分不写入磁盘:
+    第一次出现差异时才创建 path 并复制已比较过的前缀，内容与 current_path 完全相同时不创建 path
+    (服务器不支持条件请求、每次都返回 200 时，未变化的数据不会被重写)。
+    返回: (scoreboard_stream.scan_scoreboard 的统计结果, 是否写入了 path)。
     """
+    state = {'out': None, 'compared': 0}
+    current = open(current_path, 'rb') if current_path and os.path.exists(current_path) else None
+
+    def start_writing():
+        state['out'] = open(path, 'wb')
+        if current is not None:
+            _copy_prefix(current_path, state['out'], state['compared'])
+
+    def chunks():
+        for chunk in response.iter_content(FETCH_CHUNK_BYTES):
+            hasher.update(chunk)
+            if state['out'] is None and current is not None and current.read(len(chunk)) == chunk:
+                state['compared'] += len(chunk)
+            else:
+                if state['out'] is None:
+                    start_writing()
+                state['out'].write(chunk)
+            yield chunk
+
     try:
-        headers = { # 根据你的实际请求包添加必要的头信息
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36", # 示例 User-Agent
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Encoding": "gzip, deflate", # 通常服务器会处理gzip
-            "Accept-Language": "zh-CN,zh;q=0.9" # 接受的语言
-            # "Host": "127.0.0.1:8880" # requests库会自动从URL中提取Host
-        }
-        print(f"正在从 {GAME_SERVER_URL} 获取数据...")
-        response = requests.get(GAME_SERVER_URL, headers=headers, timeout=10) # 设置请求超时10秒
-        response.raise_for_status() # 如果HTTP请求返回了失败的状态码 (4xx 或 5xx), 则抛出HTTPError异常
-        
-        data = response.json()
-        data['fetch_timestamp_utc'] = time.time() # 记录获取数据时的UTC时间戳 (秒)
-        
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2) # indent=2 使JSON文件更易读
-        
-        # 将UTC时间戳格式化为易读的字符串
-        fetch_time_str = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(data['fetch_timestamp_utc']))
-        print(f"数据获取成功并已保存到 {DATA_FILE}")
-        return data, fetch_time_str
-        
-    except requests.exceptions.Timeout:
-        print(f"从服务器获取数据超时: {GAME_SERVER_URL}")
-        return None, "获取数据超时"
-    except requests.exceptions.ConnectionError:
-        print(f"无法连接到服务器: {GAME_SERVER_URL}")
-        return None, "无法连接到服务器"
-    except requests.exceptions.RequestException as e:
-        print(f"从服务器获取数据时发生请求错误: {e}")
-        return None, f"获取数据请求错误: {e}"
-    except json.JSONDecodeError as e: # 捕获JSON解析错误
-        print(f"解析服务器返回的JSON时出错: {e}")
-        return None, "解析JSON出错"
+        summary = scoreboard_stream.scan_scoreboard(chunks())
+        if state['out'] is None and (current is None or current.read(1)): # 新内容为空或只是现有文件的前缀
+            start_writing()
+        return summary, state['out'] is not None
+    finally:
+        if current is not None:
+            current.close()
+        if state['out'] is not None:
+            state['out'].close()
+
+def fetch_data_from_server(game_id=None):
+    """
+    从比赛 game_id (默认第一个比赛) 的服务器获取原始数据，并保存到该比赛的本地JSON文件。
+    同时记录获取数据的时间戳。
+    响应内容按块直接写入磁盘 (同时计算哈希、校验结构)，获取时间和哈希记录在元数据文件中。
+    带上次响应的 ETag / Last-Modified 发送条件请求；服务器返回 304，或返回内容的哈希与本地数据相同时，
+    不替换数据文件，数据版本保持不变 (下游的缓存和预计算结果继续有效)。
+    返回: (数据文件描述, 获取时间的字符串) 或 (None, 错误信息字符串)，数据文件描述见 load_scoreboard。
+    """
+    game = _require_game(game_id)
+    with game['lock'], metrics.timed('fetch'): # 耗时包括等待重试和下载、校验
+        if game['dir']:
+            os.makedirs(game['dir'], exist_ok=True)
+        download_path = game['data_file'] + ".download"
+        try:
+            meta = read_scoreboard_meta(game['id'])
+            conditional_headers = {}
+            if meta and meta.get('etag'):
+                conditional_headers["If-None-Match"] = meta['etag']
+            if meta and meta.get('last_modified'):
+                conditional_headers["If-Modified-Since"] = meta['last_modified']
+
+            print(f"正在从 {game['url']} 获取数据...")
+            with _get_with_retry(game, conditional_headers) as response:
+                if response.status_code == 304 and meta:
+                    return _reuse_unchanged_data(game, meta, response, "304 Not Modified", "not_modified")
+                response.raise_for_status() # 如果HTTP请求返回了失败的状态码 (4xx 或 5xx), 则抛出HTTPError异常
+
+                hasher = hashlib.sha256() # 服务器返回内容的哈希，与时间戳一起构成数据版本
+                # 有本地数据时边下载边与其比较，内容相同时不写入磁盘
+                summary, written = _download_to_file(response, download_path, hasher,
+                                                     current_path=game['data_file'] if meta else None)
+                content_sha256 = hasher.hexdigest()
+                if meta and meta.get('content_sha256') == content_sha256:
+                    return _reuse_unchanged_data(game, meta, response, "内容哈希相同", "unchanged")
+
+                if written: # 否则数据文件已是这份内容 (只是元数据中的哈希过期)，只需更新元数据
+                    os.replace(download_path, game['data_file'])
+                meta = write_scoreboard_meta(time.time(), content_sha256, summary['team_count'], # 记录获取数据时的UTC时间戳 (秒)
+                                             etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"),
+                                             game_id=game['id'])
+
+            metrics.inc('fetch', result='downloaded', game=game['id'])
+            data = _scoreboard_from_meta(game, meta)
+            fetch_time_str = _format_fetch_time(data['fetch_timestamp_utc'])
+            print(f"数据获取成功并已保存到 {game['data_file']} ({summary['team_count']} 个选手条目)")
+            return data, fetch_time_str
+            
+        except requests.exceptions.Timeout:
+            print(f"从服务器获取数据超时: {game['url']}")
+            metrics.inc('fetch', result='error', game=game['id'])
+            return None, "获取数据超时"
+        except requests.exceptions.ConnectionError:
+            print(f"无法连接到服务器: {game['url']}")
+            metrics.inc('fetch', result='error', game=game['id'])
+            return None, "无法连接到服务器"
+        except requests.exceptions.RequestException as e:
+            print(f"从服务器获取数据时发生请求错误: {e}")
+            metrics.inc('fetch', result='error', game=game['id'])
+            return None, f"获取数据请求错误: {e}"
+        except json.JSONDecodeError as e: # 捕获JSON解析错误
+            print(f"解析服务器返回的JSON时出错: {e}")
+            metrics.inc('fetch', result='error', game=game['id'])
+            return None, "解析JSON出错"
+        finally:
+            if os.path.exists(download_path): # 下载失败或数据未变化
+                os.remove(download_path)
 
 def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_params):
     results = {
@@ -196,34 +439,144 @@ def run_analysis(contestant_data, rarity_weights, all_challenges_info, analysis_
     results['similar_pairs'].sort(key=lambda x: x.get('overall_similarity_heuristic', 0), reverse=True)
     return results
 
-def get_scoreboard_data(force_refresh=False):
+def _write_meta_file(game, meta):
+    meta_tmp = game['meta_file'] + ".tmp"
+    with open(meta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(meta_tmp, game['meta_file'])
+
+def write_scoreboard_meta(fetch_timestamp, content_sha256, team_count, etag=None, last_modified=None, game_id=None):
+    """写入比赛 game_id 的数据文件的元数据 (记录数据文件的修改时间和大小，用于判断元数据是否过期)。"""
+    game = _require_game(game_id)
+    stat = os.stat(game['data_file'])
+    meta = {
+        'fetch_timestamp_utc': fetch_timestamp,
+        'last_checked_utc': fetch_timestamp, # 最近一次向服务器确认数据的时间
+        'content_sha256': content_sha256,
+        'data_version': data_cache.scoreboard_version({'fetch_timestamp_utc': fetch_timestamp, 'content_sha256': content_sha256}),
+        'team_count': team_count,
+        'etag': etag,
+        'last_modified': last_modified,
+        'data_file_mtime_ns': stat.st_mtime_ns,
+        'data_file_size': stat.st_size
+    }
+    _write_meta_file(game, meta)
+    data_cache.set_current_version(meta['data_version'], game['id'])
+    return meta
+
+def read_scoreboard_meta(game_id=None):
+    """
+    读取比赛 game_id 的数据文件的元数据；数据文件不存在时返回 None。
+    元数据缺失或与数据文件不符 (例如旧版本写入、或手工替换了数据文件) 时流式扫描一次数据文件并重建:
+    旧版本写入的文件中带有获取时间和哈希，否则以文件的修改时间和内容哈希为准。
+    """
+    game = _require_game(game_id)
+    meta = _read_valid_meta(game)
+    if meta is not None or not os.path.exists(game['data_file']):
+        return meta
+    with game['lock']: # 正在获取的新数据已替换文件、尚未写入元数据时，等待获取完成
+        meta = _read_valid_meta(game)
+        if meta is not None or not os.path.exists(game['data_file']):
+            return meta
+        hasher = hashlib.sha256()
+        with open(game['data_file'], 'rb') as f:
+            summary = scoreboard_stream.scan_scoreboard(scoreboard_stream.iter_file_chunks(f, hasher))
+        fields = summary['fields']
+        return write_scoreboard_meta(fields.get('fetch_timestamp_utc') or os.stat(game['data_file']).st_mtime,
+                                     fields.get('content_sha256') or hasher.hexdigest(), summary['team_count'],
+                                     game_id=game['id'])
+
+def _read_valid_meta(game):
+    """元数据与数据文件相符时返回元数据，否则 (或数据文件不存在时) 返回 None。"""
+    if not os.path.exists(game['data_file']):
+        return None
+    stat = os.stat(game['data_file'])
+    meta = _read_meta_file(game)
+    if meta and meta.get('data_file_mtime_ns') == stat.st_mtime_ns and meta.get('data_file_size') == stat.st_size:
+        return meta
+    return None
+
+def _scoreboard_from_meta(game, meta):
+    return {
+        'game_id': game['id'],
+        'source_file': game['data_file'],
+        'file_key': (meta['data_file_mtime_ns'], meta['data_file_size']),
+        'fetch_timestamp_utc': meta['fetch_timestamp_utc'],
+        'last_checked_utc': meta.get('last_checked_utc', meta['fetch_timestamp_utc']),
+        'content_sha256': meta['content_sha256'],
+        'team_count': meta.get('team_count')
+    }
+
+def load_scoreboard(game_id=None):
+    """
+    返回比赛 game_id 的本地计分板数据的描述 (不解析选手条目): (数据描述, 数据版本)。
+    数据描述含 'game_id'、'source_file'、'file_key'、'fetch_timestamp_utc'、'last_checked_utc'、'content_sha256'、'team_count'，
+    可直接传给 data_cache.get_preprocessed (从文件流式预处理)。
+    数据文件不存在或无法解析时抛出 IOError / json.JSONDecodeError。
+    """
+    game = _require_game(game_id)
+    meta = read_scoreboard_meta(game['id'])
+    if meta is None:
+        raise IOError(f"数据文件 {game['data_file']} 不存在")
+    data_cache.set_current_version(meta['data_version'], game['id'])
+    return _scoreboard_from_meta(game, meta), meta['data_version']
+
+def get_preprocessed_scoreboard(scoreboard, min_user_score=0, timings=None):
     """
-    获取计分板数据。
+    data_cache.get_preprocessed 的包装，返回 (预处理结果, 实际使用的数据描述)。
+    读取数据描述之后、打开数据文件之前，并发的刷新可能已用新数据替换了文件 (file_key 不符)；
+    此时重新读取该比赛当前的数据描述并重试一次，返回的是新数据的描述，调用方应以它的数据版本为准。
+    """
+    try:
+        return data_cache.get_preprocessed(scoreboard, min_user_score, timings=timings), scoreboard
+    except scoreboard_stream.ScoreboardFileChanged as e:
+        print(f"{e}，重新读取比赛 {scoreboard['game_id']} 的数据描述后重试。")
+        scoreboard, _ = load_scoreboard(scoreboard['game_id'])
+        return data_cache.get_preprocessed(scoreboard, min_user_score, timings=timings), scoreboard
+
+def get_scoreboard_data(force_refresh=False, game_id=None):
+    """
+    获取比赛 game_id (默认第一个比赛) 的计分板数据。
     优先从本地缓存文件读取，如果缓存不存在、过期或强制刷新，则从服务器获取。
-    返回: (数据字典, 获取时间的字符串) 或 (None, 错误信息字符串)
+    返回: (数据文件描述, 获取时间的字符串) 或 (None, 错误信息字符串)，数据文件描述见 load_scoreboard。
     """
-    if not force_refresh and os.path.exists(DATA_FILE):
+    game = _require_game(game_id)
+    if not force_refresh and os.path.exists(game['data_file']):
         try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data, _ = load_scoreboard(game['id']) # 只读取元数据，不解析数据文件
             
-            fetch_time_seconds = data.get('fetch_timestamp_utc', 0) # 这是Unix时间戳(秒)
-            if time.time() - fetch_time_seconds < CACHE_DURATION_SECONDS:
-                print(f"从缓存文件 {DATA_FILE} 加载数据。")
-                fetch_time_str = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(fetch_time_seconds))
+            fetch_time_seconds = data['fetch_timestamp_utc'] # 这是Unix时间戳(秒)
+            # 服务器确认数据未变化时不会重写数据文件，因此以最近一次确认的时间判断是否过期
+            last_checked = max(fetch_time_seconds, data['last_checked_utc'])
+            if time.time() - last_checked < CACHE_DURATION_SECONDS:
+                print(f"从缓存文件 {game['data_file']} 加载数据。")
+                fetch_time_str = _format_fetch_time(fetch_time_seconds)
                 return data, fetch_time_str
             else:
                 print("缓存已过期，正在从服务器获取新数据。")
-                return fetch_data_from_server()
+                return fetch_data_from_server(game['id'])
         except (json.JSONDecodeError, IOError) as e:
             print(f"读取缓存文件时出错: {e}。正在从服务器获取新数据。")
-            return fetch_data_from_server()
+            return fetch_data_from_server(game['id'])
     else:
         if force_refresh:
             print("强制刷新，正在从服务器获取新数据。")
         else:
-            print(f"缓存文件 {DATA_FILE} 不存在，正在从服务器获取新数据。")
-        return fetch_data_from_server()
+            print(f"缓存文件 {game['data_file']} 不存在，正在从服务器获取新数据。")
+        return fetch_data_from_server(game['id'])
+
+def get_scoreboard_data_for_games(game_ids=None, force_refresh=False):
+    """
+    并发获取多个比赛 (默认全部比赛) 的计分板数据，最多 FETCH_WORKERS 个比赛同时请求，
+    总耗时约为最慢的一个比赛的耗时，而不是逐个获取的耗时之和。
+    返回: {比赛ID: get_scoreboard_data 的返回值}，顺序与 game_ids 相同。
+    """
+    games = [_require_game(game_id) for game_id in game_ids] if game_ids is not None else list_games()
+    if len(games) <= 1:
+        return {game['id']: get_scoreboard_data(force_refresh, game['id']) for game in games}
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(games)), thread_name_prefix="scoreboard-fetch") as executor:
+        futures = {game['id']: executor.submit(get_scoreboard_data, force_refresh, game['id']) for game in games}
+        return {game_id: future.result() for game_id, future in futures.items()}
 
 if __name__ == '__main__':
     # 用于直接测试此模块的功能
@@ -232,8 +585,8 @@ if __name__ == '__main__':
     data, fetch_time_str = get_scoreboard_data(force_refresh=True)
     if data:
         print(f"测试获取成功，数据采集时间: {fetch_time_str}")
-        print(f"总血量奖励: {data.get('bloodBonus')}")
-        print(f"队伍数量: {len(data.get('items', []))}")
+        print(f"数据版本: {data_cache.scoreboard_version(data)}")
+        print(f"队伍数量: {data['team_count']}")
     else:
         print(f"测试获取失败: {fetch_time_str}")
 
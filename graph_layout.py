@@ -0,0 +1,215 @@
+# your_project_folder/graph_layout.py
+# 关系图的服务端布局和社区划分: 写入预计算结果时 (result_store.write_result_store) 对稀疏化后的图
+# (每位选手综合得分最高的若干条边，且不低于 LAYOUT_MIN_WEIGHT) 计算连通分量、Louvain 社区和力导向布局，
+# 前端直接使用保存的坐标 (preset 布局)，不必在浏览器中运行 cose，几千支队伍时页面也不会卡住。
+# 只依赖 numpy: 连通分量和布局的每一步都是数组运算，Louvain 的局部移动按节点迭代 (边数与选手数成正比)。
+import numpy as np
+
+LAYOUT_NEIGHBORS = 10 # 每位选手参与布局的最强的边数 (取自 result_store 的邻居索引)
+LAYOUT_MIN_WEIGHT = 0.3 # 参与布局和社区划分的边的最低综合得分 (与前端“关系图最小相似度”的默认值相同)
+LAYOUT_NODE_SPACING = 80.0 # 理想的边长 (像素)，与前端节点的大小 (25-65 像素) 相适应
+LAYOUT_ITERATIONS = 100 # 没有上一版本的坐标时的迭代次数
+LAYOUT_WARM_ITERATIONS = 40 # 从上一版本的坐标继续布局时的迭代次数 (实时更新时图的形状保持稳定)
+LAYOUT_REPULSION_SAMPLE = 500 # 选手数超过此值时，每次迭代只与随机抽取的这么多个节点计算斥力 (按比例放大)
+LAYOUT_CHUNK_ROWS = 1024 # 计算斥力时每块的节点数 (限制临时数组的内存)
+LOUVAIN_MAX_LEVELS = 10
+LOUVAIN_MAX_PASSES = 20 # 每一层局部移动的最大轮数
+
+def connected_components(n_nodes, rows, cols):
+    """
+    无向图的连通分量 (标签传播 + 指针跳跃，全部为数组运算)。
+    返回: 每个节点的分量编号 (按分量大小降序编号，从 0 开始)。
+    """
+    labels = np.arange(n_nodes, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    while len(rows):
+        updated = labels.copy()
+        np.minimum.at(updated, rows, labels[cols])
+        np.minimum.at(updated, cols, labels[rows])
+        updated = updated[updated] # 指针跳跃: 标签指向的节点的标签更小时直接采用
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return _relabel_by_size(labels)
+
+def _relabel_by_size(labels):
+    """把任意的分组标签重新编号为 0, 1, ... (最大的组为 0，大小相同时按组中最小的节点顺序)。"""
+    unique, first, inverse, counts = np.unique(labels, return_index=True, return_inverse=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    rank = np.empty(len(unique), dtype=np.int64)
+    rank[order] = np.arange(len(unique))
+    return rank[inverse.reshape(-1)]
+
+def louvain_communities(n_nodes, rows, cols, weights, seed=0):
+    """
+    加权无向图的 Louvain 社区划分 (Blondel 等, 2008): 反复把节点移到使模块度增益最大的相邻社区，
+    不再有移动时把社区合并为一个节点，在合并后的图上重复，直到模块度不再提高。
+    没有边的节点各自成为一个社区。
+
+    返回:
+    - (每个节点的社区编号 (按社区大小降序编号), 模块度)
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n_nodes, dtype=np.int64)
+    adjacency = [{} for _ in range(n_nodes)]
+    for i, j, w in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist(), np.asarray(weights, dtype=np.float64).tolist()):
+        if i == j or w <= 0:
+            continue
+        adjacency[i][j] = adjacency[i].get(j, 0.0) + w
+        adjacency[j][i] = adjacency[j].get(i, 0.0) + w
+    degrees = [sum(neighbors.values()) for neighbors in adjacency]
+    total_degree = sum(degrees) # 2m
+    if total_degree <= 0:
+        return _relabel_by_size(labels), 0.0
+
+    for _ in range(LOUVAIN_MAX_LEVELS):
+        community, moved = _louvain_local_moving(adjacency, degrees, total_degree, rng)
+        _, community = np.unique(community, return_inverse=True)
+        labels = community[labels]
+        if not moved:
+            break
+        # 把每个社区合并为一个节点 (社区内部的边成为自环，权重按两个方向各计一次，节点的度不变)
+        merged = [{} for _ in range(int(community.max()) + 1)]
+        for i, neighbors in enumerate(adjacency):
+            target = merged[community[i]]
+            for j, w in neighbors.items():
+                key = community[j]
+                target[key] = target.get(key, 0.0) + w
+        adjacency = merged
+        degrees = [sum(neighbors.values()) for neighbors in adjacency]
+
+    return _relabel_by_size(labels), round(_modularity(n_nodes, rows, cols, weights, labels), 4)
+
+def _louvain_local_moving(adjacency, degrees, total_degree, rng):
+    """Louvain 的局部移动阶段，返回 (每个节点所在的社区, 是否有节点移动)。"""
+    n_nodes = len(adjacency)
+    community = list(range(n_nodes))
+    community_degree = list(degrees) # 社区中节点的度之和
+    moved_any = False
+    for _ in range(LOUVAIN_MAX_PASSES):
+        moves = 0
+        for i in rng.permutation(n_nodes).tolist():
+            current, degree = community[i], degrees[i]
+            links = {}
+            for j, w in adjacency[i].items():
+                if j != i:
+                    links[community[j]] = links.get(community[j], 0.0) + w
+            community_degree[current] -= degree
+            best, best_gain = current, links.get(current, 0.0) - community_degree[current] * degree / total_degree
+            for candidate, w in links.items():
+                gain = w - community_degree[candidate] * degree / total_degree
+                if gain > best_gain + 1e-12:
+                    best, best_gain = candidate, gain
+            community_degree[best] += degree
+            if best != current:
+                community[i] = best
+                moves += 1
+        if moves == 0:
+            break
+        moved_any = True
+    return np.asarray(community, dtype=np.int64), moved_any
+
+def _modularity(n_nodes, rows, cols, weights, labels):
+    """划分 labels 的模块度 Q = Σ_c [社区内边权之和 / m - (社区的度之和 / 2m)²]。"""
+    weights = np.asarray(weights, dtype=np.float64)
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    total = weights.sum()
+    if total <= 0:
+        return 0.0
+    inside = weights[labels[rows] == labels[cols]].sum()
+    degree = np.bincount(rows, weights, n_nodes) + np.bincount(cols, weights, n_nodes)
+    community_degree = np.bincount(labels, degree)
+    return float(inside / total - np.sum((community_degree / (2 * total)) ** 2))
+
+def _initial_positions(n_nodes, communities, previous, rng):
+    """
+    初始坐标: 各社区按大小排列在黄金角螺旋上，社区内的节点在其中心附近随机分布；
+    previous 中有坐标的节点 (上一版本的布局) 沿用原坐标，新节点放在所在社区已有节点的中心附近。
+    """
+    sizes = np.bincount(communities, minlength=int(communities.max()) + 1 if n_nodes else 0)
+    order = np.arange(len(sizes)) # 社区编号已按大小降序
+    radius = LAYOUT_NODE_SPACING * np.sqrt(np.cumsum(sizes) - sizes / 2.0 + 1)
+    angle = order * np.pi * (3 - np.sqrt(5))
+    centers = np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+    spread = LAYOUT_NODE_SPACING * np.sqrt(sizes[communities])[:, None] / 2
+    positions = centers[communities] + rng.normal(size=(n_nodes, 2)) * spread
+    if previous is not None:
+        known = ~np.isnan(previous[:, 0])
+        if known.any():
+            for community in np.unique(communities[~known]).tolist():
+                members = communities == community
+                if (members & known).any():
+                    center = previous[members & known].mean(axis=0)
+                    positions[members & ~known] = center + rng.normal(size=(int((members & ~known).sum()), 2)) * LAYOUT_NODE_SPACING
+            positions[known] = previous[known]
+    return positions
+
+def force_layout(n_nodes, rows, cols, weights, communities, previous=None, seed=0):
+    """
+    Fruchterman-Reingold 力导向布局 (向量化): 所有节点两两相斥 (k²/d)，边按权重相吸 (w·d²/k)，
+    另有指向原点的弱引力使孤立节点不会远离；每次迭代的位移不超过逐渐降低的温度。
+    节点数超过 LAYOUT_REPULSION_SAMPLE 时斥力只对随机抽取的节点计算再按比例放大 (每次迭代 O(n·样本数))。
+    previous 为上一版本的坐标 ((n, 2)，未知的节点为 NaN)，有时从它开始并减少迭代次数。
+
+    返回: (n, 2) 的 float64 坐标 (像素)。
+    """
+    rng = np.random.default_rng(seed)
+    if n_nodes == 0:
+        return np.zeros((0, 2))
+    k = LAYOUT_NODE_SPACING
+    positions = _initial_positions(n_nodes, communities, previous, rng)
+    warm = previous is not None and not np.isnan(previous[:, 0]).all()
+    iterations = LAYOUT_WARM_ITERATIONS if warm else LAYOUT_ITERATIONS
+    temperature = k * 0.5 if warm else k * np.sqrt(n_nodes) * 0.5 # 继续布局时每次只做小的调整
+    cooling = (0.01 ** (1.0 / iterations)) # 最后一次迭代的温度为初始的 1%
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    gravity = 1.0 / (k * np.sqrt(n_nodes))
+
+    for _ in range(iterations):
+        if n_nodes > LAYOUT_REPULSION_SAMPLE:
+            sample = rng.choice(n_nodes, LAYOUT_REPULSION_SAMPLE, replace=False)
+            scale = n_nodes / LAYOUT_REPULSION_SAMPLE
+        else:
+            sample, scale = np.arange(n_nodes), 1.0
+        sample_x = positions[sample, 0].astype(np.float32)
+        sample_y = positions[sample, 1].astype(np.float32)
+        displacement = np.zeros_like(positions)
+        for start in range(0, n_nodes, LAYOUT_CHUNK_ROWS):
+            chunk = positions[start:start + LAYOUT_CHUNK_ROWS].astype(np.float32)
+            dx = chunk[:, 0:1] - sample_x # 两个坐标分开计算，避免 (块, 样本, 2) 的临时数组
+            dy = chunk[:, 1:2] - sample_y
+            inverse = 1.0 / np.maximum(dx * dx + dy * dy, np.float32(1e-2))
+            displacement[start:start + LAYOUT_CHUNK_ROWS, 0] += scale * k * k * (dx * inverse).sum(axis=1)
+            displacement[start:start + LAYOUT_CHUNK_ROWS, 1] += scale * k * k * (dy * inverse).sum(axis=1)
+        if len(rows):
+            delta = positions[rows] - positions[cols]
+            pull = delta * (weights * np.sqrt(np.einsum('ij,ij->i', delta, delta)) / k)[:, None]
+            for axis in (0, 1):
+                displacement[:, axis] += np.bincount(cols, pull[:, axis], n_nodes) - np.bincount(rows, pull[:, axis], n_nodes)
+        displacement -= positions * (gravity * np.linalg.norm(positions, axis=1))[:, None] # 二次方的引力
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 1e-9)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature *= cooling
+    return positions - positions.mean(axis=0)
+
+def compute_graph_layout(n_nodes, rows, cols, weights, previous=None, seed=0):
+    """
+    对稀疏化后的关系图 (边 rows[k]-cols[k]，权重 weights[k]) 计算连通分量、社区和坐标。
+
+    返回:
+    - dict: 'positions' ((n, 2) float32)、'community' / 'component' (int32，按大小降序编号)、
+      'communities' / 'components' (数量，含只有一个节点的)、'modularity'。
+    """
+    component = connected_components(n_nodes, rows, cols)
+    community, modularity = louvain_communities(n_nodes, rows, cols, weights, seed)
+    positions = force_layout(n_nodes, rows, cols, weights, community, previous, seed)
+    return {
+        'positions': positions.astype(np.float32),
+        'community': community.astype(np.int32),
+        'component': component.astype(np.int32),
+        'communities': int(community.max()) + 1 if n_nodes else 0,
+        'components': int(component.max()) + 1 if n_nodes else 0,
+        'modularity': modularity
+    }
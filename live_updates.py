@@ -0,0 +1,164 @@
+# your_project_folder/live_updates.py
+# 实时更新: 按比赛的后台轮询和 Server-Sent Events 推送。
+# 有浏览器订阅某个比赛 (GET /api/live) 时才启动该比赛的轮询线程，订阅者全部断开 POLL_IDLE_STOP_SECONDS 秒后停止；
+# 轮询间隔随计分板的实际变化自适应: 数据有变化时缩短 (比赛正活跃)，未变化时逐步延长，限制在 [POLL_MIN_SECONDS, POLL_MAX_SECONDS]。
+# 默认分析写入新版本后 (无论由轮询还是手动刷新触发)，服务器把有变化的选手对和边通过 publish 推送给订阅者，
+# 前端据此就地更新，不必重新下载全部结果。
+import json
+import os
+import queue
+import threading
+import time
+import metrics
+
+POLL_ENABLED = os.environ.get("GZCTF_LIVE_POLL", "1") != "0" # 设为 0 时不轮询，只推送手动刷新产生的更新
+POLL_MIN_SECONDS = 10
+POLL_MAX_SECONDS = 300
+POLL_INITIAL_SECONDS = 30
+POLL_SPEEDUP = 0.5 # 数据有变化时间隔乘以此值
+POLL_BACKOFF = 1.5 # 数据未变化 (或获取失败) 时间隔乘以此值
+POLL_IDLE_STOP_SECONDS = 60 # 没有订阅者多久后停止轮询 (页面刷新、短暂断线时不必重新开始)
+HEARTBEAT_SECONDS = 15 # 没有事件时发送注释行，避免代理因空闲断开连接
+RECONNECT_MILLISECONDS = 5000 # 断线后浏览器 (EventSource) 重新连接的等待时间
+SUBSCRIBER_QUEUE_SIZE = 64 # 每个订阅者待发送的事件数上限，消费太慢时丢弃积压的事件并要求重新加载
+
+_lock = threading.Lock()
+_subscribers = {} # 比赛ID -> [queue.Queue, ...]
+_pollers = {} # 比赛ID -> 轮询状态 (见 _start_poller)
+
+def next_interval(interval, changed):
+    """根据本次轮询数据是否有变化计算下一次的间隔 (秒)。"""
+    factor = POLL_SPEEDUP if changed else POLL_BACKOFF
+    return min(POLL_MAX_SECONDS, max(POLL_MIN_SECONDS, interval * factor))
+
+def format_event(event, data):
+    """一条 SSE 消息 (data 为 JSON，单行)。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+def has_subscribers(game_id):
+    with _lock:
+        return bool(_subscribers.get(game_id))
+
+def publish(game_id, event, data):
+    """向比赛的所有订阅者发送事件。某个订阅者的队列已满时清空其积压，只留下一个 'reset' 事件。"""
+    message = format_event(event, data)
+    with _lock:
+        targets = list(_subscribers.get(game_id, ()))
+    for subscriber in targets:
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            while True:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    break
+            subscriber.put_nowait(format_event('reset', {'game': game_id, 'reason': "backlog"}))
+
+def subscribe(game_id, poll=None):
+    """
+    订阅比赛的事件，返回事件队列 (元素为格式化好的 SSE 消息)。
+    指定 poll 时 (且 POLL_ENABLED) 确保该比赛的轮询线程在运行: poll(比赛ID) 执行一次获取和分析，返回数据是否有变化。
+    """
+    subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(game_id, []).append(subscriber)
+        state = _pollers.get(game_id)
+        if state is not None:
+            if state['idle_timer'] is not None: # 订阅者在停止轮询之前回来
+                state['idle_timer'].cancel()
+                state['idle_timer'] = None
+        elif poll is not None and POLL_ENABLED:
+            _start_poller(game_id, poll)
+    return subscriber
+
+def unsubscribe(game_id, subscriber):
+    with _lock:
+        subscribers = _subscribers.get(game_id, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+        if not subscribers:
+            _subscribers.pop(game_id, None)
+            state = _pollers.get(game_id)
+            if state is not None and state['idle_timer'] is None:
+                state['idle_timer'] = threading.Timer(POLL_IDLE_STOP_SECONDS, _stop_idle_poller, (game_id, state))
+                state['idle_timer'].daemon = True
+                state['idle_timer'].start()
+
+def _stop_idle_poller(game_id, state):
+    """POLL_IDLE_STOP_SECONDS 秒内没有新的订阅者时停止比赛的轮询线程 (设置 stop，等待中的线程立即退出)。"""
+    with _lock:
+        if _subscribers.get(game_id) or _pollers.get(game_id) is not state:
+            return
+        del _pollers[game_id]
+    state['stop'].set()
+    print(f"比赛 {game_id} 已无实时更新的订阅者，停止轮询。")
+
+def _start_poller(game_id, poll):
+    """调用方需持有 _lock。"""
+    state = {
+        'interval': POLL_INITIAL_SECONDS,
+        'last_poll_unix': None,
+        'next_poll_unix': time.time() + POLL_INITIAL_SECONDS,
+        'last_change_unix': None,
+        'last_error': None,
+        'idle_timer': None, # 最后一个订阅者断开后启动，到期时停止轮询 (见 _stop_idle_poller)
+        'stop': threading.Event() # 设置后轮询线程在当前等待或轮询结束后退出
+    }
+    _pollers[game_id] = state
+    threading.Thread(target=_poll_loop, args=(game_id, poll, state), name=f"live-poll-{game_id}", daemon=True).start()
+
+def _poll_loop(game_id, poll, state):
+    while not state['stop'].wait(state['interval']):
+        try:
+            changed = bool(poll(game_id))
+            state['last_error'] = None
+            metrics.inc('live_polls', game=game_id, result="changed" if changed else "unchanged")
+        except Exception as e:
+            changed = False
+            state['last_error'] = str(e)
+            metrics.inc('live_polls', game=game_id, result="error")
+            print(f"比赛 {game_id} 的实时更新轮询出错: {e}")
+        now = time.time()
+        state['last_poll_unix'] = now
+        if changed:
+            state['last_change_unix'] = now
+        state['interval'] = next_interval(state['interval'], changed)
+        state['next_poll_unix'] = now + state['interval']
+        if state['stop'].is_set(): # 轮询期间已停止，不再有订阅者
+            return
+        publish(game_id, 'poll', poller_status(game_id))
+
+def poller_status(game_id):
+    """比赛的实时更新状态: 订阅者数、是否在轮询、当前间隔、上一次/下一次轮询和上一次数据变化的时间 (Unix 秒)。"""
+    with _lock:
+        state = _pollers.get(game_id)
+        status = {'game': game_id, 'subscribers': len(_subscribers.get(game_id, ())),
+                  'polling': state is not None, 'poll_enabled': POLL_ENABLED}
+        if state is not None:
+            status.update({key: state[key] for key in
+                           ('last_poll_unix', 'next_poll_unix', 'last_change_unix', 'last_error')})
+            status['interval_seconds'] = round(state['interval'], 1)
+        return status
+
+def poll_interval_gauges():
+    """各比赛当前的轮询间隔，供 /api/metrics 输出: [(标签字典, 秒), ...]。"""
+    with _lock:
+        return [({'game': game_id}, float(state['interval'])) for game_id, state in sorted(_pollers.items())]
+
+def stream_events(game_id, subscriber, initial_event=None):
+    """
+    SSE 响应体的生成器: 先发送重连间隔和 initial_event ((事件名, 数据)，如当前结果版本)，
+    之后转发队列中的事件，空闲时发送心跳。客户端断开 (生成器被关闭) 时取消订阅。
+    """
+    try:
+        yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+        if initial_event is not None:
+            yield format_event(*initial_event)
+        while True:
+            try:
+                yield subscriber.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+    finally:
+        unsubscribe(game_id, subscriber)
@@ -0,0 +1,112 @@
+# your_project_folder/metrics.py
+# 进程内的运行指标: 各阶段的耗时 (获取数据、JSON 解析、预处理、Z-score 统计量、各相似度方法、结果序列化等)
+# 和计数器 (计算的选手对数、获取结果、分析次数)，由 /api/metrics 以 Prometheus 文本格式输出。
+# 只使用标准库 (不依赖 prometheus_client)；多进程部署时每个进程各自统计。
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "gzctf_analysis"
+
+# 计数器名 -> 说明 (输出时加上 PREFIX 和 _total 后缀)
+COUNTER_HELP = {
+    "fetch": "获取计分板数据的次数 (按比赛和结果: downloaded / not_modified / unchanged / error)",
+    "fetch_retries": "获取数据时的重试次数 (按比赛)",
+    "analysis_runs": "执行分析的次数 (按比赛和类型: default / on_demand；mode: full / incremental)",
+    "pairs_evaluated": "计算过的候选选手对数",
+    "pairs_skipped": "共同解题数不足而跳过的选手对数",
+    "cache_requests": "进程内缓存的查询次数 (cache: preprocess / result；result: hit / miss)",
+    "live_polls": "实时更新的轮询次数 (按比赛和结果: changed / unchanged / error)",
+    "conditional_responses": "带 ETag 的接口的响应次数 (按接口和结果: full / not_modified)"
+}
+
+_lock = threading.Lock()
+_stages = {} # 阶段 -> {'count', 'sum', 'max', 'last'}
+_counters = {} # (计数器名, 排序后的标签) -> 值
+
+def observe(stage, seconds):
+    """记录一次阶段耗时 (秒)。"""
+    with _lock:
+        entry = _stages.setdefault(stage, {'count': 0, 'sum': 0.0, 'max': 0.0, 'last': 0.0})
+        entry['count'] += 1
+        entry['sum'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['last'] = seconds
+
+def observe_timings(timings, exclude=()):
+    """记录一组阶段耗时 (如分析结果中的 'timings')，exclude 中的阶段除外。"""
+    for stage, seconds in (timings or {}).items():
+        if stage not in exclude and isinstance(seconds, (int, float)):
+            observe(stage, float(seconds))
+
+@contextmanager
+def timed(stage, timings=None):
+    """计时一个代码块并记录；指定 timings 字典时同时把耗时累加到 timings[stage] (用于写入结果的元数据)。"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        observe(stage, seconds)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+
+def inc(name, value=1, **labels):
+    """计数器 name (见 COUNTER_HELP) 加 value。"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def snapshot():
+    """当前的全部指标: {'stages': {阶段: {...}}, 'counters': [(名称, 标签字典, 值), ...]}。"""
+    with _lock:
+        return {
+            'stages': {stage: dict(entry) for stage, entry in _stages.items()},
+            'counters': [(name, dict(labels), value) for (name, labels), value in _counters.items()]
+        }
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _sample(name, value, labels=None):
+    label_text = ""
+    if labels:
+        label_text = "{" + ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items()) + "}"
+    if isinstance(value, float):
+        value = repr(round(value, 6))
+    return f"{PREFIX}_{name}{label_text} {value}"
+
+def render(gauges=()):
+    """
+    以 Prometheus 文本格式 (0.0.4) 输出全部指标。
+    gauges 为调用方在输出时读取的当前值: [(名称, 说明, [(标签字典, 值), ...]), ...]，例如文件大小、缓存条目数。
+    """
+    state = snapshot()
+    lines = [
+        f"# HELP {PREFIX}_stage_duration_seconds 各阶段的耗时",
+        f"# TYPE {PREFIX}_stage_duration_seconds summary"
+    ]
+    for stage, entry in sorted(state['stages'].items()):
+        lines.append(_sample("stage_duration_seconds_sum", entry['sum'], {'stage': stage}))
+        lines.append(_sample("stage_duration_seconds_count", entry['count'], {'stage': stage}))
+    for field, help_text in (("last", "各阶段最近一次的耗时"), ("max", "各阶段的最长耗时")):
+        lines.append(f"# HELP {PREFIX}_stage_{field}_duration_seconds {help_text}")
+        lines.append(f"# TYPE {PREFIX}_stage_{field}_duration_seconds gauge")
+        for stage, entry in sorted(state['stages'].items()):
+            lines.append(_sample(f"stage_{field}_duration_seconds", entry[field], {'stage': stage}))
+
+    counters = {}
+    for name, labels, value in state['counters']:
+        counters.setdefault(name, []).append((labels, value))
+    for name in sorted(set(COUNTER_HELP) | set(counters)):
+        lines.append(f"# HELP {PREFIX}_{name}_total {COUNTER_HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        for labels, value in sorted(counters.get(name, []), key=lambda entry: sorted(entry[0].items())):
+            lines.append(_sample(f"{name}_total", value, labels))
+
+    for name, help_text, samples in gauges:
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        for labels, value in samples:
+            lines.append(_sample(name, value, labels))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,114 @@
+# your_project_folder/mock_gzctf_server.py
+# 本地模拟的 GZCTF 计分板接口，用于在没有真实比赛平台时测试数据获取 (条件请求、重试、变化检测)。
+# 用法:
+#   python mock_gzctf_server.py --port 8080 --teams 200 --challenges 40
+#   GZCTF_SCOREBOARD_URL=http://127.0.0.1:8080/api/game/1/scoreboard python app.py
+# 支持 ETag / Last-Modified 条件请求 (未变化时返回 304)，可以定期追加解题记录模拟比赛进行，
+# 也可以按比例或对最前面的若干次请求返回 503 测试重试。tests/ 中的测试在进程内启动它 (见 tests/conftest.py)。
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from flask import Flask, abort, make_response, request
+import scoreboard_generator
+
+app = Flask(__name__)
+
+# 当前的计分板数据及其序列化结果、ETag 和修改时间，数据变化时整体替换
+_state = {'scoreboard': None, 'body': b"", 'etag': None, 'last_modified': None}
+_state_lock = threading.Lock()
+_options = {'fail_rate': 0.0, 'fail_first': 0, 'use_etag': True, 'game_id': None}
+_counters = {'requests': 0} # 收到的计分板请求数 (含返回 503 的)
+
+def generate_scoreboard(n_teams, n_challenges, seed=0, clusters=0):
+    """生成 GZCTF 格式的计分板 (见 scoreboard_generator)，比赛在 48 小时前开始。"""
+    scoreboard, _ = scoreboard_generator.generate_scoreboard(
+        n_teams, n_challenges, seed=seed, clusters=clusters, start_ms=int(time.time() * 1000) - 48 * 3600 * 1000
+    )
+    return scoreboard
+
+def _add_solve(item, challenge, time_ms):
+    item['solvedChallenges'].append({'id': challenge['id'], 'time': time_ms, 'score': challenge['score']})
+    item['score'] += challenge['score']
+    challenge['solved'] += 1
+
+def set_scoreboard(scoreboard):
+    """替换当前数据，重新计算序列化结果、ETag 和修改时间。"""
+    body = json.dumps(scoreboard, ensure_ascii=False).encode('utf-8')
+    with _state_lock:
+        _state.update({'scoreboard': scoreboard, 'body': body,
+                       'etag': hashlib.sha256(body).hexdigest()[:32],
+                       'last_modified': datetime.now(timezone.utc).replace(microsecond=0)})
+
+def mutate_scoreboard(rng, n_solves=1):
+    """随机追加 n_solves 条新的解题记录 (模拟比赛进行中)。"""
+    with _state_lock:
+        scoreboard = json.loads(_state['body'])
+    challenge_list = [challenge for group in scoreboard['challenges'].values() for challenge in group]
+    for _ in range(n_solves):
+        item = rng.choice(scoreboard['items'])
+        solved_ids = {solve['id'] for solve in item['solvedChallenges']}
+        unsolved = [challenge for challenge in challenge_list if challenge['id'] not in solved_ids]
+        if unsolved:
+            _add_solve(item, rng.choice(unsolved), int(time.time() * 1000))
+    set_scoreboard(scoreboard)
+
+@app.route('/api/game/<int:game_id>/scoreboard', methods=['GET'])
+def scoreboard(game_id):
+    if _options['game_id'] is not None and game_id != _options['game_id']:
+        abort(404)
+    with _state_lock:
+        _counters['requests'] += 1
+        fail_first = _counters['requests'] <= _options['fail_first']
+    if fail_first or _options['fail_rate'] and random.random() < _options['fail_rate']:
+        response = make_response({'title': "Service Unavailable"}, 503)
+        response.headers['Retry-After'] = "1"
+        return response
+    with _state_lock:
+        body, etag, last_modified = _state['body'], _state['etag'], _state['last_modified']
+    response = make_response(body)
+    response.mimetype = "application/json"
+    if _options['use_etag']:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+    return response.make_conditional(request) # 条件请求匹配时改为 304 (无响应体)
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 GZCTF 计分板接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--game-id", type=int, default=None, help="只响应该比赛ID (默认响应任意ID)")
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--challenges", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clusters", type=int, default=0, help="植入的串通小组数 (见 scoreboard_generator.py)")
+    parser.add_argument("--data", help="使用已有的计分板 JSON 文件 (例如保存的 scoreboard_data.json)，而不是随机生成")
+    parser.add_argument("--mutate-every", type=float, default=0, help="每隔多少秒追加一条解题记录，0 表示数据不变")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="以该比例返回 503 (测试重试)")
+    parser.add_argument("--fail-first", type=int, default=0, help="最前面的若干次请求返回 503 (测试重试)")
+    parser.add_argument("--no-etag", action="store_true", help="不返回 ETag / Last-Modified (测试内容哈希比较)")
+    args = parser.parse_args()
+
+    if args.data:
+        with open(args.data, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        set_scoreboard({'items': data.get('items', []), 'challenges': data.get('challenges', {})})
+    else:
+        set_scoreboard(generate_scoreboard(args.teams, args.challenges, args.seed, args.clusters))
+    _options.update({'fail_rate': args.fail_rate, 'fail_first': args.fail_first, 'use_etag': not args.no_etag, 'game_id': args.game_id})
+
+    if args.mutate_every > 0:
+        rng = random.Random(args.seed + 1)
+        def mutate_loop():
+            while True:
+                time.sleep(args.mutate_every)
+                mutate_scoreboard(rng)
+        threading.Thread(target=mutate_loop, daemon=True).start()
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
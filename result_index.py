@@ -0,0 +1,254 @@
+# your_project_folder/result_index.py
+# 在缓存的分析结果 (列式存储，见 result_store.py) 上建立内存索引，供服务端分页、筛选、排序查询使用，
+# 前端只需下载当前页的表格行，而不是整个分析结果。
+import numpy as np
+import result_store
+
+# 查询参数中的排序键 (与 result_store.PAIR_COLUMNS 的列名相同)
+PAIR_SORT_KEYS = tuple(result_store.PAIR_COLUMNS)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_NEIGHBORS = 20
+MAX_NEIGHBORS = 200
+COMMUNITY_PREVIEW_MEMBERS = 10 # 折叠的社区节点附带的成员名 (按分数降序)
+
+def build_pair_index(store):
+    """
+    为列式存储的当前版本建立索引。
+    选手对的位置 (position) 与 run_analysis 返回的 similar_pairs 顺序一致；
+    每个排序键一列 float64 (未计算的方法为 NaN)，排序结果按需计算后缓存。
+    """
+    meta = store['meta']
+    condensed = result_store.candidate_indices(store)
+    user1, user2 = result_store.condensed_to_positions(store['n_users'], condensed)
+
+    positions_by_name = {}
+    for position, name in enumerate(store['user_names']):
+        positions_by_name.setdefault(name, []).append(position)
+    positions_by_id = {str(uid): position for position, uid in enumerate(store['user_ids'])} # 查询参数中的选手ID为字符串
+
+    columns = {}
+    for key in PAIR_SORT_KEYS:
+        if key in store['columns']:
+            columns[key] = np.asarray(store['columns'][key][condensed], dtype=np.float64)
+        else:
+            columns[key] = np.full(len(condensed), np.nan)
+
+    edge_indices = np.flatnonzero(store['edge'])
+    return {
+        'communities': _community_summaries(store),
+        'version': store['version'],
+        'store': store,
+        'params_used': meta.get('params_used'),
+        'calculation_time_iso': meta.get('calculation_time_iso'),
+        'pair_stats': meta.get('pair_stats'),
+        'pair_count': len(condensed),
+        'condensed': condensed,
+        'positions_by_name': positions_by_name,
+        'positions_by_id': positions_by_id,
+        'user1': user1,
+        'user2': user2,
+        'columns': columns,
+        'orders': {}, # (排序键, 是否降序) -> 选手对位置的排列
+        'edge_indices': edge_indices,
+        'edge_weights': np.asarray(store['columns']['overall'][edge_indices], dtype=np.float64)
+    }
+
+def _community_summaries(store):
+    """各社区的大小、中心坐标和分数最高的几位成员 (按社区编号排列)；存储没有布局时为 None。"""
+    layout = store['layout']
+    if layout is None:
+        return None
+    community = np.asarray(layout['community'], dtype=np.int64)
+    positions = np.asarray(layout['positions'], dtype=np.float64)
+    sizes = np.bincount(community, minlength=int(community.max()) + 1 if len(community) else 0)
+    centers_x = np.bincount(community, positions[:, 0], len(sizes)) / np.maximum(sizes, 1)
+    centers_y = np.bincount(community, positions[:, 1], len(sizes)) / np.maximum(sizes, 1)
+    nodes = store['meta']['network_nodes']
+    members = [[] for _ in sizes]
+    for position in sorted(range(len(nodes)), key=lambda pos: -(nodes[pos].get('score') or 0)):
+        group = members[community[position]]
+        if len(group) < COMMUNITY_PREVIEW_MEMBERS:
+            group.append(store['user_names'][position])
+    return [{'community': c, 'size': int(sizes[c]), 'x': round(float(centers_x[c]), 1), 'y': round(float(centers_y[c]), 1),
+             'members': members[c]} for c in range(len(sizes))]
+
+def pair_row(index, position):
+    """表格中一行所需的标量数据 (不含时间线等详情)。"""
+    store = index['store']
+    i, j = int(index['user1'][position]), int(index['user2'][position])
+    row = {
+        'position': position, # 用于 /api/pairs/<position> 获取该对的完整详情
+        'pair_names': (store['user_names'][i], store['user_names'][j]),
+        'pair_ids': (store['user_ids'][i], store['user_ids'][j])
+    }
+    for key, column in index['columns'].items():
+        value = column[position]
+        if np.isnan(value):
+            row[key] = None
+        else:
+            row[key] = int(value) if result_store.PAIR_COLUMNS[key][1] else round(float(value), 3)
+    return row
+
+def pair_summary_at(index, position):
+    """第 position 个选手对的摘要结果 (与 similar_pairs 中的条目相同)。"""
+    return result_store.pair_summary(index['store'], int(index['condensed'][position]))
+
+def _sort_order(index, sort_key, descending):
+    cache_key = (sort_key, descending)
+    if cache_key not in index['orders']:
+        column = index['columns'][sort_key]
+        # 稳定排序: 分数相同时保持原结果中的顺序；NaN (未计算) 总是排在最后
+        index['orders'][cache_key] = np.argsort(-column if descending else column, kind='stable')
+    return index['orders'][cache_key]
+
+def _encode_cursor(index, sort_key, descending, rank):
+    return f"{index['version']}:{sort_key}:{int(descending)}:{rank}"
+
+def _decode_cursor(index, cursor, sort_key, descending):
+    """返回游标指向的排名 (该排名之后的结果为下一页)。游标与当前结果或排序方式不符时抛出 ValueError。"""
+    try:
+        version, cursor_key, cursor_desc, rank = cursor.rsplit(':', 3)
+        rank = int(rank)
+    except ValueError:
+        raise ValueError("无效的分页游标")
+    if version != index['version']:
+        raise ValueError("分析结果已更新，分页游标已失效，请从第一页重新查询")
+    if cursor_key != sort_key or cursor_desc != str(int(descending)):
+        raise ValueError("分页游标与当前排序方式不一致")
+    return rank
+
+def query_pairs(index, user_name=None, min_scores=None, sort_key="overall", descending=True, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    按条件查询选手对。
+
+    参数:
+    - user_name (str or None): 只返回包含该选手的对。
+    - min_scores (dict): 排序键 -> 最小值，该方法未计算的对不会通过筛选。
+    - sort_key (str): PAIR_SORT_KEYS 中的一个。
+    - descending (bool): 是否降序。
+    - cursor (str or None): 上一页返回的 next_cursor。
+    - limit (int): 每页数量 (不超过 MAX_PAGE_SIZE)。
+
+    返回:
+    - dict: 'items' (表格行)、'total_matched' (符合条件的总数)、'next_cursor' (没有下一页时为 None)。
+    参数无效时抛出 ValueError。
+    """
+    if sort_key not in PAIR_SORT_KEYS:
+        raise ValueError(f"未知的排序键 '{sort_key}'，可选: {', '.join(PAIR_SORT_KEYS)}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    mask = np.ones(index['pair_count'], dtype=bool)
+    if user_name:
+        user_positions = index['positions_by_name'].get(user_name, [])
+        mask &= np.isin(index['user1'], user_positions) | np.isin(index['user2'], user_positions)
+    for key, min_value in (min_scores or {}).items():
+        if key not in PAIR_SORT_KEYS:
+            raise ValueError(f"未知的筛选键 '{key}'")
+        mask &= index['columns'][key] >= min_value
+
+    order = _sort_order(index, sort_key, descending)
+    matched_ranks = np.flatnonzero(mask[order]) # 符合条件的对在完整排序中的排名 (升序)
+    start = 0
+    if cursor:
+        start = int(np.searchsorted(matched_ranks, _decode_cursor(index, cursor, sort_key, descending), side='right'))
+    page_ranks = matched_ranks[start:start + limit]
+
+    next_cursor = None
+    if start + limit < len(matched_ranks):
+        next_cursor = _encode_cursor(index, sort_key, descending, int(page_ranks[-1]))
+    return {
+        'items': [pair_row(index, int(position)) for position in order[page_ranks]],
+        'total_matched': int(len(matched_ranks)),
+        'next_cursor': next_cursor
+    }
+
+def query_graph(index, min_weight=0.0, user_name=None, collapse=False):
+    """
+    返回关系图的节点和综合得分不低于 min_weight 的边；指定 user_name 时只保留与其相连的边。
+    存储带有布局时节点附带预先计算的坐标 ('x'、'y') 和 'community'、'component'，'layout' 为布局的元数据。
+    collapse 为 True 时每个社区折叠为一个节点 ('id' 为 "community:<编号>"，附带 'size'、'members')，
+    边为社区之间的边的汇总 ('weight' 为最大综合得分，'edge_count' 为边数)，社区内部的边不返回。
+    """
+    store = index['store']
+    layout = store['layout']
+    selected = index['edge_indices'][index['edge_weights'] >= min_weight]
+    if user_name:
+        user_positions = [pos for pos, name in enumerate(store['user_names']) if name == user_name]
+        rows, cols = result_store.condensed_to_positions(store['n_users'], selected)
+        selected = selected[np.isin(rows, user_positions) | np.isin(cols, user_positions)]
+
+    if collapse and layout is not None:
+        return _collapsed_graph(index, selected, only_involved=bool(user_name))
+    nodes = store['meta']['network_nodes']
+    if layout is not None:
+        positions, community, component = (np.asarray(layout[key]).tolist() for key in ('positions', 'community', 'component'))
+        nodes = [dict(node, x=round(positions[pos][0], 1), y=round(positions[pos][1], 1),
+                      community=community[pos], component=component[pos]) for pos, node in enumerate(nodes)]
+    edges = [result_store.edge_from_pair(result_store.pair_summary(store, k)) for k in selected.tolist()]
+    return {'network_nodes': nodes, 'network_edges': edges, 'layout': store['meta'].get('layout')}
+
+def _collapsed_graph(index, selected, only_involved):
+    """query_graph(collapse=True) 的结果；only_involved 时 (按选手筛选) 只包含与所选的边相连的社区。"""
+    store = index['store']
+    community = np.asarray(store['layout']['community'], dtype=np.int64)
+    rows, cols = result_store.condensed_to_positions(store['n_users'], selected)
+    weights = np.asarray(store['columns']['overall'][selected], dtype=np.float64)
+    source, target = np.minimum(community[rows], community[cols]), np.maximum(community[rows], community[cols])
+    between = source != target
+    source, target, weights = source[between], target[between], weights[between]
+    n_communities = len(index['communities'])
+    keys, inverse, counts = np.unique(source * n_communities + target, return_inverse=True, return_counts=True)
+    max_weights = np.full(len(keys), -np.inf)
+    np.maximum.at(max_weights, inverse.reshape(-1), weights)
+
+    summaries = index['communities']
+    if only_involved:
+        involved = np.unique(np.concatenate((community[rows], community[cols])))
+        summaries = [summaries[c] for c in involved.tolist()]
+    nodes = [{'id': f"community:{summary['community']}", 'label': f"社区 {summary['community']} ({summary['size']})",
+              **summary} for summary in summaries]
+    edges = [{'source': f"community:{key // n_communities}", 'target': f"community:{key % n_communities}",
+              'weight': round(float(weight), 3), 'edge_count': int(count)}
+             for key, weight, count in zip(keys.tolist(), max_weights.tolist(), counts.tolist())]
+    return {'network_nodes': nodes, 'network_edges': edges, 'layout': store['meta'].get('layout'), 'collapsed': True}
+
+def query_neighbors(index, user_name=None, user_id=None, method="overall", k=DEFAULT_NEIGHBORS, min_score=None):
+    """
+    查询与一位选手按某一列得分最相似的 k 位选手 (使用 result_store 的邻居索引，不扫描全部选手对)。
+
+    参数:
+    - user_name / user_id (str): 选手名或选手ID (二选一；重名时必须使用选手ID)。
+    - method (str): PAIR_SORT_KEYS 中的一个，该方法未计算时没有结果。
+    - k (int): 返回的邻居数 (不超过 MAX_NEIGHBORS)。
+    - min_score (float or None): 只返回该列得分不低于此值的邻居。
+
+    返回:
+    - dict: 'user' ({'name', 'id'})、'items' (按得分降序的选手对摘要，附带 'neighbor_name'、'neighbor_id'、'score')。
+    参数无效或选手不存在时抛出 ValueError。
+    """
+    if method not in PAIR_SORT_KEYS:
+        raise ValueError(f"未知的方法 '{method}'，可选: {', '.join(PAIR_SORT_KEYS)}")
+    k = max(1, min(int(k), MAX_NEIGHBORS))
+    store = index['store']
+    if user_id is not None:
+        position = index['positions_by_id'].get(str(user_id))
+    else:
+        positions = index['positions_by_name'].get(user_name, [])
+        if len(positions) > 1:
+            raise ValueError(f"有 {len(positions)} 位选手名为 '{user_name}'，请改用选手ID查询")
+        position = positions[0] if positions else None
+    if position is None:
+        raise ValueError("选手不存在或不在缓存的分析结果中")
+
+    target_id = store['user_ids'][position]
+    items = []
+    if method in store['columns']:
+        for condensed in result_store.top_neighbors(store, target_id, method, k).tolist():
+            pair = result_store.pair_summary(store, condensed)
+            score = result_store.column_value(method, store['columns'][method][condensed])
+            if pair is None or score is None or (min_score is not None and score < min_score):
+                continue
+            other = 1 if pair['pair_ids'][0] == target_id else 0
+            items.append(dict(pair, neighbor_name=pair['pair_names'][other], neighbor_id=pair['pair_ids'][other], score=score))
+    return {'user': {'name': store['user_names'][position], 'id': target_id}, 'items': items}
@@ -0,0 +1,534 @@
+# your_project_folder/result_store.py
+# 分析结果的列式存储: 每个指标一个 float32 文件，按选手对的压缩上三角顺序排列
+# (与 itertools.combinations(选手顺序, 2) 的顺序相同)，服务器用 numpy.memmap 打开，
+# 查询只会读取用到的页面。JSON 只作为导出格式 (export_results)。
+#
+# 目录结构:
+#   <root>/CURRENT               当前版本的目录名 (写完新版本后原子替换，上一个版本保留到下一次写入)
+#   <root>/<version>/meta.json   参数、计算时间、选手索引、节点、统计信息
+#   <root>/<version>/<列>.f32    各指标的压缩上三角数组，未计算的选手对为 NaN
+#   <root>/<version>/edge.u8     该对是否为关系图的边 (按分析参数的边选择策略保留，见 analysis_engine.EDGE_POLICIES)
+#   <root>/<version>/<列>.nbr.i32  每位选手按该列得分排列的前 NEIGHBOR_K 位邻居 (选手位置，不足时为 -1)
+#   <root>/<version>/layout.f32  关系图的坐标 ((选手数, 2)，见 graph_layout.py)
+#   <root>/<version>/community.i32 / component.i32  每位选手所在的社区 / 连通分量
+#   <root>/<version>/snapshot.json  本次分析的输入快照 (用于增量分析，可选)
+#   <root>/<version>/export.json.gz / export.etag  完整导出 (export_document) 的 gzip 压缩 JSON 和强 ETag，
+#                                是 /api/get_cached_analysis 的预压缩响应体
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+import numpy as np
+import graph_layout
+
+# 列名 -> (结果中的字段, 是否为整数计数)
+PAIR_COLUMNS = {
+    "overall": ('overall_similarity_heuristic', False),
+    "jaccard": ('jaccard', False),
+    "weighted_jaccard": ('weighted_jaccard', False),
+    "sequence": ('sequence_similarity', False),
+    "time_proximity": ('time_proximity', True),
+    "z_score": ('significant_z_score_count', True)
+}
+CURRENT_FILE = "CURRENT"
+NEIGHBOR_K = 50 # 邻居索引中每位选手保存的邻居数，查询更多邻居时退回扫描该选手的全部选手对
+DIFF_CHUNK_PAIRS = 1 << 22 # diff_stores 每次比较的选手对数 (限制临时数组的内存)
+EXPORT_FILE = "export.json.gz"
+EXPORT_ETAG_FILE = "export.etag"
+EXPORT_GZIP_LEVEL = 6 # 只在写入新版本时压缩一次，之后直接返回压缩后的文件
+
+def condensed_index(n_users, rows, cols):
+    """选手位置 (rows[k] < cols[k]) -> 压缩上三角中的下标。"""
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    return rows * n_users - rows * (rows + 1) // 2 + (cols - rows - 1)
+
+def condensed_to_positions(n_users, indices):
+    """压缩上三角下标 -> (rows, cols)，condensed_index 的逆运算。"""
+    indices = np.asarray(indices, dtype=np.int64)
+    # 第 i 行之前共有 i*n - i*(i+1)/2 个元素，解二次方程得到行号，再修正浮点误差
+    rows = (2 * n_users - 1 - np.sqrt((2 * n_users - 1) ** 2 - 8.0 * indices)) // 2
+    rows = rows.astype(np.int64)
+    row_starts = rows * n_users - rows * (rows + 1) // 2
+    rows = np.where(row_starts > indices, rows - 1, rows)
+    next_row_starts = (rows + 1) * n_users - (rows + 1) * (rows + 2) // 2
+    rows = np.where(next_row_starts <= indices, rows + 1, rows)
+    row_starts = rows * n_users - rows * (rows + 1) // 2
+    return rows, indices - row_starts + rows + 1
+
+def _user_pair_indices(n_users, position):
+    before = np.arange(position, dtype=np.int64)
+    after = np.arange(position + 1, n_users, dtype=np.int64)
+    return np.concatenate([
+        condensed_index(n_users, before, np.full(len(before), position)),
+        condensed_index(n_users, np.full(len(after), position), after)
+    ])
+
+def _top_k(scores, k):
+    """scores 中最大的 k 个 (忽略 NaN) 的下标，按得分降序；得分相同时下标小的在前 (边界上的并列也按此取舍)。"""
+    valid = np.flatnonzero(~np.isnan(scores))
+    if len(valid) > k > 0:
+        negated = -scores[valid]
+        kth = np.partition(negated, k - 1)[k - 1]
+        above, tied = valid[negated < kth], valid[negated == kth]
+        valid = np.concatenate([above, tied[:k - len(above)]])
+    elif k <= 0:
+        valid = valid[:0]
+    return valid[np.lexsort((valid, -scores[valid]))]
+
+def _build_neighbor_table(values, n_users, k):
+    """
+    每位选手按 values (压缩上三角数组) 得分最高的 k 位邻居的位置，形状 (n_users, k)，不足 k 位时以 -1 补齐。
+    逐个选手读取其 n-1 个选手对，内存占用与选手数成正比。
+    """
+    table = np.full((n_users, k), -1, dtype=np.int32)
+    for position in range(n_users):
+        top = _top_k(values[_user_pair_indices(n_users, position)], k)
+        table[position, :len(top)] = top + (top >= position) # 跳过自身所在的位置
+    return table
+
+def _pair_value(pair, column):
+    field, _ = PAIR_COLUMNS[column]
+    if column == "time_proximity":
+        return pair['time_proximity']['count'] if 'time_proximity' in pair else None
+    if column == "z_score" and field not in pair and 'time_distribution_analysis' in pair:
+        # 详细模式的结果: 由逐题详情统计显著负 Z-score 的题目数
+        return sum(1 for item in pair['time_distribution_analysis']
+                   if isinstance(item.get('z_score'), (int, float)) and item['z_score'] < -1.5)
+    return pair.get(field)
+
+def _layout_edges(values, neighbor_table, n_users):
+    """
+    参与布局的稀疏边: 每位选手综合得分最高的 LAYOUT_NEIGHBORS 位邻居中得分不低于 LAYOUT_MIN_WEIGHT 的 (去重)。
+    返回: (rows, cols, weights)，rows < cols。
+    """
+    others = neighbor_table[:, :graph_layout.LAYOUT_NEIGHBORS].astype(np.int64)
+    selves = np.repeat(np.arange(n_users, dtype=np.int64), others.shape[1]).reshape(others.shape)
+    valid = others >= 0
+    rows, cols = np.minimum(selves, others)[valid], np.maximum(selves, others)[valid]
+    indices = np.unique(condensed_index(n_users, rows, cols))
+    weights = values[indices]
+    indices = indices[weights >= graph_layout.LAYOUT_MIN_WEIGHT]
+    rows, cols = condensed_to_positions(n_users, indices)
+    return rows, cols, values[indices].astype(np.float64)
+
+def _previous_layout(root, user_ids):
+    """当前版本 (写入新版本之前) 中各选手的坐标，按 user_ids 排列，没有的为 NaN；当前版本没有布局时返回 None。"""
+    try:
+        meta = read_store_meta(root)
+        if meta is None or not meta.get('layout'):
+            return None
+        old_positions = np.fromfile(os.path.join(root, meta['version'], "layout.f32"), dtype=np.float32).reshape(-1, 2)
+    except (IOError, ValueError):
+        return None
+    old_position = {uid: pos for pos, uid in enumerate(meta['user_ids'])}
+    previous = np.full((len(user_ids), 2), np.nan)
+    for pos, uid in enumerate(user_ids):
+        if uid in old_position:
+            previous[pos] = old_positions[old_position[uid]]
+    return previous
+
+def write_result_store(root, results, params_used, calculation_time_unix, snapshot=None, data_version=None, timings=None):
+    """
+    将 run_analysis 的结果 (全部选手对模式) 写入列式存储的新版本，并切换 CURRENT。
+    只保存标量分数；时间线等详情应通过 analysis_engine.compute_pair_details 按需计算。
+    data_version 为输入的计分板数据版本 (见 data_cache.scoreboard_version)，数据未变化时可据此跳过重新分析。
+    同时计算关系图的布局和社区 (graph_layout.py)，从当前版本的坐标继续布局，使图的形状在版本之间保持稳定；
+    同时写入完整导出的 gzip 压缩 JSON 和 ETag (见 read_export)。
+    指定 timings 字典时记录 'graph_layout' 和 'export' 的秒数。
+
+    返回:
+    - 新版本的目录名。
+    """
+    nodes = results.get('network_nodes', [])
+    user_ids = [node['user_id_internal'] for node in nodes]
+    user_position = {uid: pos for pos, uid in enumerate(user_ids)}
+    n_users = len(user_ids)
+    total_pairs = n_users * (n_users - 1) // 2
+
+    pairs = results.get('similar_pairs', [])
+    methods = (params_used or {}).get("methods", [])
+    positions = np.array([[user_position[uid] for uid in pair['pair_ids']] for pair in pairs], dtype=np.int64).reshape(-1, 2)
+    indices = condensed_index(n_users, positions.min(axis=1), positions.max(axis=1))
+
+    version = f"{time.time_ns()}-{os.getpid()}"
+    version_dir = os.path.join(root, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    columns = []
+    overall_values, overall_neighbors = None, None
+    for column in PAIR_COLUMNS:
+        values = [_pair_value(pair, column) for pair in pairs]
+        if column != "overall" and all(value is None for value in values):
+            continue # 该方法未计算
+        data = np.full(total_pairs, np.nan, dtype=np.float32)
+        data[indices] = np.array([np.nan if value is None else value for value in values], dtype=np.float32)
+        data.tofile(os.path.join(version_dir, f"{column}.f32"))
+        neighbor_table = _build_neighbor_table(data, n_users, min(NEIGHBOR_K, max(n_users - 1, 0)))
+        neighbor_table.tofile(os.path.join(version_dir, f"{column}.nbr.i32"))
+        columns.append(column)
+        if column == "overall":
+            overall_values, overall_neighbors = data, neighbor_table
+
+    # 关系图的边: 综合得分阈值比较使用的是未取整的得分，因此单独记录
+    edge_flags = np.zeros(total_pairs, dtype=np.uint8)
+    pair_index_by_ids = {tuple(pair['pair_ids']): k for k, pair in enumerate(pairs)}
+    name_to_uid = {node['id']: node['user_id_internal'] for node in nodes}
+    edge_pairs = [pair_index_by_ids.get((name_to_uid.get(edge['source']), name_to_uid.get(edge['target'])))
+                  for edge in results.get('network_edges', [])]
+    edge_flags[indices[[k for k in edge_pairs if k is not None]]] = 1
+    edge_flags.tofile(os.path.join(version_dir, "edge.u8"))
+
+    started = time.perf_counter()
+    layout_rows, layout_cols, layout_weights = _layout_edges(overall_values, overall_neighbors, n_users)
+    layout = graph_layout.compute_graph_layout(n_users, layout_rows, layout_cols, layout_weights,
+                                               previous=_previous_layout(root, user_ids))
+    layout['positions'].tofile(os.path.join(version_dir, "layout.f32"))
+    layout['community'].tofile(os.path.join(version_dir, "community.i32"))
+    layout['component'].tofile(os.path.join(version_dir, "component.i32"))
+    layout_seconds = time.perf_counter() - started
+    if timings is not None:
+        timings['graph_layout'] = round(layout_seconds, 4)
+
+    meta = {
+        'version': version,
+        'params_used': params_used,
+        'data_version': data_version,
+        'methods': methods,
+        'calculation_time_unix': calculation_time_unix,
+        'calculation_time_iso': datetime.fromtimestamp(calculation_time_unix, timezone.utc).isoformat(),
+        'user_ids': user_ids,
+        'network_nodes': nodes,
+        'pair_stats': results.get('pair_stats'),
+        'candidate_pairs': len(pairs),
+        'columns': columns,
+        'neighbor_k': min(NEIGHBOR_K, max(n_users - 1, 0)),
+        'message': results.get('message'),
+        'incremental_update': results.get('incremental_update'),
+        'edge_selection': results.get('edge_selection'), # 边选择策略、候选边数和保留的边数
+        'layout': { # 关系图的布局和社区 (见 graph_layout.py)
+            'neighbors': graph_layout.LAYOUT_NEIGHBORS,
+            'min_weight': graph_layout.LAYOUT_MIN_WEIGHT,
+            'edges': len(layout_rows),
+            'communities': layout['communities'],
+            'components': layout['components'],
+            'modularity': layout['modularity'],
+            'seconds': round(layout_seconds, 4)
+        },
+        'timings': results.get('timings') # 各阶段耗时 (秒)，见 analysis_engine.run_analysis
+    }
+    with open(os.path.join(version_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    if snapshot is not None:
+        with open(os.path.join(version_dir, "snapshot.json"), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+
+    started = time.perf_counter()
+    _write_export(_open_version(version_dir, meta))
+    if timings is not None:
+        timings['export'] = round(time.perf_counter() - started, 4)
+
+    # 原子切换当前版本，再删除更早的版本。切换前的版本保留到下一次写入:
+    # 刚读取了 CURRENT 但尚未打开 meta.json / export.json.gz 的请求仍能读到完整的旧版本
+    # (已打开的 memmap 在 Linux 上删除后也仍可继续读取)
+    previous_version = current_version(root)
+    current_tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(current_tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    for entry in os.listdir(root):
+        entry_path = os.path.join(root, entry)
+        if entry not in (version, previous_version) and os.path.isdir(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+    return version
+
+def current_version(root):
+    """返回当前版本的目录名；存储不存在时返回 None。"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def read_store_meta(root):
+    """只读取当前版本的 meta.json (不打开数组)；存储不存在时返回 None。"""
+    version = current_version(root)
+    if version is None:
+        return None
+    with open(os.path.join(root, version, "meta.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def open_result_store(root):
+    """
+    以只读 memmap 打开当前版本。
+
+    返回:
+    - dict: 'version', 'path', 'meta', 'n_users', 'user_ids', 'user_position' (选手ID -> 位置), 'user_names',
+      'columns' (列名 -> memmap), 'edge', 'neighbors' (列名 -> (选手数, 邻居数) 的 memmap，旧版本的存储没有)，
+      'layout' ({'positions': (选手数, 2), 'community', 'component'}，旧版本的存储为 None)；
+      存储不存在时返回 None。
+    """
+    meta = read_store_meta(root)
+    if meta is None:
+        return None
+    return _open_version(os.path.join(root, meta['version']), meta)
+
+def _open_version(version_dir, meta):
+    n_users = len(meta['user_ids'])
+    total_pairs = n_users * (n_users - 1) // 2
+
+    def open_array(file_name, dtype, shape=(total_pairs,)):
+        if int(np.prod(shape)) == 0: # 空文件无法 mmap
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(version_dir, file_name), dtype=dtype, mode='r', shape=shape)
+
+    neighbor_k = meta.get('neighbor_k')
+    neighbors = {}
+    if neighbor_k is not None:
+        neighbors = {column: open_array(f"{column}.nbr.i32", np.int32, (n_users, neighbor_k)) for column in meta['columns']}
+
+    layout = None
+    if meta.get('layout'):
+        layout = {'positions': open_array("layout.f32", np.float32, (n_users, 2)),
+                  'community': open_array("community.i32", np.int32, (n_users,)),
+                  'component': open_array("component.i32", np.int32, (n_users,))}
+
+    return {
+        'version': meta['version'],
+        'path': version_dir,
+        'meta': meta,
+        'n_users': n_users,
+        'user_ids': meta['user_ids'],
+        'user_position': {uid: pos for pos, uid in enumerate(meta['user_ids'])},
+        'user_names': [node['id'] for node in meta['network_nodes']],
+        'columns': {column: open_array(f"{column}.f32", np.float32) for column in meta['columns']},
+        'edge': open_array("edge.u8", np.uint8),
+        'neighbors': neighbors,
+        'layout': layout
+    }
+
+def read_store_snapshot(store):
+    """读取与当前版本一起保存的输入快照；没有时返回 None。"""
+    snapshot_path = os.path.join(store['path'], "snapshot.json")
+    if not os.path.exists(snapshot_path):
+        return None
+    with open(snapshot_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def candidate_indices(store):
+    """
+    所有计算过的选手对的压缩下标，按综合得分降序 (得分相同时按选手对顺序)，
+    与 run_analysis 返回的 similar_pairs 顺序一致。
+    """
+    overall = store['columns']['overall']
+    indices = np.flatnonzero(~np.isnan(overall))
+    return indices[np.argsort(-overall[indices], kind='stable')]
+
+def column_value(column, value):
+    """存储中的一个值 -> 结果中的取值 (未计算为 None，计数列为整数，其余保留 3 位小数)。"""
+    if np.isnan(value):
+        return None
+    return int(value) if PAIR_COLUMNS[column][1] else round(float(value), 3)
+
+def pair_summary(store, condensed):
+    """
+    由压缩下标还原一对选手的摘要结果 (与 detail_level="summary" 时 run_analysis 的条目相同)；
+    该对未被计算时返回 None。
+    """
+    if np.isnan(store['columns']['overall'][condensed]):
+        return None
+    rows, cols = condensed_to_positions(store['n_users'], [condensed])
+    i, j = int(rows[0]), int(cols[0])
+    pair = {
+        'pair_names': (store['user_names'][i], store['user_names'][j]),
+        'pair_ids': (store['user_ids'][i], store['user_ids'][j])
+    }
+    for column in ("jaccard", "weighted_jaccard", "sequence"):
+        if column in store['columns']:
+            pair[PAIR_COLUMNS[column][0]] = column_value(column, store['columns'][column][condensed])
+    if "time_proximity" in store['columns']:
+        pair['time_proximity'] = {
+            'count': column_value("time_proximity", store['columns']["time_proximity"][condensed]),
+            'threshold_seconds': (store['meta']['params_used'] or {}).get("time_proximity_seconds", 300)
+        }
+    if "z_score" in store['columns']:
+        pair['significant_z_score_count'] = column_value("z_score", store['columns']["z_score"][condensed])
+    pair['overall_similarity_heuristic'] = column_value("overall", store['columns']['overall'][condensed])
+    return pair
+
+def pair_summaries(store, indices):
+    """
+    一组已计算的选手对 (压缩下标) 的摘要结果，与逐个调用 pair_summary 相同；
+    每列只按下标读取一次，导出全部选手对时比逐个读取快得多。
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    rows, cols = condensed_to_positions(store['n_users'], indices)
+    values = {}
+    for column, (_, is_count) in PAIR_COLUMNS.items():
+        if column in store['columns']:
+            column_values = store['columns'][column][indices].tolist()
+            values[column] = [None if value != value else (int(value) if is_count else round(value, 3)) for value in column_values]
+    threshold_seconds = (store['meta']['params_used'] or {}).get("time_proximity_seconds", 300)
+    user_names, user_ids = store['user_names'], store['user_ids']
+    summaries = []
+    for k, (i, j) in enumerate(zip(rows.tolist(), cols.tolist())):
+        pair = {'pair_names': (user_names[i], user_names[j]), 'pair_ids': (user_ids[i], user_ids[j])}
+        for column in ("jaccard", "weighted_jaccard", "sequence"):
+            if column in values:
+                pair[PAIR_COLUMNS[column][0]] = values[column][k]
+        if "time_proximity" in values:
+            pair['time_proximity'] = {'count': values["time_proximity"][k], 'threshold_seconds': threshold_seconds}
+        if "z_score" in values:
+            pair['significant_z_score_count'] = values["z_score"][k]
+        pair['overall_similarity_heuristic'] = values["overall"][k]
+        summaries.append(pair)
+    return summaries
+
+def lookup_pair(store, uid1, uid2):
+    """按选手ID查找一对选手的摘要结果；选手不存在或该对未被计算时返回 None。"""
+    user_position = store['user_position']
+    if uid1 not in user_position or uid2 not in user_position or uid1 == uid2:
+        return None
+    i, j = sorted((user_position[uid1], user_position[uid2]))
+    return pair_summary(store, int(condensed_index(store['n_users'], i, j)))
+
+def user_pair_indices(store, position):
+    """与第 position 位选手相关的所有选手对的压缩下标 (按另一位选手的位置排列)。"""
+    return _user_pair_indices(store['n_users'], position)
+
+def top_pairs(store, column="overall", limit=100, user_id=None):
+    """
+    某一列得分最高的 limit 对的压缩下标 (降序)。
+    指定 user_id 时只读取与该选手相关的 n-1 个元素，否则扫描整列。
+    """
+    values = store['columns'][column]
+    if user_id is not None:
+        if user_id not in store['user_position']:
+            return np.zeros(0, dtype=np.int64)
+        indices = user_pair_indices(store, store['user_position'][user_id])
+        return indices[_top_k(np.asarray(values[indices]), limit)]
+    return _top_k(np.asarray(values), limit)
+
+def top_neighbors(store, user_id, column="overall", k=20):
+    """
+    与 user_id 按某一列得分最相似的 k 位选手，返回对应选手对的压缩下标 (得分降序，并列时按另一位选手的位置)。
+    存储带有邻居索引且 k 不超过索引宽度时只读取索引中的一行 (与选手数无关)，否则退回 top_pairs 扫描该选手的 n-1 个选手对。
+    """
+    position = store['user_position'].get(user_id)
+    neighbors = store['neighbors'].get(column)
+    if position is None or neighbors is None or k > neighbors.shape[1]:
+        return top_pairs(store, column, k, user_id)
+    others = np.asarray(neighbors[position, :k], dtype=np.int64)
+    others = others[others >= 0]
+    return condensed_index(store['n_users'], np.minimum(others, position), np.maximum(others, position))
+
+def edge_from_pair(pair):
+    """由选手对的摘要结果生成关系图的边 (与 run_analysis 中 network_edges 的条目相同)。"""
+    return {
+        'source': pair['pair_names'][0],
+        'target': pair['pair_names'][1],
+        'weight': pair['overall_similarity_heuristic'],
+        'metrics_summary': {
+            'j': pair.get('jaccard', 'N/A'),
+            'wj': pair.get('weighted_jaccard', 'N/A'),
+            's': pair.get('sequence_similarity', 'N/A'),
+            'tp_c': pair.get('time_proximity', {}).get('count', 'N/A')
+        }
+    }
+
+def diff_stores(old_store, new_store):
+    """
+    比较同一比赛的两个版本，找出得分有变化的选手对和不再是关系图的边的选手对 (分块比较，内存与选手数无关)。
+    两个版本的选手 (及顺序) 或列不同时无法按压缩下标对应，返回 {'reset': True}，调用方应整体重新加载。
+
+    返回:
+    - {'reset': False, 'changed': 任一列的值有变化的压缩下标 (含新增或不再计算的选手对),
+       'edges_removed': 在旧版本中是边、新版本中不是的压缩下标}
+    """
+    if old_store is None or old_store['user_ids'] != new_store['user_ids'] or \
+            list(old_store['columns']) != list(new_store['columns']):
+        return {'reset': True}
+    total_pairs = new_store['n_users'] * (new_store['n_users'] - 1) // 2
+    changed, edges_removed = [], []
+    for start in range(0, total_pairs, DIFF_CHUNK_PAIRS):
+        stop = min(start + DIFF_CHUNK_PAIRS, total_pairs)
+        differs = np.zeros(stop - start, dtype=bool)
+        for column, new_values in new_store['columns'].items():
+            old_chunk = np.asarray(old_store['columns'][column][start:stop])
+            new_chunk = np.asarray(new_values[start:stop])
+            differs |= (old_chunk != new_chunk) & ~(np.isnan(old_chunk) & np.isnan(new_chunk))
+        old_edges = np.asarray(old_store['edge'][start:stop])
+        new_edges = np.asarray(new_store['edge'][start:stop])
+        differs |= old_edges != new_edges
+        changed.append(np.flatnonzero(differs) + start)
+        edges_removed.append(np.flatnonzero((old_edges == 1) & (new_edges == 0)) + start)
+    return {
+        'reset': False,
+        'changed': np.concatenate(changed) if changed else np.zeros(0, dtype=np.int64),
+        'edges_removed': np.concatenate(edges_removed) if edges_removed else np.zeros(0, dtype=np.int64)
+    }
+
+def export_results(store):
+    """
+    导出为与 run_analysis (detail_level="summary") 返回值相同结构的字典，供 JSON 导出或增量分析使用。
+    """
+    meta = store['meta']
+    results = {
+        'similar_pairs': pair_summaries(store, candidate_indices(store)),
+        'network_nodes': meta['network_nodes'],
+        'network_edges': [edge_from_pair(pair) for pair in pair_summaries(store, np.flatnonzero(store['edge']))]
+    }
+    if meta.get('pair_stats') is not None:
+        results['pair_stats'] = meta['pair_stats']
+    if meta.get('message'):
+        results['message'] = meta['message']
+    if meta.get('incremental_update'):
+        results['incremental_update'] = meta['incremental_update']
+    if meta.get('edge_selection'):
+        results['edge_selection'] = meta['edge_selection']
+    return results
+
+def export_document(store):
+    """/api/get_cached_analysis 返回的完整对象: 'params_used'、计算时间和 'results' (export_results)。"""
+    return {
+        'params_used': store['meta'].get('params_used'),
+        'calculation_time_unix': store['meta'].get('calculation_time_unix'),
+        'calculation_time_iso': store['meta'].get('calculation_time_iso'),
+        'results': export_results(store)
+    }
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{time.time_ns()}.tmp" # 并发生成同一版本的导出时互不覆盖临时文件
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _write_export(store):
+    """把 export_document 序列化为 JSON 并以 gzip 压缩写入版本目录，ETag 为未压缩内容的 SHA-256。返回 ETag。"""
+    body = json.dumps(export_document(store), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()
+    _write_atomic(os.path.join(store['path'], EXPORT_FILE), gzip.compress(body, compresslevel=EXPORT_GZIP_LEVEL, mtime=0))
+    _write_atomic(os.path.join(store['path'], EXPORT_ETAG_FILE), etag.encode('ascii')) # 最后写入，存在即表示导出完整
+    return etag
+
+def read_export(root):
+    """
+    当前版本完整导出的 gzip 文件路径和 ETag: (路径, ETag)；存储不存在时返回 None。
+    旧版本的存储没有预压缩的导出时先生成 (只生成一次)。
+    """
+    version = current_version(root)
+    if version is None:
+        return None
+    version_dir = os.path.join(root, version)
+    try:
+        with open(os.path.join(version_dir, EXPORT_ETAG_FILE), 'r', encoding='ascii') as f:
+            etag = f.read().strip()
+    except FileNotFoundError:
+        store = open_result_store(root)
+        if store is None:
+            return None
+        version_dir, etag = store['path'], _write_export(store)
+    return os.path.join(version_dir, EXPORT_FILE), etag
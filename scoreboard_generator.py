@@ -0,0 +1,134 @@
+# your_project_folder/scoreboard_generator.py
+# 生成 GZCTF 格式的合成计分板 (items / solvedChallenges / challenges，含 solved 计数)，
+# 用于在没有真实比赛数据时测试、压测 (benchmark.py) 和模拟服务器 (mock_gzctf_server.py)。
+# 可以植入若干“串通小组”: 组员抄袭组长的解题记录，提交时间紧随其后，用于检验分析结果能否找出它们。
+# 用法:
+#   python scoreboard_generator.py --teams 2000 --challenges 40 --clusters 10 -o scoreboard_data.json
+import argparse
+import json
+import math
+import random
+
+CATEGORIES = ["Web", "Pwn", "Reverse", "Crypto", "Misc"]
+BASE_SCORES = [100, 200, 300, 500, 1000]
+TIME_DISTRIBUTIONS = ("uniform", "exponential", "progressive")
+DEFAULT_START_MS = 1_700_000_000_000 # 默认的比赛开始时间 (固定值，同一种子生成的数据完全相同)
+
+def _solve_times(rng, n_solves, distribution, duration_ms):
+    """
+    生成一名选手的 n_solves 个解题时间偏移 (毫秒，相对比赛开始)，按时间升序。
+    - uniform: 在比赛期间均匀分布；
+    - exponential: 集中在比赛前期 (平均为时长的 1/4)，超出比赛时长的截断到结尾；
+    - progressive: 均匀分布，但由调用方按题目难度顺序分配 (先易后难)。
+    """
+    if distribution == "exponential":
+        offsets = [min(int(rng.expovariate(4.0 / duration_ms)), duration_ms) for _ in range(n_solves)]
+    else:
+        offsets = [rng.randint(0, duration_ms) for _ in range(n_solves)]
+    return sorted(offsets)
+
+def generate_scoreboard(n_teams, n_challenges, seed=0, time_distribution="uniform", duration_hours=48,
+                        clusters=0, cluster_size=4, cluster_share=0.9, cluster_jitter_seconds=120, start_ms=None):
+    """
+    生成合成计分板。
+
+    参数:
+    - n_teams / n_challenges (int): 队伍数和题目数。
+    - seed (int): 随机种子，参数相同时结果相同。
+    - time_distribution (str): 解题时间分布，TIME_DISTRIBUTIONS 中的一个。
+    - duration_hours (float): 比赛时长。
+    - clusters / cluster_size (int): 植入的串通小组数和每组人数 (队伍数不足时减少组数)。
+    - cluster_share (float): 组员抄袭组长每道题的概率。
+    - cluster_jitter_seconds (float): 组员提交时间晚于组长的平均秒数。
+    - start_ms (int or None): 比赛开始时间 (毫秒时间戳)，默认 DEFAULT_START_MS。
+
+    返回:
+    - (scoreboard, planted_clusters): GZCTF 格式的计分板字典，以及植入的小组 (每组为队伍ID列表，组长在前)。
+    """
+    if time_distribution not in TIME_DISTRIBUTIONS:
+        raise ValueError(f"未知的时间分布 '{time_distribution}'，可选: {', '.join(TIME_DISTRIBUTIONS)}")
+    rng = random.Random(seed)
+    start_ms = DEFAULT_START_MS if start_ms is None else start_ms
+    duration_ms = int(duration_hours * 3600 * 1000)
+
+    challenge_list = []
+    for challenge_id in range(1, n_challenges + 1):
+        category = CATEGORIES[challenge_id % len(CATEGORIES)]
+        challenge_list.append({'id': challenge_id, 'title': f"{category}-{challenge_id}", 'category': category,
+                               'score': rng.choice(BASE_SCORES), 'solved': 0})
+    difficulty = {challenge['id']: rng.random() for challenge in challenge_list}
+    by_difficulty = sorted(challenge_list, key=lambda challenge: difficulty[challenge['id']])
+
+    # 每个队伍: 能力越高、题目越简单，解出的概率越大
+    solves_by_team = []
+    for _ in range(n_teams):
+        skill = rng.betavariate(2, 3)
+        solved = [challenge for challenge in by_difficulty
+                  if rng.random() < 1.0 / (1.0 + math.exp(-8.0 * (skill - difficulty[challenge['id']])))]
+        if time_distribution != "progressive":
+            rng.shuffle(solved)
+        offsets = _solve_times(rng, len(solved), time_distribution, duration_ms)
+        solves_by_team.append({challenge['id']: start_ms + offset for challenge, offset in zip(solved, offsets)})
+
+    # 植入串通小组: 组员复制组长的解题 (按 cluster_share 的概率)，提交时间比组长晚几分钟
+    planted_clusters = []
+    n_clusters = min(clusters, n_teams // max(cluster_size, 2)) if cluster_size >= 2 else 0
+    members = rng.sample(range(n_teams), n_clusters * cluster_size)
+    end_ms = start_ms + duration_ms
+    for k in range(n_clusters):
+        group = members[k * cluster_size:(k + 1) * cluster_size]
+        leader_solves = solves_by_team[group[0]]
+        for member in group[1:]:
+            solves_by_team[member] = {
+                challenge_id: min(solve_time + int(rng.expovariate(1.0 / cluster_jitter_seconds) * 1000), end_ms)
+                for challenge_id, solve_time in leader_solves.items() if rng.random() < cluster_share
+            }
+        planted_clusters.append([team + 1 for team in group])
+
+    challenge_by_id = {challenge['id']: challenge for challenge in challenge_list}
+    items = []
+    for team, solves in enumerate(solves_by_team):
+        solved_challenges = []
+        for challenge_id, solve_time in sorted(solves.items(), key=lambda entry: entry[1]):
+            challenge = challenge_by_id[challenge_id]
+            challenge['solved'] += 1
+            solved_challenges.append({'id': challenge_id, 'time': solve_time, 'score': challenge['score']})
+        items.append({'id': team + 1, 'name': f"team_{team + 1}",
+                      'score': sum(solve['score'] for solve in solved_challenges),
+                      'solvedChallenges': solved_challenges})
+
+    challenges = {}
+    for challenge in challenge_list:
+        challenges.setdefault(challenge['category'], []).append(challenge)
+    return {'items': items, 'challenges': challenges}, planted_clusters
+
+def main():
+    parser = argparse.ArgumentParser(description="生成 GZCTF 格式的合成计分板")
+    parser.add_argument("--teams", type=int, default=500)
+    parser.add_argument("--challenges", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--distribution", choices=TIME_DISTRIBUTIONS, default="uniform", help="解题时间分布")
+    parser.add_argument("--duration-hours", type=float, default=48)
+    parser.add_argument("--clusters", type=int, default=0, help="植入的串通小组数")
+    parser.add_argument("--cluster-size", type=int, default=4)
+    parser.add_argument("--cluster-share", type=float, default=0.9, help="组员抄袭组长每道题的概率")
+    parser.add_argument("--cluster-jitter", type=float, default=120, help="组员提交时间晚于组长的平均秒数")
+    parser.add_argument("-o", "--output", default="scoreboard_data.json", help="输出的计分板文件")
+    parser.add_argument("--truth", help="同时把植入的小组 (队伍ID列表) 写入该 JSON 文件")
+    args = parser.parse_args()
+
+    scoreboard, planted_clusters = generate_scoreboard(
+        args.teams, args.challenges, seed=args.seed, time_distribution=args.distribution,
+        duration_hours=args.duration_hours, clusters=args.clusters, cluster_size=args.cluster_size,
+        cluster_share=args.cluster_share, cluster_jitter_seconds=args.cluster_jitter
+    )
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(scoreboard, f, ensure_ascii=False)
+    if args.truth:
+        with open(args.truth, 'w', encoding='utf-8') as f:
+            json.dump(planted_clusters, f)
+    solves = sum(len(item['solvedChallenges']) for item in scoreboard['items'])
+    print(f"已生成 {args.teams} 支队伍、{args.challenges} 道题、{solves} 条解题记录、{len(planted_clusters)} 个植入小组 -> {args.output}")
+
+if __name__ == '__main__':
+    main()
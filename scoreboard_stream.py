@@ -0,0 +1,188 @@
+# your_project_folder/scoreboard_stream.py
+# 计分板 JSON 的流式解析: 按块读取 (文件或 HTTP 响应)，顶层的 'items' 数组逐个选手、
+# 'challenges' 对象逐个分类地产出，不需要把整个文件读入内存或构造完整的字典。
+# 大型比赛的计分板有几十 MB，完整解析会同时存在原始字节、解析后的字典等多份副本；
+# 流式解析时内存占用只与预处理后的紧凑结构成正比。
+import codecs
+import json
+import os
+import time
+import analysis_engine
+
+CHUNK_BYTES = 1 << 20 # 每次读取的字节数
+_WHITESPACE = " \t\n\r"
+_VALUE_END = _WHITESPACE + ",]}:" # 合法 JSON 中一个值之后可能出现的字符
+_decoder = json.JSONDecoder()
+
+class ScoreboardFileChanged(IOError):
+    """preprocess_file 打开的数据文件与给定的 file_key 不符 (读取前已被新获取的数据替换)。"""
+
+def iter_file_chunks(f, hasher=None):
+    """按 CHUNK_BYTES 读取二进制文件；指定 hasher 时同时计算内容哈希。"""
+    for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+        if hasher is not None:
+            hasher.update(chunk)
+        yield chunk
+
+def _new_reader(chunks):
+    return {'chunks': iter(chunks), 'decoder': codecs.getincrementaldecoder('utf-8-sig')(),
+            'buf': "", 'pos': 0, 'eof': False}
+
+def _fill(reader, min_chars=1):
+    """再读入至少 min_chars 个字符 (已消费的部分会被丢弃)；已到结尾时返回 False。"""
+    if reader['eof']:
+        return False
+    parts = [reader['buf'][reader['pos']:]]
+    added = 0
+    while added < min_chars:
+        chunk = next(reader['chunks'], None)
+        text = reader['decoder'].decode(chunk if chunk is not None else b"", final=chunk is None)
+        parts.append(text)
+        added += len(text)
+        if chunk is None:
+            reader['eof'] = True
+            break
+    reader['buf'], reader['pos'] = "".join(parts), 0
+    return added > 0
+
+def _error(reader, message):
+    return json.JSONDecodeError(message, reader['buf'], reader['pos'])
+
+def _peek(reader):
+    """跳过空白，返回下一个字符 (不消费)；到结尾时返回空字符串。"""
+    while True:
+        buf, pos = reader['buf'], reader['pos']
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        reader['pos'] = pos
+        if pos < len(buf):
+            return buf[pos]
+        if not _fill(reader):
+            return ""
+
+def _expect(reader, chars):
+    char = _peek(reader)
+    if not char or char not in chars:
+        raise _error(reader, f"期望 {' 或 '.join(repr(c) for c in chars)}")
+    reader['pos'] += 1
+    return char
+
+def _decode_value(reader):
+    """解码下一个完整的 JSON 值。缓冲区不足时读入更多数据 (每次至少翻倍，避免大值被反复解析)。"""
+    _peek(reader)
+    while True:
+        buf, pos = reader['buf'], reader['pos']
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+            # 数字可能在块的边界处被截断 (如 "12" + "34")，后面紧跟结束符时才算完整
+            if end < len(buf) and buf[end] in _VALUE_END or reader['eof']:
+                reader['pos'] = end
+                return value
+        except json.JSONDecodeError:
+            if reader['eof']:
+                raise
+        _fill(reader, max(CHUNK_BYTES, len(buf) - pos))
+
+def _iter_array(reader):
+    """逐个产出数组元素 (调用时 '[' 已被消费)。"""
+    if _peek(reader) == "]":
+        reader['pos'] += 1
+        return
+    while True:
+        yield _decode_value(reader)
+        if _expect(reader, ",]") == "]":
+            return
+
+def _iter_object(reader):
+    """逐个产出对象的 (键, 值) (调用时 '{' 已被消费)。"""
+    if _peek(reader) == "}":
+        reader['pos'] += 1
+        return
+    while True:
+        if _peek(reader) != '"':
+            raise _error(reader, "对象的键应为字符串")
+        key = _decode_value(reader)
+        _expect(reader, ":")
+        yield key, _decode_value(reader)
+        if _expect(reader, ",}") == "}":
+            return
+
+def iter_scoreboard_members(chunks):
+    """
+    流式解析计分板 JSON，按出现顺序产出事件 (与 analysis_engine.preprocess_members 的输入相同):
+    - ('item', 选手条目): 顶层 'items' 数组的每个元素；
+    - ('challenge_category', (分类名, 题目列表)): 顶层 'challenges' 对象的每个成员；
+    - (键, 值): 其他顶层键 (以及格式不是数组/对象的 'items'/'challenges')，整体解码。
+    数据不是合法的 JSON 对象时抛出 json.JSONDecodeError。
+    """
+    reader = _new_reader(chunks)
+    _expect(reader, "{")
+    if _peek(reader) == "}":
+        reader['pos'] += 1
+    else:
+        while True:
+            if _peek(reader) != '"':
+                raise _error(reader, "对象的键应为字符串")
+            key = _decode_value(reader)
+            _expect(reader, ":")
+            if key == "items" and _peek(reader) == "[":
+                reader['pos'] += 1
+                for item in _iter_array(reader):
+                    yield 'item', item
+            elif key == "challenges" and _peek(reader) == "{":
+                reader['pos'] += 1
+                for member in _iter_object(reader):
+                    yield 'challenge_category', member
+            else:
+                yield key, _decode_value(reader)
+            if _expect(reader, ",}") == "}":
+                break
+    if _peek(reader):
+        raise _error(reader, "JSON 对象之后有多余的数据")
+
+def scan_scoreboard(chunks):
+    """
+    流式校验计分板数据并统计选手数 (不保留选手条目)。
+    返回: {'team_count': 选手条目数, 'fields': 顶层的标量字段 (如 'bloodBonus'、旧版本写入的 'fetch_timestamp_utc')}
+    """
+    team_count = 0
+    fields = {}
+    for key, value in iter_scoreboard_members(chunks):
+        if key == 'item':
+            team_count += 1
+        elif key == 'items' and isinstance(value, list):
+            team_count += len(value)
+        elif not isinstance(value, (dict, list, tuple)):
+            fields[key] = value
+    return {'team_count': team_count, 'fields': fields}
+
+def _timed_events(events, timings):
+    """转发事件，把产生事件 (读取文件和 JSON 解析) 的耗时累加到 timings['parse']。"""
+    iterator = iter(events)
+    while True:
+        started = time.perf_counter()
+        event = next(iterator, None)
+        timings['parse'] = timings.get('parse', 0.0) + time.perf_counter() - started
+        if event is None:
+            return
+        yield event
+
+def preprocess_file(path, min_user_score=0, file_key=None, timings=None):
+    """
+    流式读取计分板数据文件，一遍完成 analysis_engine.preprocess_data 的预处理 (返回值相同)。
+    file_key 为 (修改时间ns, 大小)；打开的文件与之不符 (已被新数据替换) 时抛出 ScoreboardFileChanged (IOError 的子类)，
+    调用方应重新读取数据描述 (见 data_fetcher.get_preprocessed_scoreboard)。
+    指定 timings 字典时记录 'parse' (读取和解析 JSON) 与 'preprocess' (其余的预处理) 的秒数。
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        if file_key is not None:
+            stat = os.fstat(f.fileno())
+            if (stat.st_mtime_ns, stat.st_size) != tuple(file_key):
+                raise ScoreboardFileChanged(f"数据文件 {path} 已被更新，请重试")
+        events = iter_scoreboard_members(iter_file_chunks(f))
+        if timings is None:
+            return analysis_engine.preprocess_members(events, min_user_score)
+        outputs = analysis_engine.preprocess_members(_timed_events(events, timings), min_user_score)
+    timings['preprocess'] = time.perf_counter() - started - timings.get('parse', 0.0)
+    return outputs
@@ -6,23 +6,43 @@ document.addEventListener('DOMContentLoaded', () => {
     const analysisCalcTimeEl = document.getElementById('analysisCalcTime');
     const defaultParamsUsedEl = document.getElementById('defaultParamsUsed');
     const refreshDataBtn = document.getElementById('refreshDataBtn');
+    const gameSelectEl = document.getElementById('gameSelect');
+    const liveUpdateToggleEl = document.getElementById('liveUpdateToggle');
+    const liveStatusEl = document.getElementById('liveStatus');
     
     const targetUsernameEl = document.getElementById('targetUsername');
     const minScoreEl = document.getElementById('minScore');
     const minSimilarityEl = document.getElementById('minSimilarity');
     const timeProximitySecondsEl = document.getElementById('timeProximitySeconds');
+    const edgePolicyEl = document.getElementById('edgePolicy');
+    const edgeTopKEl = document.getElementById('edgeTopK');
+    const sortKeyEl = document.getElementById('sortKey');
+    const minOverallEl = document.getElementById('minOverall');
     
     const viewCachedAnalysisBtn = document.getElementById('viewCachedAnalysisBtn');
     const recalculateAnalysisBtn = document.getElementById('recalculateAnalysisBtn');
     const drawGlobalNetworkBtn = document.getElementById('drawGlobalNetworkBtn');
     const drawPersonalNetworkBtn = document.getElementById('drawPersonalNetworkBtn');
+    const collapseCommunitiesEl = document.getElementById('collapseCommunities');
     
     const resultsAreaEl = document.getElementById('resultsArea');
     const cyDiv = document.getElementById('cy');
     let cy; 
 
-    let currentAnalysisFullResults = null; 
+    let currentAnalysisFullResults = null; // 按需计算时为完整结果；预计算结果只记录 { source: 'cached', ... }，数据按页从服务器查询
     let detailedPairDataStore = []; 
+    let cachedPairsNextCursor = null; // 预计算结果列表下一页的游标
+    // 当前比赛 (配置了多个比赛时由 gameSelect 选择，也可在页面地址中用 ?game=<比赛ID> 指定)，所有 /api 请求都带上它
+    let currentGame = new URLSearchParams(window.location.search).get('game') || '';
+    let liveEventSource = null; // 实时更新的 SSE 连接 (/api/live)
+    let liveKnownVersion = null; // 页面已知的预计算结果版本，重新连接后版本不同说明错过了更新
+    let cachedGraphView = null; // 由预计算结果绘制的关系图的筛选条件 { isPersonal, user, minWeight }，实时更新时就地增删边
+
+    function apiUrl(path, query = new URLSearchParams()) {
+        if (currentGame) query.set('game', currentGame);
+        const queryString = query.toString();
+        return `${API_BASE_URL}${path}${queryString ? '?' + queryString : ''}`;
+    }
 
     const coseLayoutOptions = {
         name: 'cose',
@@ -35,31 +55,42 @@ document.addEventListener('DOMContentLoaded', () => {
         animationEasing: 'ease-out'
     };
 
+    // 服务器已计算坐标 (预计算结果) 时直接使用，不在浏览器中运行 cose
+    const presetLayoutOptions = { name: 'preset', fit: true, padding: 40 };
+    const communityColors = ['#3b82f6', '#f59e0b', '#10b981', '#ef4444', '#8b5cf6', '#ec4899', '#14b8a6', '#f97316', '#6366f1', '#84cc16'];
+    function communityColor(community) { return communityColors[community % communityColors.length]; }
+
     const dateTimeFormatOptions = { // 通用日期时间格式化选项
         year: 'numeric', month: '2-digit', day: '2-digit',
         hour: '2-digit', minute: '2-digit', second: '2-digit',
         hour12: false 
     };
 
-    function initCy(elements = []) {
+    function initCy(elements = [], layoutOptions = coseLayoutOptions) {
         if (cy) { cy.destroy(); }
+        cachedGraphView = null;
         cy = cytoscape({
             container: cyDiv, elements: elements, style: [ 
                 { selector: 'node', style: { 'background-color': '#3b82f6', 'label': 'data(id)', 'color': '#ffffff', 'text-outline-color': '#3b82f6', 'text-outline-width': 2, 'font-size': '12px', 'width': 'mapData(score, 0, 2000, 25, 65)', 'height': 'mapData(score, 0, 2000, 25, 65)', 'border-width': 1.5, 'border-color': '#2563eb', 'transition-property': 'background-color, border-color', 'transition-duration': '0.2s'}},
+                { selector: 'node[color]', style: { 'background-color': 'data(color)', 'text-outline-color': 'data(color)', 'border-color': 'data(color)' }},
+                { selector: 'node[label]', style: { 'label': 'data(label)', 'width': 'mapData(size, 1, 200, 30, 120)', 'height': 'mapData(size, 1, 200, 30, 120)' }},
                 { selector: 'node:selected', style: { 'background-color': '#ef4444', 'border-color': '#dc2626', 'text-outline-color': '#ef4444', }},
                 { selector: 'edge', style: { 'width': 'mapData(weight, 0, 1, 0.8, 4)', 'line-color': '#adb5bd', 'target-arrow-color': '#adb5bd', 'target-arrow-shape': 'triangle', 'arrow-scale': 1.2, 'curve-style': 'bezier', 'opacity': 0.6, 'transition-property': 'line-color, target-arrow-color, width, opacity', 'transition-duration': '0.2s'}},
                 { selector: 'edge:selected', style: { 'line-color': '#e63946', 'target-arrow-color': '#e63946', 'width': 'mapData(weight, 0, 1, 1.5, 6)', 'opacity': 0.9 }}
-            ], layout: coseLayoutOptions });
+            ], layout: layoutOptions });
         cy.on('mouseover', 'node', function(event) { 
-            const node = event.target; const { id, score, solved_count } = node.data();
+            const node = event.target; const { id, score, solved_count, label, size, members } = node.data();
+            const nodeHtml = label ? `<b>${label}</b><br>成员: ${(members || []).join(', ')}${size > (members || []).length ? ' ...' : ''}`
+                                   : `<b>${id}</b><br>分数: ${score || 'N/A'}<br>解题: ${solved_count || 'N/A'}`;
             if (node.popperRef) { node.popperRef.destroy(); }
-            node.popperRef = node.popper({ content: () => { let div = document.createElement('div'); div.innerHTML = `<b>${id}</b><br>分数: ${score || 'N/A'}<br>解题: ${solved_count || 'N/A'}`; div.style.backgroundColor = 'white'; div.style.padding = '5px 10px'; div.style.border = '1px solid #ccc'; div.style.borderRadius = '4px'; div.style.boxShadow = '0 2px 5px rgba(0,0,0,0.1)'; div.style.fontSize = '12px'; div.style.pointerEvents = 'none'; document.body.appendChild(div); return div; }, popper: { placement: 'top', modifiers: [ { name: 'offset', options: { offset: [0, 8] } } ] }});
+            node.popperRef = node.popper({ content: () => { let div = document.createElement('div'); div.innerHTML = nodeHtml; div.style.backgroundColor = 'white'; div.style.padding = '5px 10px'; div.style.border = '1px solid #ccc'; div.style.borderRadius = '4px'; div.style.boxShadow = '0 2px 5px rgba(0,0,0,0.1)'; div.style.fontSize = '12px'; div.style.pointerEvents = 'none'; document.body.appendChild(div); return div; }, popper: { placement: 'top', modifiers: [ { name: 'offset', options: { offset: [0, 8] } } ] }});
         });
         cy.on('mouseout', 'node', function(event) { if (event.target.popperRef) { event.target.popperRef.destroy(); event.target.popperRef = null; }});
         cy.on('mouseover', 'edge', function(event) { 
             const edge = event.target; const metrics = edge.data('metrics_summary') || {}; const weight = edge.data('weight'); let tooltipContent = `相似度: ${weight !== undefined ? weight.toFixed(3) : 'N/A'}<br>`;
             if(metrics.j !== undefined) tooltipContent += `J: ${metrics.j} `; if(metrics.wj !== undefined) tooltipContent += `WJ: ${metrics.wj}<br>`;
             if(metrics.s !== undefined) tooltipContent += `Seq: ${metrics.s} `; if(metrics.tp_c !== undefined) tooltipContent += `TP: ${metrics.tp_c}`;
+            if(edge.data('edge_count') !== undefined) tooltipContent += `社区之间的边: ${edge.data('edge_count')} 条 (显示最大相似度)`;
             if (edge.popperRef) { edge.popperRef.destroy(); }
             edge.popperRef = edge.popper({ content: () => { let div = document.createElement('div'); div.innerHTML = tooltipContent; div.style.backgroundColor = 'white'; div.style.padding = '5px 10px'; div.style.border = '1px solid #ccc'; div.style.borderRadius = '4px'; div.style.boxShadow = '0 2px 5px rgba(0,0,0,0.1)'; div.style.fontSize = '12px'; div.style.pointerEvents = 'none'; document.body.appendChild(div); return div; }, popper: { placement: 'top', modifiers: [ { name: 'offset', options: { offset: [0, 8] } } ] }});
         });
@@ -83,12 +114,43 @@ document.addEventListener('DOMContentLoaded', () => {
         } catch (error) { console.error(`请求 ${url} 失败:`, error); throw error; }
     }
 
+    const JOB_POLL_INTERVAL_MS = 1000; // 后台任务状态的轮询间隔
+    const JOB_STAGE_LABELS = { queued: '排队中', fetch: '获取数据', load: '加载数据', preprocess: '预处理', analyze: '计算相似度' };
+
+    function jobProgressHtml(job, title) {
+        const progress = job.progress || {};
+        let text = `${title}: ${JOB_STAGE_LABELS[progress.stage] || progress.stage || job.status}`;
+        if (progress.total) {
+            text += ` ${progress.done}/${progress.total} 对 (${(progress.done / progress.total * 100).toFixed(1)}%)`;
+        }
+        if (job.status === 'queued' && job.queue_position !== undefined) { text += ` (前面还有 ${job.queue_position} 个任务)`; }
+        if (job.subscribers > 1) { text += ` — ${job.subscribers} 个相同的请求共享此任务`; }
+        if (job.status === 'cancelling') { text += ' — 正在取消...'; }
+        return `<p>${text}</p><button class="cancel-job-btn" data-jobid="${job.id}">取消任务</button>`;
+    }
+
+    // 等待后台任务结束: 轮询 /api/jobs/<id> 并在 resultsAreaEl 中显示进度，成功时返回任务结果，失败或取消时抛出错误
+    async function waitForJob(submitted, title) {
+        let job = { id: submitted.job_id, status: 'queued', progress: { stage: 'queued' } };
+        while (true) {
+            resultsAreaEl.innerHTML = jobProgressHtml(job, title);
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+            job = await fetchData(apiUrl(`/jobs/${submitted.job_id}`));
+            if (job.status === 'succeeded') {
+                if (job.result_expired) { throw new Error('任务结果已过期，请重新提交'); }
+                return job.result;
+            }
+            if (job.status === 'failed') { throw new Error(job.error || '后台任务失败'); }
+            if (job.status === 'cancelled') { throw new Error('任务已取消'); }
+        }
+    }
+
     async function updateStatus() {
         dataFetchTimeEl.textContent = '加载中...'; 
         analysisCalcTimeEl.textContent = '加载中...';
         defaultParamsUsedEl.textContent = '预计算参数: 加载中...';
         try {
-            const data = await fetchData(`${API_BASE_URL}/status`); 
+            const data = await fetchData(apiUrl('/status')); 
             
             let fetchTimeDisplay = "N/A";
             if (data.last_data_fetch_time_iso && data.last_data_fetch_time_iso !== "N/A") {
@@ -111,6 +173,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 let paramsText = `当前预计算使用参数: 方法=${(params.methods || []).join(',')}; `;
                 paramsText += `时间接近=${params.time_proximity_seconds}s; `;
                 paramsText += `最低图相似度=${params.min_similarity_threshold}; `;
+                paramsText += `边选择=${edgePolicyText(params)}; `;
                 paramsText += `最低用户分=${params.min_user_score}`;
                 defaultParamsUsedEl.textContent = paramsText;
             } else {
@@ -136,7 +199,8 @@ document.addEventListener('DOMContentLoaded', () => {
             initCy(); 
 
             try {
-                const data = await fetchData(`${API_BASE_URL}/fetch_data`, { method: 'POST' });
+                const submitted = await fetchData(apiUrl('/fetch_data'), { method: 'POST' });
+                const data = await waitForJob(submitted, '刷新数据并预计算');
                 resultsAreaEl.innerHTML = `<p style="color:green;">${data.message || '数据刷新请求已发送，后台将进行预计算。'}</p>`;
                 await updateStatus(); 
             } catch (error) {
@@ -188,11 +252,7 @@ document.addEventListener('DOMContentLoaded', () => {
         modal.style.display = 'block';
     }
 
-    function showPairTimelineDetails(pairIndex) {
-        if (pairIndex < 0 || pairIndex >= detailedPairDataStore.length) {
-            console.error("无效的选手对索引:", pairIndex); alert("无法加载该选手对的详细信息 (索引无效)。"); return;
-        }
-        const pairData = detailedPairDataStore[pairIndex];
+    function showPairTimelineDetails(pairData) {
         const timelineData = pairData.common_challenge_timeline_data;
         if (!timelineData) {
             console.warn("选手对数据中缺少 common_challenge_timeline_data:", pairData);
@@ -212,7 +272,8 @@ document.addEventListener('DOMContentLoaded', () => {
             let zScoreText = "";
             if (chall.z_score_details) {
                 if (chall.z_score_details.z_score !== undefined && chall.z_score_details.z_score !== "N/A") {
-                    zScoreText = ` (Z-score: ${chall.z_score_details.z_score}, 均差: ${chall.z_score_details.mean_diff_seconds_all_pairs}s, 标差: ${chall.z_score_details.std_diff_seconds_all_pairs}s)`;
+                    const percentileText = (chall.z_score_details.diff_percentile !== undefined && chall.z_score_details.diff_percentile !== "N/A") ? `, 时间差百分位: ${chall.z_score_details.diff_percentile}%` : '';
+                    zScoreText = ` (Z-score: ${chall.z_score_details.z_score}, 均差: ${chall.z_score_details.mean_diff_seconds_all_pairs}s, 标差: ${chall.z_score_details.std_diff_seconds_all_pairs}s${percentileText})`;
                 } else if (chall.z_score_details.message) { zScoreText = ` (Z-score信息: ${chall.z_score_details.message})`; }
             }
             detailsHtml += `<li><strong>${chall.title || `题目ID: ${chall.id}`}</strong><div class="timeline-entry"><span class="user-solve">${chall.user1_name}:</span> ${u1Time.toLocaleTimeString('zh-CN', {hour12:false})} (相对+${u1RelTimeS}s)</div><div class="timeline-entry"><span class="user-solve">${chall.user2_name}:</span> ${u2Time.toLocaleTimeString('zh-CN', {hour12:false})} (相对+${u2RelTimeS}s)</div><div class="timeline-diff">时间差: ${timeDiffSeconds.toFixed(1)}秒 ${zScoreText}</div></li>`;
@@ -231,6 +292,106 @@ document.addEventListener('DOMContentLoaded', () => {
         return methods;
     }
     
+    function formatScore(value) { return (value !== undefined && value !== null) ? value.toFixed(3) : 'N/A'; }
+
+    // 将完整的选手对数据转换为与 /api/pairs 返回的表格行相同的格式
+    function pairToTableRow(pair) {
+        let zScoreCount = pair.significant_z_score_count !== undefined ? pair.significant_z_score_count : null;
+        if (pair.time_distribution_analysis) { 
+            zScoreCount = pair.time_distribution_analysis.filter(r => r.z_score !== undefined && r.z_score !== "N/A" && r.z_score < -1.5).length;
+        }
+        return {
+            pair_names: pair.pair_names,
+            overall: pair.overall_similarity_heuristic,
+            jaccard: pair.jaccard,
+            weighted_jaccard: pair.weighted_jaccard,
+            sequence: pair.sequence_similarity,
+            time_proximity: pair.time_proximity ? pair.time_proximity.count : null,
+            z_score: zScoreCount
+        };
+    }
+
+    function pairNamesKey(pairNames) { return `${pairNames[0]}\u0000${pairNames[1]}`; }
+
+    function pairTableRowHtml(row, detailsAttr, highlighted = false) {
+        return `
+                    <tr${highlighted ? ' class="live-changed"' : ''}>
+                        <td>${row.pair_names[0]} & ${row.pair_names[1]}</td>
+                        <td>${formatScore(row.overall)}</td>
+                        <td>${formatScore(row.jaccard)}</td>
+                        <td>${formatScore(row.weighted_jaccard)}</td>
+                        <td>${formatScore(row.sequence)}</td>
+                        <td>${row.time_proximity !== undefined && row.time_proximity !== null ? row.time_proximity : 'N/A'}</td>
+                        <td>${row.z_score !== undefined && row.z_score !== null ? row.z_score : 'N/A'}</td>
+                        <td><button class="details-btn" ${detailsAttr}>查看</button></td>
+                    </tr>`;
+    }
+
+    const pairTableHeadHtml = `
+                    <thead>
+                        <tr>
+                            <th>选手对</th><th>综合得分</th><th>Jaccard</th>
+                            <th>加权Jaccard</th><th>序列相似度</th><th>时间接近(计数)</th>
+                            <th>显著Z-score题数</th><th>详情</th>
+                        </tr>
+                    </thead>`;
+
+    // 关系图边选择策略的简短说明 (参数见 analysis_engine.EDGE_POLICIES)
+    function edgePolicyText(params) {
+        const keepAbove = params.edge_keep_above != null ? `, ≥${params.edge_keep_above} 全保留` : '';
+        if (params.edge_policy === 'knn') return `每人前 ${params.edge_top_k} 条${keepAbove}`;
+        if (params.edge_policy === 'backbone') return `骨干 α=${params.edge_backbone_alpha}${keepAbove}`;
+        return '阈值';
+    }
+
+    function renderParamsUsed(paramsUsedForThisAnalysis) {
+        if (!paramsUsedForThisAnalysis) return;
+        let paramsText = `本次分析使用参数: 方法=${(paramsUsedForThisAnalysis.methods || []).join(',')}; `;
+        paramsText += `时间接近=${paramsUsedForThisAnalysis.time_proximity_seconds}s; `;
+        paramsText += `图相似度=${paramsUsedForThisAnalysis.min_similarity_threshold}; `;
+        paramsText += `边选择=${edgePolicyText(paramsUsedForThisAnalysis)}; `;
+        paramsText += `用户分=${paramsUsedForThisAnalysis.min_user_score}`;
+        if(paramsUsedForThisAnalysis.target_username) paramsText += `; 目标用户=${paramsUsedForThisAnalysis.target_username}`;
+        resultsAreaEl.innerHTML += `<p style="font-size:0.85em; color:#555;">${paramsText}</p>`;
+    }
+
+    // 从服务器查询预计算结果的一页 (按目标用户、最低综合得分筛选，按所选列排序)
+    async function fetchCachedPairsPage(cursor) {
+        const query = new URLSearchParams({ sort: sortKeyEl.value, limit: '100' });
+        const currentTargetUsernameForTable = targetUsernameEl.value.trim();
+        if (currentTargetUsernameForTable) query.set('user', currentTargetUsernameForTable);
+        const minOverall = parseFloat(minOverallEl.value) || 0;
+        if (minOverall > 0) query.set('min_overall', String(minOverall));
+        if (cursor) query.set('cursor', cursor);
+        return await fetchData(apiUrl('/pairs', query));
+    }
+
+    // highlightKeys: 实时更新推送的有变化的选手对 (pairNamesKey)，对应的行会被高亮
+    function renderCachedPairsPage(page, append, highlightKeys = null) {
+        cachedPairsNextCursor = page.next_cursor;
+        const rowsHtml = page.items.map(row => pairTableRowHtml(row, `data-position="${row.position}"`,
+            highlightKeys !== null && highlightKeys.has(pairNamesKey(row.pair_names)))).join('');
+
+        if (append) {
+            document.querySelector('#cachedPairsTable tbody').insertAdjacentHTML('beforeend', rowsHtml);
+        } else {
+            const calcTimeDisplay = page.calculation_time_iso ? 
+                                   new Date(page.calculation_time_iso).toLocaleString('zh-CN', dateTimeFormatOptions) : '未知或N/A';
+            resultsAreaEl.innerHTML = `<h4>预计算分析结果 (计算于: ${calcTimeDisplay})</h4>`;
+            renderParamsUsed(page.params_used);
+            if (page.total_pairs === 0) {
+                resultsAreaEl.innerHTML += '<p>无相似选手对数据可显示。</p>';
+                return;
+            }
+            resultsAreaEl.innerHTML += `
+                <p>共找到 ${page.total_pairs} 对原始相似数据，当前筛选 ${page.total_matched} 对。</p>
+                <table id="cachedPairsTable">${pairTableHeadHtml}<tbody>${rowsHtml}</tbody></table>
+                <button id="loadMorePairsBtn">加载更多</button>`;
+        }
+        const loadMoreBtn = document.getElementById('loadMorePairsBtn');
+        if (loadMoreBtn) loadMoreBtn.style.display = cachedPairsNextCursor ? '' : 'none';
+    }
+
     function renderResultsAndGraph(analysisDataContainer, sourceMessage = "分析结果") {
         if (!analysisDataContainer || !analysisDataContainer.results) {
             resultsAreaEl.innerHTML = `<p>未能获取有效的分析结果用于显示。</p>`;
@@ -245,15 +406,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         resultsAreaEl.innerHTML = `<h4>${sourceMessage} (计算于: ${calcTimeDisplay})</h4>`;
         
-        const paramsUsedForThisAnalysis = analysisDataContainer.params_used;
-        if (paramsUsedForThisAnalysis) {
-            let paramsText = `本次分析使用参数: 方法=${(paramsUsedForThisAnalysis.methods || []).join(',')}; `;
-            paramsText += `时间接近=${paramsUsedForThisAnalysis.time_proximity_seconds}s; `;
-            paramsText += `图相似度=${paramsUsedForThisAnalysis.min_similarity_threshold}; `;
-            paramsText += `用户分=${paramsUsedForThisAnalysis.min_user_score}`;
-            if(paramsUsedForThisAnalysis.target_username) paramsText += `; 目标用户=${paramsUsedForThisAnalysis.target_username}`;
-            resultsAreaEl.innerHTML += `<p style="font-size:0.85em; color:#555;">${paramsText}</p>`;
-        }
+        renderParamsUsed(analysisDataContainer.params_used);
 
         detailedPairDataStore = resultsData.similar_pairs || [];
 
@@ -268,35 +421,12 @@ document.addEventListener('DOMContentLoaded', () => {
             
             let tableHtml = `
                 <p>共找到 ${detailedPairDataStore.length} 对原始相似数据，当前筛选显示 ${pairsToShowInTable.length} 对。</p>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>选手对</th><th>综合得分</th><th>Jaccard</th>
-                            <th>加权Jaccard</th><th>序列相似度</th><th>时间接近(计数)</th>
-                            <th>显著Z-score题数</th><th>详情</th>
-                        </tr>
-                    </thead>
+                <table>${pairTableHeadHtml}
                 <tbody>`;
             
             pairsToShowInTable.slice(0, 100).forEach((pair) => {
-                const originalIndex = detailedPairDataStore.findIndex(
-                    p => p.pair_ids && pair.pair_ids && p.pair_ids[0] === pair.pair_ids[0] && p.pair_ids[1] === pair.pair_ids[1]
-                );
-                let zScoreCount = 'N/A';
-                if (pair.time_distribution_analysis) { 
-                    zScoreCount = pair.time_distribution_analysis.filter(r => r.z_score !== undefined && r.z_score !== "N/A" && r.z_score < -1.5).length;
-                }
-                tableHtml += `
-                    <tr>
-                        <td>${pair.pair_names[0]} & ${pair.pair_names[1]}</td>
-                        <td>${pair.overall_similarity_heuristic !== undefined ? pair.overall_similarity_heuristic.toFixed(3) : 'N/A'}</td>
-                        <td>${pair.jaccard !== undefined ? pair.jaccard.toFixed(3) : 'N/A'}</td>
-                        <td>${pair.weighted_jaccard !== undefined ? pair.weighted_jaccard.toFixed(3) : 'N/A'}</td>
-                        <td>${pair.sequence_similarity !== undefined ? pair.sequence_similarity.toFixed(3) : 'N/A'}</td>
-                        <td>${pair.time_proximity ? pair.time_proximity.count : 'N/A'}</td>
-                        <td>${zScoreCount}</td>
-                        <td><button class="details-btn" data-pairindex="${originalIndex}">查看</button></td>
-                    </tr>`;
+                const originalIndex = detailedPairDataStore.indexOf(pair);
+                tableHtml += pairTableRowHtml(pairToTableRow(pair), `data-pairindex="${originalIndex}"`);
             });
             tableHtml += '</tbody></table>'; 
             resultsAreaEl.innerHTML += tableHtml;
@@ -317,15 +447,15 @@ document.addEventListener('DOMContentLoaded', () => {
             const originalText = btn.textContent;
             btn.textContent = "加载缓存中..."; btn.disabled = true;
             resultsAreaEl.innerHTML = '<p>正在加载预计算的分析结果...</p>';
-            currentAnalysisFullResults = null; initCy();
+            currentAnalysisFullResults = null; detailedPairDataStore = []; initCy();
 
             try {
-                const data = await fetchData(`${API_BASE_URL}/get_cached_analysis`);
-                if (data && data.results) {
-                    currentAnalysisFullResults = data; 
-                    renderResultsAndGraph(currentAnalysisFullResults, "预计算分析结果");
-                } else if (data && data.error) {
-                    resultsAreaEl.innerHTML = `<p style="color:red;">加载缓存分析失败: ${data.error}</p>`;
+                const page = await fetchCachedPairsPage(null);
+                if (page && page.items) {
+                    currentAnalysisFullResults = { source: 'cached', params_used: page.params_used, calculation_time_iso: page.calculation_time_iso };
+                    renderCachedPairsPage(page, false);
+                } else if (page && page.error) {
+                    resultsAreaEl.innerHTML = `<p style="color:red;">加载缓存分析失败: ${page.error}</p>`;
                 } else {
                     resultsAreaEl.innerHTML = `<p style="color:orange;">未能加载缓存的分析结果，或缓存为空。</p>`;
                 }
@@ -348,6 +478,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 min_user_score: parseInt(minScoreEl.value) || 0,
                 min_similarity_threshold: parseFloat(minSimilarityEl.value) || 0.0,
                 time_proximity_seconds: parseInt(timeProximitySecondsEl.value) || 300,
+                edge_policy: edgePolicyEl.value,
+                edge_top_k: edgeTopKEl.value.trim() ? parseInt(edgeTopKEl.value) : null, // 0 或负数由服务器报错，不替换为默认值
                 methods: getSelectedMethods(),
                 target_username: targetUsernameEl.value.trim() ? targetUsernameEl.value.trim() : null
             };
@@ -358,11 +490,12 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             try {
-                const data = await fetchData(`${API_BASE_URL}/analyze`, {
+                const submitted = await fetchData(apiUrl('/analyze'), {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify(analysisParams)
                 });
+                const data = await waitForJob(submitted, '按需计算');
                 
                 if (data && data.results) { 
                     currentAnalysisFullResults = { 
@@ -370,7 +503,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         calculation_time_iso: data.calculation_time_iso, // 后端 /api/analyze 应返回这个
                         results: data.results
                     };
-                    renderResultsAndGraph(currentAnalysisFullResults, "按需计算的分析结果");
+                    renderResultsAndGraph(currentAnalysisFullResults, (data.cache && data.cache.hit) ? "按需计算的分析结果 (相同参数的缓存结果)" : "按需计算的分析结果");
                 } else if (data && data.error) { 
                     resultsAreaEl.innerHTML = `<p style="color:red;">重新计算分析失败: ${data.error}</p>`; 
                 } else { 
@@ -383,13 +516,25 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
-    function drawGraph(isPersonal) {
-        if (!currentAnalysisFullResults || !currentAnalysisFullResults.results) {
+    function graphEdgeElement(edge, weight) {
+        return { data: { id: `edge:${pairNamesKey([edge.source, edge.target])}`, source: edge.source, target: edge.target,
+                         weight: weight, metrics_summary: edge.metrics_summary, edge_count: edge.edge_count }};
+    }
+
+    function graphNodeElement(node) {
+        const element = { data: { id: node.id, score: node.score, solved_count: node.solved_count }};
+        if (node.community !== undefined) { element.data.color = communityColor(node.community); }
+        if (node.label !== undefined) { Object.assign(element.data, { label: node.label, size: node.size, members: node.members }); }
+        if (node.x !== undefined) { element.position = { x: node.x, y: node.y }; }
+        return element;
+    }
+
+    async function drawGraph(isPersonal) {
+        if (!currentAnalysisFullResults || (!currentAnalysisFullResults.results && currentAnalysisFullResults.source !== 'cached')) {
             alert("请先加载或计算分析数据，再绘制图表。");
             // resultsAreaEl.innerHTML += "<p>无数据显示，无法绘制图表。</p>"; // renderResultsAndGraph 会处理
             return;
         }
-        const resultsData = currentAnalysisFullResults.results;
         const graphElements = [];
         
         // --- 调试日志：检查 clientMinSimilarity 的值 ---
@@ -400,10 +545,22 @@ document.addEventListener('DOMContentLoaded', () => {
 
         const clientTargetUser = targetUsernameEl.value.trim();
 
+        let resultsData = currentAnalysisFullResults.results;
+        if (currentAnalysisFullResults.source === 'cached') {
+            // 预计算结果的边在服务器端按阈值 (和目标用户) 筛选后再下载
+            const query = new URLSearchParams({ min_weight: String(clientMinSimilarity) });
+            if (isPersonal && clientTargetUser) query.set('user', clientTargetUser);
+            if (collapseCommunitiesEl && collapseCommunitiesEl.checked) query.set('collapse', '1');
+            try {
+                resultsData = await fetchData(apiUrl('/graph', query));
+            } catch (error) {
+                alert(`获取关系图数据失败: ${error.message}`);
+                return;
+            }
+        }
+
         if (resultsData.network_nodes) {
-            resultsData.network_nodes.forEach(node => {
-                graphElements.push({ data: { id: node.id, score: node.score, solved_count: node.solved_count }});
-            });
+            resultsData.network_nodes.forEach(node => graphElements.push(graphNodeElement(node)));
         }
         if (resultsData.network_edges) {
             resultsData.network_edges.forEach(edge => {
@@ -415,21 +572,25 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
 
                 if (edgeWeight >= clientMinSimilarity) { 
-                    if (isPersonal) {
+                    if (isPersonal && !resultsData.collapsed) { // 折叠的图已在服务器端按目标用户筛选
                         if (clientTargetUser && (edge.source === clientTargetUser || edge.target === clientTargetUser)) {
-                            graphElements.push({ data: { source: edge.source, target: edge.target, weight: edgeWeight, metrics_summary: edge.metrics_summary }});
+                            graphElements.push(graphEdgeElement(edge, edgeWeight));
                         }
                     } else {
-                        graphElements.push({ data: { source: edge.source, target: edge.target, weight: edgeWeight, metrics_summary: edge.metrics_summary }});
+                        graphElements.push(graphEdgeElement(edge, edgeWeight));
                     }
                 }
             });
         }
         
-        initCy(graphElements); 
+        const hasPositions = graphElements.some(element => element.position !== undefined);
+        initCy(graphElements, hasPositions ? presetLayoutOptions : coseLayoutOptions); 
+        if (currentAnalysisFullResults.source === 'cached') {
+            cachedGraphView = { isPersonal: isPersonal, user: clientTargetUser, minWeight: clientMinSimilarity, collapsed: !!resultsData.collapsed };
+        }
         if (cy.elements().length > 0) { 
              console.log("调试: 准备绘制图表，元素数量:", cy.elements().length);
-             cy.layout(coseLayoutOptions).run();
+             if (!hasPositions) { cy.layout(coseLayoutOptions).run(); }
         } else {
             // resultsAreaEl 已经由 renderResultsAndGraph 更新，这里可以补充图表部分的提示
             const graphSpecificMessage = document.createElement('p');
@@ -457,11 +618,55 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
-    resultsAreaEl.addEventListener('click', function(event) {
+    resultsAreaEl.addEventListener('click', async function(event) {
+        if (event.target.classList.contains('cancel-job-btn')) {
+            event.target.disabled = true;
+            try {
+                await fetchData(apiUrl(`/jobs/${event.target.dataset.jobid}/cancel`), { method: 'POST' });
+            } catch (error) {
+                alert(`取消任务失败: ${error.message}`);
+            }
+            return;
+        }
+        if (event.target.id === 'loadMorePairsBtn') {
+            const btn = event.target;
+            btn.disabled = true;
+            try {
+                renderCachedPairsPage(await fetchCachedPairsPage(cachedPairsNextCursor), true);
+            } catch (error) {
+                alert(`加载更多结果失败: ${error.message}`);
+            }
+            btn.disabled = false;
+            return;
+        }
         if (event.target.classList.contains('details-btn')) {
+            if (event.target.dataset.position !== undefined) { // 预计算结果: 按需从服务器获取该对的详情
+                try {
+                    showPairTimelineDetails(await fetchData(apiUrl(`/pairs/${event.target.dataset.position}`)));
+                } catch (error) {
+                    alert(`无法加载此详情: ${error.message}`);
+                }
+                return;
+            }
             const pairIndex = parseInt(event.target.dataset.pairindex); 
             if (!isNaN(pairIndex) && pairIndex >= 0 && pairIndex < detailedPairDataStore.length) {
-                showPairTimelineDetails(pairIndex);
+                const pairData = detailedPairDataStore[pairIndex];
+                if (pairData.common_challenge_timeline_data) {
+                    showPairTimelineDetails(pairData);
+                    return;
+                }
+                // 摘要模式的结果不含详情，按本次分析的参数从服务器按需计算
+                const paramsUsed = currentAnalysisFullResults && currentAnalysisFullResults.params_used || {};
+                const query = new URLSearchParams({
+                    user1: String(pairData.pair_ids[0]), user2: String(pairData.pair_ids[1]),
+                    time_proximity_seconds: String(paramsUsed.time_proximity_seconds || 300),
+                    min_user_score: String(paramsUsed.min_user_score || 0)
+                });
+                try {
+                    showPairTimelineDetails(await fetchData(apiUrl('/pair_details', query)));
+                } catch (error) {
+                    alert(`无法加载此详情: ${error.message}`);
+                }
             } else {
                 console.error("详情按钮的 pairindex 无效或越界:", event.target.dataset.pairindex, "数据存储长度:", detailedPairDataStore.length);
                 alert("无法加载此详情，数据索引无效。");
@@ -469,5 +674,134 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    updateStatus();
+    // ---- 实时更新: 订阅 /api/live (Server-Sent Events)，服务器在订阅期间自动轮询计分板，结果有新版本时推送变化 ----
+    function showLiveStatus(status) {
+        if (!status.poll_enabled) {
+            liveStatusEl.textContent = '(服务器未启用轮询，只推送手动刷新的结果)';
+        } else if (!status.polling || !status.next_poll_unix) {
+            liveStatusEl.textContent = '(已连接，等待第一次检查)';
+        } else {
+            const nextPoll = new Date(status.next_poll_unix * 1000).toLocaleTimeString('zh-CN', { hour12: false });
+            liveStatusEl.textContent = `(每 ${status.interval_seconds} 秒检查，下次 ${nextPoll}` +
+                                       (status.last_error ? `；上次检查失败: ${status.last_error}` : '') + ')';
+        }
+    }
+
+    // 重新查询预计算结果列表的第一页 (新版本中选手对的位置已变化)，高亮有变化的选手对
+    async function reloadCachedPairs(highlightKeys, note) {
+        const page = await fetchCachedPairsPage(null);
+        currentAnalysisFullResults = { source: 'cached', params_used: page.params_used, calculation_time_iso: page.calculation_time_iso };
+        renderCachedPairsPage(page, false, highlightKeys);
+        resultsAreaEl.insertAdjacentHTML('afterbegin', `<p style="color:#b45309;">${note}</p>`);
+    }
+
+    // 在已绘制的关系图上就地更新边 (不重新布局，新节点放在与其相连的已有节点旁边)
+    function applyLiveGraphEdges(update) {
+        const view = cachedGraphView;
+        update.edges_removed.forEach(edge => cy.remove(cy.getElementById(`edge:${pairNamesKey([edge.source, edge.target])}`)));
+        update.edges.forEach(edge => {
+            const edgeId = `edge:${pairNamesKey([edge.source, edge.target])}`;
+            const visible = edge.weight >= view.minWeight &&
+                            (!view.isPersonal || edge.source === view.user || edge.target === view.user);
+            const existing = cy.getElementById(edgeId);
+            if (!visible) { cy.remove(existing); return; }
+            if (existing.length > 0) {
+                existing.data({ weight: edge.weight, metrics_summary: edge.metrics_summary });
+                return;
+            }
+            [[edge.source, edge.target], [edge.target, edge.source]].forEach(([name, other]) => {
+                if (cy.getElementById(name).length > 0) { return; }
+                const anchor = cy.getElementById(other);
+                const base = anchor.length > 0 ? anchor.position() : { x: 0, y: 0 };
+                cy.add({ data: { id: name }, position: { x: base.x + (Math.random() - 0.5) * 80, y: base.y + (Math.random() - 0.5) * 80 } });
+            });
+            cy.add(graphEdgeElement(edge, edge.weight));
+        });
+        cachedGraphView = view;
+    }
+
+    async function applyLiveUpdate(update) {
+        liveKnownVersion = update.version;
+        updateStatus();
+        if (!currentAnalysisFullResults || currentAnalysisFullResults.source !== 'cached') { return; } // 按需计算的结果不受影响
+        try {
+            if (update.reset) {
+                const graphView = cachedGraphView;
+                await reloadCachedPairs(null, '实时更新: 预计算结果已整体更新。');
+                if (graphView) { await drawGraph(graphView.isPersonal); }
+                return;
+            }
+            const changedKeys = new Set(update.pairs.map(pair => pairNamesKey(pair.pair_names)));
+            await reloadCachedPairs(changedKeys, `实时更新: ${update.changed_pairs} 对选手的得分有变化 (已高亮)。`);
+            if (cachedGraphView && cachedGraphView.collapsed) {
+                await drawGraph(cachedGraphView.isPersonal); // 社区之间的汇总边需要由服务器重新计算
+            } else if (cachedGraphView && cy) {
+                applyLiveGraphEdges(update);
+            }
+        } catch (error) {
+            console.error("应用实时更新失败:", error.message);
+        }
+    }
+
+    function stopLiveUpdates() {
+        if (liveEventSource) { liveEventSource.close(); liveEventSource = null; }
+        liveStatusEl.textContent = '';
+    }
+
+    function startLiveUpdates() {
+        stopLiveUpdates();
+        liveKnownVersion = null;
+        liveEventSource = new EventSource(apiUrl('/live'));
+        liveEventSource.addEventListener('status', (event) => {
+            const status = JSON.parse(event.data);
+            showLiveStatus(status);
+            // 断线重连期间可能错过了更新
+            if (liveKnownVersion !== null && status.version !== liveKnownVersion) {
+                applyLiveUpdate({ version: status.version, reset: true });
+            }
+            liveKnownVersion = status.version;
+        });
+        liveEventSource.addEventListener('poll', (event) => showLiveStatus(JSON.parse(event.data)));
+        liveEventSource.addEventListener('update', (event) => applyLiveUpdate(JSON.parse(event.data)));
+        liveEventSource.addEventListener('reset', () => applyLiveUpdate({ version: liveKnownVersion, reset: true }));
+        liveEventSource.onerror = () => { liveStatusEl.textContent = '(连接中断，正在重连...)'; };
+    }
+
+    if (liveUpdateToggleEl) {
+        liveUpdateToggleEl.addEventListener('change', () => {
+            if (liveUpdateToggleEl.checked) { startLiveUpdates(); } else { stopLiveUpdates(); }
+        });
+    }
+
+    // 配置了多个比赛时显示比赛选择框；切换比赛后清空当前结果并刷新状态
+    async function loadGames() {
+        try {
+            const data = await fetchData(`${API_BASE_URL}/games`);
+            const games = data.games || [];
+            if (!currentGame || !games.some(game => game.game.id === currentGame)) {
+                currentGame = games.length ? games[0].game.id : '';
+            }
+            gameSelectEl.innerHTML = games.map(game =>
+                `<option value="${game.game.id}" ${game.game.id === currentGame ? 'selected' : ''}>${game.game.name}</option>`).join('');
+            gameSelectEl.style.display = games.length > 1 ? '' : 'none';
+        } catch (error) {
+            console.error("获取比赛列表失败:", error.message);
+        }
+    }
+
+    if (gameSelectEl) {
+        gameSelectEl.addEventListener('change', () => {
+            currentGame = gameSelectEl.value;
+            const pageQuery = new URLSearchParams(window.location.search);
+            pageQuery.set('game', currentGame);
+            window.history.replaceState(null, '', `${window.location.pathname}?${pageQuery.toString()}`);
+            currentAnalysisFullResults = null; detailedPairDataStore = []; cachedPairsNextCursor = null;
+            resultsAreaEl.innerHTML = '<p>已切换比赛，请加载预计算结果或重新计算。</p>';
+            initCy();
+            updateStatus();
+            if (liveEventSource) { startLiveUpdates(); }
+        });
+    }
+
+    loadGames().then(updateStatus);
 });
\ No newline at end of file
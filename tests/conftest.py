@@ -0,0 +1,40 @@
+# your_project_folder/tests/conftest.py
+# 测试的公共夹具: 在进程内启动模拟的 GZCTF 计分板接口 (mock_gzctf_server.py)，并把 data_fetcher 的比赛指向它。
+import os
+import sys
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_fetcher
+import mock_gzctf_server
+
+
+@pytest.fixture
+def mock_server():
+    """启动模拟服务器 (随机端口，50 支队伍)，返回计分板接口的 URL；选项和请求计数在每个测试开始时重置。"""
+    mock_gzctf_server._options.update({'fail_rate': 0.0, 'fail_first': 0, 'use_etag': True, 'game_id': None})
+    mock_gzctf_server._counters['requests'] = 0
+    mock_gzctf_server.set_scoreboard(mock_gzctf_server.generate_scoreboard(50, 12, seed=1))
+    server = make_server("127.0.0.1", 0, mock_gzctf_server.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/api/game/1/scoreboard"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+@pytest.fixture
+def fetch_game(mock_server, tmp_path, monkeypatch):
+    """在临时目录中配置唯一的比赛 (数据文件写到 tmp_path)，请求间隔和重试等待缩短到几十毫秒。"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(data_fetcher, "FETCH_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(data_fetcher, "FETCH_BACKOFF_MAX_SECONDS", 0.05)
+    game = data_fetcher._make_game(data_fetcher.DEFAULT_GAME_ID, {'url': mock_server, 'min_interval_seconds': 0})
+    monkeypatch.setitem(data_fetcher._games_state, 'games', {game['id']: game})
+    return game
@@ -0,0 +1,255 @@
+# your_project_folder/tests/test_analysis_equivalence.py
+# 分析结果的一致性: 在小规模的合成计分板 (scoreboard_generator.py) 上，批量计算、多进程分片、增量分析和流式预处理
+# 的结果与逐对的基准函数 (calculate_jaccard_index、calculate_sequence_similarity、get_time_proximity_details 等)
+# 以及串行完整分析的结果相同；植入的串通小组能从分析结果中找出。
+import copy
+import itertools
+import json
+
+import numpy as np
+import pytest
+
+import analysis_engine
+import graph_layout
+import scoreboard_generator
+import scoreboard_stream
+
+ALL_METHODS = ["jaccard", "weighted_jaccard", "sequence", "time_proximity", "time_diff_dist"]
+
+
+def _params(**overrides):
+    params = {
+        "methods": ALL_METHODS,
+        "time_proximity_seconds": 300,
+        "min_similarity_threshold": 0.0,
+        "min_common_solves": 0, # 计算所有选手对，便于与逐对的基准函数比较
+        "sequence_metric": "difflib",
+        "detail_level": "full",
+        "target_username": None
+    }
+    params.update(overrides)
+    return params
+
+
+def _without_timings(results):
+    return {key: value for key, value in results.items() if key != 'timings'}
+
+
+@pytest.fixture(scope="module")
+def board():
+    """40 支队伍、12 道题、植入 2 个 3 人小组；解题时间集中在前期，时间接近的提交较多。"""
+    scoreboard, _ = scoreboard_generator.generate_scoreboard(
+        40, 12, seed=7, time_distribution="exponential", duration_hours=4, clusters=2, cluster_size=3
+    )
+    return scoreboard
+
+
+@pytest.fixture(scope="module")
+def preprocessed(board):
+    contestant_data, rarity_weights, all_challenges_info = analysis_engine.preprocess_data(board)[:3]
+    return contestant_data, rarity_weights, all_challenges_info, contestant_data.to_dict()
+
+
+def test_jaccard_block_matches_per_pair(preprocessed):
+    contestant_data, rarity_weights, _, records = preprocessed
+    user_ids = list(contestant_data.keys())
+    solve_matrix = analysis_engine.build_solve_matrix(contestant_data, user_ids, rarity_weights)
+    block = analysis_engine.compute_jaccard_block(solve_matrix, list(range(len(user_ids))))
+    for (i, uid1), (j, uid2) in itertools.product(enumerate(user_ids), repeat=2):
+        set1, set2 = records[uid1]['solved_set'], records[uid2]['solved_set']
+        assert block['intersection'][i, j] == len(set1 & set2)
+        assert block['jaccard'][i, j] == pytest.approx(analysis_engine.calculate_jaccard_index(set1, set2), abs=1e-12)
+        assert block['weighted_jaccard'][i, j] == pytest.approx(
+            analysis_engine.calculate_weighted_jaccard_index(set1, set2, rarity_weights), abs=1e-12)
+
+
+@pytest.mark.parametrize("row_is_first", [True, False])
+def test_batch_sequence_similarity_matches_per_pair(preprocessed, row_is_first):
+    contestant_data, _, _, records = preprocessed
+    user_ids = list(contestant_data.keys())
+    kernel_data = analysis_engine.build_sequence_kernel_data(contestant_data, user_ids)
+    cols = list(range(len(user_ids)))
+    for row, uid in enumerate(user_ids):
+        difflib_scores = analysis_engine.batch_sequence_similarity(kernel_data, row, cols, "difflib", row_is_first)
+        lcs_scores = analysis_engine.batch_sequence_similarity(kernel_data, row, cols, "lcs", row_is_first)
+        for col, other in enumerate(user_ids):
+            seq1, seq2 = records[uid]['solved_sequence'], records[other]['solved_sequence']
+            if not row_is_first:
+                seq1, seq2 = seq2, seq1
+            assert difflib_scores[col] == analysis_engine.calculate_sequence_similarity(seq1, seq2) # 与 SequenceMatcher 完全一致
+            total = len(seq1) + len(seq2)
+            expected_lcs = 2.0 * analysis_engine._lcs_length(seq1, seq2) / total if total else 1.0
+            assert lcs_scores[col] == pytest.approx(expected_lcs, abs=1e-12)
+            assert lcs_scores[col] >= difflib_scores[col] - 1e-12
+
+
+@pytest.mark.parametrize("threshold", [0, 60, 300, 3600])
+def test_find_close_submissions_matches_per_pair(preprocessed, threshold):
+    contestant_data, _, all_challenges_info, records = preprocessed
+    solve_index = analysis_engine.get_challenge_solve_index(contestant_data, all_challenges_info)
+    close_hits = analysis_engine.find_close_submissions(solve_index, threshold)
+    focus_uid = next(iter(records))
+    focus_hits = analysis_engine.find_close_submissions(solve_index, threshold, focus_user_id=focus_uid)
+
+    def by_challenge(details):
+        return sorted(details, key=lambda detail: detail['challenge_id'])
+
+    for uid1, uid2 in itertools.combinations(records, 2):
+        expected = by_challenge(analysis_engine.get_time_proximity_details(records[uid1], records[uid2], threshold))
+        pair_hits = close_hits.get(frozenset((uid1, uid2)), [])
+        assert by_challenge(analysis_engine.format_close_submissions(pair_hits, uid1)) == expected
+        if uid1 == focus_uid:
+            assert by_challenge(analysis_engine.format_close_submissions(focus_hits.get(frozenset((uid1, uid2)), []), uid1)) == expected
+
+
+def test_challenge_time_stats_match_all_pairs(preprocessed):
+    contestant_data, _, all_challenges_info, _ = preprocessed
+    solve_index = analysis_engine.get_challenge_solve_index(contestant_data, all_challenges_info)
+    stats = analysis_engine.compute_challenge_time_stats(solve_index, all_challenges_info.keys())
+    assert stats
+    for chall_id, challenge_stats in stats.items():
+        times = [solve_time for solve_time, _ in solve_index[chall_id]]
+        diffs = np.array([abs(a - b) / 1000.0 for a, b in itertools.combinations(times, 2)])
+        assert challenge_stats['pair_count'] == len(diffs)
+        assert challenge_stats['mean'] == pytest.approx(diffs.mean(), rel=1e-9)
+        assert challenge_stats['std'] == pytest.approx(diffs.std(), rel=1e-9)
+        for diff in diffs[:5]:
+            assert analysis_engine.pairwise_diff_percentile(challenge_stats, diff) == pytest.approx(100.0 * np.mean(diffs <= diff))
+
+
+def test_run_analysis_matches_per_pair_functions(preprocessed):
+    contestant_data, rarity_weights, all_challenges_info, records = preprocessed
+    params = _params()
+    results = analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, params)
+    n_users = len(records)
+    assert len(results['similar_pairs']) == n_users * (n_users - 1) // 2
+
+    solve_index = analysis_engine.get_challenge_solve_index(contestant_data, all_challenges_info)
+    challenge_stats = analysis_engine.compute_challenge_time_stats(solve_index, all_challenges_info.keys())
+    for pair in results['similar_pairs']:
+        data1, data2 = records[pair['pair_ids'][0]], records[pair['pair_ids'][1]]
+        set1, set2 = data1['solved_set'], data2['solved_set']
+        assert pair['jaccard'] == round(analysis_engine.calculate_jaccard_index(set1, set2), 3)
+        assert pair['weighted_jaccard'] == round(analysis_engine.calculate_weighted_jaccard_index(set1, set2, rarity_weights), 3)
+        assert pair['sequence_similarity'] == round(
+            analysis_engine.calculate_sequence_similarity(data1['solved_sequence'], data2['solved_sequence']), 3)
+        close = analysis_engine.get_time_proximity_details(data1, data2, params['time_proximity_seconds'])
+        assert pair['time_proximity']['count'] == len(close)
+        expected_z = {
+            chall_id: analysis_engine.analyze_submission_time_diff_distribution(data1, data2, chall_id, challenge_stats[chall_id])
+            for chall_id in set1 & set2 if chall_id in challenge_stats
+        }
+        actual_z = {item['challenge_id']: {k: v for k, v in item.items() if k != 'title'}
+                    for item in pair['time_distribution_analysis']}
+        assert actual_z == expected_z
+
+
+def test_summary_scores_match_full_details(preprocessed):
+    contestant_data, rarity_weights, all_challenges_info, _ = preprocessed
+    full = analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, _params())
+    summary = analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, _params(detail_level="summary"))
+    assert [pair['pair_ids'] for pair in summary['similar_pairs']] == [pair['pair_ids'] for pair in full['similar_pairs']]
+    for full_pair, summary_pair in zip(full['similar_pairs'], summary['similar_pairs']):
+        assert summary_pair['overall_similarity_heuristic'] == full_pair['overall_similarity_heuristic']
+        assert summary_pair['time_proximity']['count'] == full_pair['time_proximity']['count']
+        assert summary_pair['significant_z_score_count'] == sum(
+            1 for item in full_pair['time_distribution_analysis']
+            if isinstance(item['z_score'], (int, float)) and item['z_score'] < -1.5)
+    # 按需计算的详情与 detail_level="full" 的对应字段相同 (另附带时间差百分位)
+    def without_percentile(item):
+        return {k: v for k, v in item.items() if k != 'diff_percentile'} if item else item
+
+    detail_data = analysis_engine.prepare_pair_detail_data(contestant_data, all_challenges_info)
+    for full_pair in full['similar_pairs'][:20]:
+        details = analysis_engine.compute_pair_details(detail_data, *full_pair['pair_ids'])
+        assert details['time_proximity'] == full_pair['time_proximity']
+        assert [without_percentile(item) for item in details['time_distribution_analysis']] == full_pair['time_distribution_analysis']
+        assert [dict(entry, z_score_details=without_percentile(entry['z_score_details']))
+                for entry in details['common_challenge_timeline_data']] == full_pair['common_challenge_timeline_data']
+
+
+@pytest.mark.parametrize("edge_policy", ["threshold", "knn"])
+def test_parallel_matches_serial(preprocessed, monkeypatch, edge_policy):
+    contestant_data, rarity_weights, all_challenges_info, _ = preprocessed
+    params = _params(edge_policy=edge_policy, edge_top_k=3, min_common_solves=1)
+    serial = analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, params)
+    # 小数据也走多进程分片 (单核的机器上同样使用 2 个进程)
+    monkeypatch.setattr(analysis_engine, "PARALLEL_MIN_PAIRS", 1)
+    monkeypatch.setattr(analysis_engine.multiprocessing, "cpu_count", lambda: 2)
+    progress = []
+    parallel = analysis_engine.run_analysis(
+        contestant_data, rarity_weights, all_challenges_info,
+        dict(params, parallel_workers=2, parallel_shard_rows=7),
+        progress_callback=lambda done, total: progress.append((done, total))
+    )
+    assert _without_timings(parallel) == _without_timings(serial)
+    assert progress[-1][0] == progress[-1][1] == serial['pair_stats']['total_pairs']
+
+
+def _mutate(board):
+    """返回修改后的计分板副本: 一支队伍新增解题，一支队伍撤回最后一道题，一支队伍的解题时间改变。"""
+    board = copy.deepcopy(board)
+    items = board['items']
+    all_ids = [challenge['id'] for challenges in board['challenges'].values() for challenge in challenges]
+    adder = next(item for item in items if len(item['solvedChallenges']) < len(all_ids))
+    solved = {solve['id'] for solve in adder['solvedChallenges']}
+    new_id = next(chall_id for chall_id in all_ids if chall_id not in solved)
+    adder['solvedChallenges'].append({'id': new_id, 'time': max([s['time'] for s in adder['solvedChallenges']], default=0) + 60_000,
+                                      'score': 100})
+    remover = next(item for item in items if item is not adder and len(item['solvedChallenges']) > 1)
+    remover['solvedChallenges'].pop()
+    shifted = next(item for item in items if item not in (adder, remover) and item['solvedChallenges'])
+    shifted['solvedChallenges'][0]['time'] += 90_000
+    return board
+
+
+@pytest.mark.parametrize("detail_level", ["full", "summary"])
+def test_incremental_matches_full_analysis(board, preprocessed, detail_level):
+    contestant_data, rarity_weights, all_challenges_info, _ = preprocessed
+    params = _params(detail_level=detail_level, min_common_solves=1)
+    previous = analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, params)
+    snapshot = analysis_engine.build_analysis_snapshot(contestant_data, all_challenges_info, params)
+
+    new_data, new_weights, new_info = analysis_engine.preprocess_data(_mutate(board))[:3]
+    incremental = analysis_engine.run_incremental_analysis(previous, snapshot, new_data, new_weights, new_info, params)
+    full = analysis_engine.run_analysis(new_data, new_weights, new_info, params)
+    update = incremental.pop('incremental_update')
+    assert update['changed_users'] == 3
+    assert update['reused_pairs'] > update['recomputed_pairs'] > 0
+    assert _without_timings(incremental) == _without_timings(full)
+
+
+def test_streaming_preprocess_matches_preprocess_data(board, tmp_path):
+    path = tmp_path / "scoreboard_data.json"
+    path.write_text(json.dumps(board), encoding='utf-8')
+    for min_user_score in (0, 1000):
+        expected = analysis_engine.preprocess_data(board, min_user_score)
+        streamed = scoreboard_stream.preprocess_file(str(path), min_user_score)
+        assert streamed[0].to_dict() == expected[0].to_dict()
+        assert streamed[1:] == expected[1:]
+
+
+def test_planted_clusters_are_recovered():
+    scoreboard, planted_clusters = scoreboard_generator.generate_scoreboard(120, 20, seed=3, clusters=3, cluster_size=4)
+    assert scoreboard_generator.generate_scoreboard(120, 20, seed=3, clusters=3, cluster_size=4)[0] == scoreboard
+    contestant_data, rarity_weights, all_challenges_info = analysis_engine.preprocess_data(scoreboard)[:3]
+    params = _params(detail_level="summary", min_common_solves=1, edge_policy="knn", edge_top_k=3)
+    results = analysis_engine.run_analysis(contestant_data, rarity_weights, all_challenges_info, params)
+
+    # 小组内的选手对是综合得分最高的一批
+    planted_pairs = {frozenset(pair) for group in planted_clusters for pair in itertools.combinations(group, 2)}
+    top_pairs = {frozenset(pair['pair_ids']) for pair in results['similar_pairs'][:len(planted_pairs)]}
+    assert top_pairs == planted_pairs
+
+    # 稀疏化后的关系图上，每个小组落在同一个社区，不同小组在不同社区
+    node_of = {node['user_id_internal']: k for k, node in enumerate(results['network_nodes'])}
+    node_of_name = {node['id']: k for k, node in enumerate(results['network_nodes'])}
+    edges = results['network_edges']
+    community, modularity = graph_layout.louvain_communities(
+        len(node_of), [node_of_name[edge['source']] for edge in edges], [node_of_name[edge['target']] for edge in edges],
+        [edge['weight'] for edge in edges]
+    )
+    assert modularity > 0
+    group_communities = [{int(community[node_of[uid]]) for uid in group} for group in planted_clusters]
+    assert all(len(labels) == 1 for labels in group_communities)
+    assert len(set.union(*group_communities)) == len(planted_clusters)
@@ -0,0 +1,23 @@
+# your_project_folder/tests/test_analysis_params.py
+# 按需分析的参数: 分析引擎和结果缓存键使用同一份规范化后的参数。
+import app
+import data_cache
+
+
+def test_engine_params_are_normalized_once():
+    params = app._engine_params_from_frontend({
+        "target_username": "  team_3 ", "time_proximity_seconds": 300.0, "methods": ["jaccard", " sequence", "jaccard"]
+    })
+    assert params["target_username"] == "team_3"
+    assert params["time_proximity_seconds"] == 300 and isinstance(params["time_proximity_seconds"], int)
+    assert params["methods"] == ["jaccard", "sequence"]
+    assert app._engine_params_from_frontend({"target_username": "   "})["target_username"] is None
+
+
+def test_cache_key_matches_engine_params():
+    padded = app._engine_params_from_frontend({"target_username": " team_3"})
+    plain = app._engine_params_from_frontend({"target_username": "team_3"})
+    assert padded == plain # 缓存键相同的请求，交给分析引擎的参数也相同
+    assert data_cache.analysis_cache_key(padded, 0, "v1") == data_cache.analysis_cache_key(plain, 0.0, "v1")
+    other = app._engine_params_from_frontend({"target_username": "team_4"})
+    assert data_cache.analysis_cache_key(other, 0, "v1") != data_cache.analysis_cache_key(plain, 0, "v1")
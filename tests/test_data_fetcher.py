@@ -0,0 +1,191 @@
+# your_project_folder/tests/test_data_fetcher.py
+# 数据获取: 条件请求 (304)、内容未变化的 200、重试和抖动退避、错误处理，均针对模拟的 GZCTF 服务器；
+# 以及预处理期间数据文件被并发的刷新替换时的重试。
+import hashlib
+import json
+import os
+import random
+import time
+
+import pytest
+
+import analysis_engine
+import data_cache
+import data_fetcher
+import metrics
+import mock_gzctf_server
+import scoreboard_stream
+
+
+def _counter(name, **labels):
+    return sum(value for counter, counter_labels, value in metrics.snapshot()['counters']
+               if counter == name and all(counter_labels.get(key) == val for key, val in labels.items()))
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _record_downloads(monkeypatch):
+    """记录每次 _download_to_file 是否写入了临时文件。"""
+    written = []
+    download = data_fetcher._download_to_file
+
+    def spy(*args, **kwargs):
+        summary, wrote = download(*args, **kwargs)
+        written.append(wrote)
+        return summary, wrote
+    monkeypatch.setattr(data_fetcher, "_download_to_file", spy)
+    return written
+
+
+def test_first_fetch_downloads_and_records_hash(fetch_game):
+    data, fetch_time = data_fetcher.fetch_data_from_server()
+    assert data is not None, fetch_time
+    body = mock_gzctf_server._state['body']
+    assert _read(fetch_game['data_file']) == body
+    meta = data_fetcher.read_scoreboard_meta()
+    assert meta['content_sha256'] == hashlib.sha256(body).hexdigest()
+    assert meta['etag'] == f'"{mock_gzctf_server._state["etag"]}"'
+
+
+def test_not_modified_keeps_data_version(fetch_game):
+    first, _ = data_fetcher.fetch_data_from_server()
+    before = _counter('fetch', game=fetch_game['id'], result="not_modified")
+    second, _ = data_fetcher.fetch_data_from_server()
+    assert _counter('fetch', game=fetch_game['id'], result="not_modified") == before + 1
+    assert second['fetch_timestamp_utc'] == first['fetch_timestamp_utc']
+    assert second['content_sha256'] == first['content_sha256']
+    assert not os.path.exists(fetch_game['data_file'] + ".download")
+
+
+def test_unchanged_200_does_not_write_download(fetch_game, monkeypatch):
+    mock_gzctf_server._options['use_etag'] = False # 每次都返回 200 和完整内容
+    first, _ = data_fetcher.fetch_data_from_server()
+    mtime = os.stat(fetch_game['data_file']).st_mtime_ns
+    written = _record_downloads(monkeypatch)
+    before = _counter('fetch', game=fetch_game['id'], result="unchanged")
+    second, _ = data_fetcher.fetch_data_from_server()
+    assert written == [False] # 与本地文件逐块比较，内容相同时不写入临时文件
+    assert _counter('fetch', game=fetch_game['id'], result="unchanged") == before + 1
+    assert second['fetch_timestamp_utc'] == first['fetch_timestamp_utc']
+    assert os.stat(fetch_game['data_file']).st_mtime_ns == mtime
+
+
+def test_changed_200_replaces_data_file(fetch_game, monkeypatch):
+    mock_gzctf_server._options['use_etag'] = False
+    first, _ = data_fetcher.fetch_data_from_server()
+    mock_gzctf_server.mutate_scoreboard(random.Random(3), n_solves=5)
+    written = _record_downloads(monkeypatch)
+    second, _ = data_fetcher.fetch_data_from_server()
+    assert written == [True]
+    assert second['content_sha256'] != first['content_sha256']
+    assert _read(fetch_game['data_file']) == mock_gzctf_server._state['body']
+
+
+def test_retries_server_errors_with_backoff(fetch_game, monkeypatch):
+    mock_gzctf_server._options['fail_first'] = 2
+    delays = []
+    backoff = data_fetcher._backoff_delay
+
+    def spy(attempt, retry_after=None):
+        delay = backoff(attempt, retry_after)
+        delays.append((attempt, retry_after, delay))
+        return delay
+    monkeypatch.setattr(data_fetcher, "_backoff_delay", spy)
+    before = _counter('fetch_retries', game=fetch_game['id'])
+    data, fetch_time = data_fetcher.fetch_data_from_server()
+    assert data is not None, fetch_time
+    assert _counter('fetch_retries', game=fetch_game['id']) == before + 2
+    assert [attempt for attempt, _, _ in delays] == [0, 1]
+    assert all(retry_after == "1" for _, retry_after, _ in delays) # 服务器的 Retry-After 传给了退避计算
+    assert mock_gzctf_server._counters['requests'] == 3
+
+
+def test_backoff_delay_is_jittered_and_bounded(monkeypatch):
+    monkeypatch.setattr(data_fetcher, "FETCH_BACKOFF_SECONDS", 0.5)
+    monkeypatch.setattr(data_fetcher, "FETCH_BACKOFF_MAX_SECONDS", 10)
+    for attempt in range(6):
+        delays = [data_fetcher._backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay < min(10, 0.5 * 2 ** attempt) for delay in delays)
+        assert len(set(delays)) > 1 # 随机抖动，不是固定的等待时间
+    assert data_fetcher._backoff_delay(0, retry_after="3") >= 3
+    assert data_fetcher._backoff_delay(0, retry_after="60") <= 10
+    assert data_fetcher._backoff_delay(0, retry_after="Wed, 21 Oct 2015 07:28:00 GMT") < 0.5
+
+
+def test_gives_up_after_max_retries(fetch_game):
+    data_fetcher.fetch_data_from_server()
+    content = _read(fetch_game['data_file'])
+    mock_gzctf_server._options['fail_first'] = 10 ** 6
+    mock_gzctf_server._counters['requests'] = 0
+    data, error = data_fetcher.fetch_data_from_server()
+    assert data is None and "503" in error
+    assert mock_gzctf_server._counters['requests'] == data_fetcher.FETCH_MAX_RETRIES + 1
+    assert _read(fetch_game['data_file']) == content # 失败时保留原有数据
+
+
+def test_http_error_is_reported(fetch_game):
+    mock_gzctf_server._options['game_id'] = 2 # 请求的是比赛 1，返回 404 (不重试)
+    data, error = data_fetcher.fetch_data_from_server()
+    assert data is None and "404" in error
+    assert not os.path.exists(fetch_game['data_file'])
+
+
+def test_connection_error_is_reported(fetch_game, monkeypatch):
+    monkeypatch.setitem(fetch_game, 'url', "http://127.0.0.1:9/api/game/1/scoreboard") # 没有服务监听的端口
+    before = _counter('fetch_retries', game=fetch_game['id'])
+    data, error = data_fetcher.fetch_data_from_server()
+    assert data is None and error == "无法连接到服务器"
+    assert _counter('fetch_retries', game=fetch_game['id']) == before + data_fetcher.FETCH_MAX_RETRIES
+
+
+class _ChunkedResponse:
+    def __init__(self, body, chunk_size):
+        self.body, self.chunk_size = body, chunk_size
+
+    def iter_content(self, _):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+@pytest.mark.parametrize("change", ["same", "middle", "longer", "shorter"])
+def test_download_compares_with_current_file(tmp_path, change):
+    body = json.dumps(mock_gzctf_server.generate_scoreboard(20, 5, seed=2)).encode('utf-8')
+    current_body, new_body = {
+        "same": (body, body),
+        "middle": (body, body.replace(b'"team_', b'"TEAM_', 1)),
+        "longer": (body, body + b"\n"),
+        "shorter": (body + b"\n", body) # 新内容是现有文件的前缀
+    }[change]
+    current = tmp_path / "current.json"
+    current.write_bytes(current_body)
+    target = tmp_path / "download.json"
+    hasher = hashlib.sha256()
+    _, written = data_fetcher._download_to_file(_ChunkedResponse(new_body, 97), str(target), hasher, current_path=str(current))
+    assert hasher.hexdigest() == hashlib.sha256(new_body).hexdigest()
+    assert written == (new_body != current_body)
+    if written:
+        assert target.read_bytes() == new_body
+    else:
+        assert not target.exists()
+
+
+def test_preprocess_retries_once_when_data_file_is_replaced(fetch_game, monkeypatch):
+    data_fetcher.fetch_data_from_server()
+    stale, stale_version = data_fetcher.load_scoreboard()
+    mock_gzctf_server.mutate_scoreboard(random.Random(5), n_solves=5)
+    time.sleep(0.01) # 新文件的修改时间与旧文件不同
+    data_fetcher.fetch_data_from_server() # 并发的刷新替换了数据文件
+    (contestant_data, _, _, _), used = data_fetcher.get_preprocessed_scoreboard(stale)
+    current, current_version = data_fetcher.load_scoreboard()
+    assert used == current and current_version != stale_version
+    assert data_cache.scoreboard_version(used) == current_version
+    expected = analysis_engine.preprocess_data(json.loads(mock_gzctf_server._state['body']))[0]
+    assert contestant_data.to_dict() == expected.to_dict() # 使用的是新数据
+
+    # 重试只有一次: 重新读取的数据描述仍与文件不符时向上抛出
+    monkeypatch.setattr(data_fetcher, "load_scoreboard", lambda game_id=None: (stale, stale_version))
+    with pytest.raises(scoreboard_stream.ScoreboardFileChanged):
+        data_fetcher.get_preprocessed_scoreboard(stale)